@@ -0,0 +1,257 @@
+#! /usr/bin/env python3
+# Time the parsers of this repository on a corpus from evtx_corpus.py
+#
+# Each benchmark runs one script the way it is run on evidence, with its
+# output thrown away, and is measured from outside: wall clock time, the
+# largest peak resident memory of the script or any one of its pool
+# workers (not their sum, see run), and input records per second from the
+# record counts in the corpus.json of evtx_corpus.py. -r runs each
+# benchmark that many times and keeps the fastest run. Nothing is
+# downloaded, ipv4inevtx.py looks countries up in the small test database
+# of ip_geolocation.py.
+#
+# --save writes the results as a baseline, --compare reads one and adds the
+# change of each benchmark to the report; a benchmark whose records/sec
+# dropped or whose largest process memory grew by more than --threshold
+# percent is a regression and the exit status is 1. A baseline remembers
+# the -w and -r it was run with, --compare refuses a baseline of another
+# -w and warns about another -r or corpus.
+#     evtx_corpus.py corpus -n 200000
+#     benchmark.py corpus --save baseline.json
+#     benchmark.py corpus --compare baseline.json -b logins,rdp_sessions -r 3
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and the scripts of this repository, pandas for jsonl_to_csv only
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+
+import argparse
+
+from evtx_corpus import TASKS_LOG, BITS_LOG
+from evtx_checkpoint import file_mode
+from ip_geolocation import write_test_database
+from parse_evtx_RDP import Evtx_Logs
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+SECURITY_LOG = 'Security.evtx'
+
+# Name, command (script first, {output} and {geoip} filled in), corpus
+# files read and whether the script takes -w
+benchmarks = (
+    ('logins', ['parse_evtx_logins.py', SECURITY_LOG], (SECURITY_LOG,), True),
+    ('processes', ['parse_evtx_processes.py', SECURITY_LOG], (SECURITY_LOG,), True),
+    ('account_changes', ['parse_evtx_account_changes.py', SECURITY_LOG],
+     (SECURITY_LOG,), True),
+    ('security', ['parse_evtx_security.py', SECURITY_LOG, '-o', '{output}'],
+     (SECURITY_LOG,), True),
+    ('tasks', ['parse_evtx_tasks.py', TASKS_LOG], (TASKS_LOG,), True),
+    ('bits', ['parse_evtx_BITS.py', BITS_LOG], (BITS_LOG,), True),
+    ('rdp', ['parse_evtx_RDP.py', '.'], tuple(Evtx_Logs), True),
+    ('rdp_sessions', ['parse_evtx_RDP.py', '.', '-c'], tuple(Evtx_Logs), True),
+    ('ipv4inevtx', ['ipv4inevtx.py', '-f', SECURITY_LOG + '.jsonl', '-g', '{geoip}'],
+     (SECURITY_LOG + '.jsonl',), False),
+    ('ipv4inevtx_raw', ['ipv4inevtx.py', '-f', SECURITY_LOG + '.jsonl', '-g', '{geoip}', '-r'],
+     (SECURITY_LOG + '.jsonl',), False),
+    ('jsonl_tasks', ['parse_jsonl_tasks.py', TASKS_LOG + '.jsonl'],
+     (TASKS_LOG + '.jsonl',), False),
+    ('jsonl_tasks_summary', ['parse_jsonl_tasks.py', TASKS_LOG + '.jsonl', '-s'],
+     (TASKS_LOG + '.jsonl',), False),
+    ('jsonl_to_csv', ['jsonl_to_csv.py', TASKS_LOG + '.jsonl'],
+     (TASKS_LOG + '.jsonl',), False),
+    ('jsonl_to_csv_stream', ['jsonl_to_csv.py', TASKS_LOG + '.jsonl', '-s'],
+     (TASKS_LOG + '.jsonl',), False),
+    ('jsonl_counts', ['jsonl_counts.py', SECURITY_LOG + '.jsonl'],
+     (SECURITY_LOG + '.jsonl',), False),
+)
+
+benchmark_names = [benchmark[0] for benchmark in benchmarks]
+
+# Lines of a failed benchmark's error output written to stderr
+ERROR_LINES = 10
+
+# Peak memory changes smaller than this many MB are never a regression
+RSS_SLACK = 5
+
+Header = 'Benchmark,Records,Seconds,Records/sec,Largest Process RSS MB,Status'
+Compare_Header = ',Baseline Records/sec,Change %,Baseline Largest Process RSS MB,RSS Change %,Regression'
+
+def run(command, cwd):
+    """
+    Run command in cwd with its output thrown away.
+    Returns (seconds, largest process RSS in MB, exit code, end of its
+    error output).
+    """
+    with open(os.devnull, 'w') as null, tempfile.TemporaryFile() as err:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=null, stderr=err)
+        # wait4 gives the peak memory of the process, which Popen.wait
+        # does not. ru_maxrss is the largest of the process and its waited
+        # for children (pool workers) on their own, not their sum
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        errors = err.read().decode('utf-8', 'replace').splitlines()[-ERROR_LINES:]
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    rss = usage.ru_maxrss / (1048576 if sys.platform == 'darwin' else 1024)
+    return seconds, rss, process.returncode, errors
+
+def run_benchmark(benchmark, corpus, files, scratch, repeat, workers):
+    """
+    Run benchmark repeat times, returns its result dict, the fastest run.
+    """
+    name, command, inputs, takes_workers = benchmark
+    missing = [path for path in inputs if path not in files]
+    if missing:
+        return {'status': 'missing ' + ';'.join(missing)}
+    records = sum(files[path]['records'] for path in inputs)
+    output = os.path.join(scratch, name)
+    command = [part.format(output=output, geoip=os.path.join(scratch, 'test.mmdb'))
+               for part in command]
+    command = [sys.executable, os.path.join(script_dir, command[0])] + command[1:]
+    if takes_workers and workers > 1:
+        command += ['-w', str(workers)]
+    best = None
+    for i in range(repeat):
+        shutil.rmtree(output, ignore_errors=True)
+        os.makedirs(output)
+        seconds, rss, code, errors = run(command, corpus)
+        if code != 0:
+            sys.stderr.write('%s failed with exit code %d:\n%s\n'
+                             % (name, code, '\n'.join(errors)))
+            return {'records': records, 'status': 'exit %d' % code}
+        if best is None or seconds < best['seconds']:
+            best = {'records': records, 'seconds': round(seconds, 3),
+                    'records_per_sec': round(records / seconds, 1),
+                    'peak_rss_mb': round(rss, 1), 'status': 'ok'}
+    shutil.rmtree(output, ignore_errors=True)
+    return best
+
+def change(value, baseline):
+    return (value - baseline) * 100.0 / baseline if baseline else 0.0
+
+def compare(result, baseline, threshold, same_corpus=True):
+    """
+    The report columns of result against its baseline result, and whether
+    it is a regression. Peak memory grows with the corpus, it only counts
+    when the baseline was made on the same corpus.
+    """
+    if not baseline or baseline.get('status') != 'ok' or result.get('status') != 'ok':
+        return ',,,,,', False
+    speed = change(result['records_per_sec'], baseline['records_per_sec'])
+    rss = change(result['peak_rss_mb'], baseline['peak_rss_mb'])
+    regression = speed < -threshold or (same_corpus and rss > threshold and
+        result['peak_rss_mb'] - baseline['peak_rss_mb'] > RSS_SLACK)
+    return (',%.1f,%+.1f,%.1f,%+.1f,%s' % (baseline['records_per_sec'], speed,
+            baseline['peak_rss_mb'], rss, 'yes' if regression else '')), regression
+
+def save_baseline(path, corpus_info, workers, repeat, results):
+    baseline = {'python': platform.python_version(),
+                'machine': platform.machine(), 'cpus': os.cpu_count(),
+                'corpus': corpus_info, 'workers': workers, 'repeat': repeat,
+                'results': results}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    os.chmod(temp, file_mode(path))
+    os.replace(temp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Time the parsers on a corpus from evtx_corpus.py, records/sec, "
+        "wall clock time and largest process memory of each, against a saved baseline",
+        usage='benchmark.py corpus -b logins,rdp_sessions -r 3 --save baseline.json --compare baseline.json')
+    parser.add_argument("corpus", type=str,
+        help="directory written by evtx_corpus.py")
+    parser.add_argument('-b', '--benchmarks', type=str, default=','.join(benchmark_names),
+        help="benchmarks to run ( -b %s)" % ','.join(benchmark_names))
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+        help="runs of each benchmark, the fastest is kept (default %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="-w handed to the parse_evtx scripts (default %(default)s)")
+    parser.add_argument('--save', type=str,
+        help="write the results to this baseline file")
+    parser.add_argument('--compare', type=str,
+        help="compare the results with this baseline file")
+    parser.add_argument('--threshold', type=float, default=10.0,
+        help="percent slower or larger a regression is (default %(default)s)")
+    args = parser.parse_args()
+
+    selected = args.benchmarks.split(',')
+    for name in selected:
+        if name not in benchmark_names:
+            parser.error("unknown benchmark %s, choose from %s" % (name, ','.join(benchmark_names)))
+    if args.repeat < 1:
+        parser.error("-r must be at least 1")
+    try:
+        with open(os.path.join(args.corpus, 'corpus.json')) as f:
+            corpus_info = json.load(f)
+    except (OSError, ValueError) as e:
+        parser.error("%s is not a corpus of evtx_corpus.py: %s" % (args.corpus, e))
+    baseline = None
+    same_corpus = True
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error("cannot read baseline %s: %s" % (args.compare, e))
+        if 'workers' not in baseline:
+            sys.stderr.write('%s does not say which -w and -r it was made with\n'
+                             % args.compare)
+        elif baseline['workers'] != args.workers:
+            # Neither records/sec nor memory compare across pool sizes
+            parser.error("%s was made with -w %d, not -w %d, run with the same -w to compare"
+                         % (args.compare, baseline['workers'], args.workers))
+        elif baseline['repeat'] != args.repeat:
+            sys.stderr.write('%s kept the fastest of %d runs, this run of %d\n'
+                             % (args.compare, baseline['repeat'], args.repeat))
+        same_corpus = baseline.get('corpus', {}).get('files') == corpus_info['files']
+        if not same_corpus:
+            sys.stderr.write('%s was made on another corpus, compare records/sec only\n'
+                             % args.compare)
+
+    print(Header + (Compare_Header if baseline else ''))
+    results = {}
+    regressions = 0
+    scratch = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        write_test_database(os.path.join(scratch, 'test.mmdb'))
+        for benchmark in benchmarks:
+            name = benchmark[0]
+            if name not in selected:
+                continue
+            result = run_benchmark(benchmark, args.corpus, corpus_info['files'],
+                                   scratch, args.repeat, args.workers)
+            results[name] = result
+            line = '%s,%s,%s,%s,%s,%s' % (name, result.get('records', ''),
+                result.get('seconds', ''), result.get('records_per_sec', ''),
+                result.get('peak_rss_mb', ''), result['status'])
+            if baseline:
+                columns, regression = compare(result, baseline['results'].get(name),
+                                              args.threshold, same_corpus)
+                line += columns
+                regressions += regression
+            print(line)
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.save:
+        save_baseline(args.save, corpus_info, args.workers, args.repeat, results)
+    if regressions:
+        sys.stderr.write('%d benchmarks regressed more than %.0f%%\n'
+                         % (regressions, args.threshold))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
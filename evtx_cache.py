@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+# On-disk cache of decoded records for the parse_evtx_*.py scripts
+#
+# Records decoded by evtx_decoder.record_event are stored in an SQLite
+# file, one compressed row per 64 KB chunk, keyed by the SHA-256 of the
+# EVTX file and the chunk number. Re-running a script (for example with
+# different -i/-x/-m filters) reads the chunks back instead of decoding
+# the file again. Each chunk row remembers which EventIDs were decoded
+# for it, a script that needs other IDs decodes that chunk once more and
+# the row is widened to cover both.
+#
+# A file is re-hashed when its size, modification time or fingerprint (a
+# hash of the file and chunk headers, which hold the checksums of the
+# records, see evtx_decoder.evtx_fingerprint) changes, rows of the old
+# contents are then dropped. The fingerprint is checked once per run, so
+# a file replaced by another of the same size and modification time is
+# not read from the rows of the old one. Chunks least recently used are
+# evicted once the rows add up to more than the size limit.
+#
+# Run directly to show or clear the cache:
+#     evtx_cache.py evtx_cache.db
+#     evtx_cache.py evtx_cache.db --clear
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+
+import argparse
+
+from evtx_decoder import evtx_chunk_record_view, evtx_fingerprint, \
+    record_event, record_event_id
+
+# Default size limit of the cached chunk rows in MB
+CACHE_SIZE = 1024
+
+schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    sha256 TEXT,
+    chunk INTEGER,
+    event_ids TEXT,
+    data BLOB,
+    size INTEGER,
+    last_used REAL,
+    PRIMARY KEY (sha256, chunk)
+);
+CREATE INDEX IF NOT EXISTS chunks_last_used ON chunks (last_used);
+'''
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+class EvtxCache(object):
+    """
+    Decoded records of EVTX chunks stored in the SQLite file at path,
+    limited to about cache_size MB.
+    Can be sent to worker processes, each one opens its own connection.
+    """
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self.path = path
+        self.max_bytes = cache_size * 1024 * 1024
+        self.file_keys = {}
+        self._db = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None
+        return state
+
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=60)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(schema)
+            columns = [row[1] for row in
+                       self._db.execute('PRAGMA table_info(files)')]
+            if 'fingerprint' not in columns:
+                # A cache file from before fingerprints, its files are
+                # hashed again
+                self._db.execute('ALTER TABLE files ADD COLUMN fingerprint TEXT')
+        return self._db
+
+    def file_key(self, evtx_file):
+        """
+        Returns the SHA-256 of evtx_file, only hashing it again when its
+        size, modification time or fingerprint changed since it was last
+        seen. Within one EvtxCache (one run) the key is reused while the
+        size and modification time stay the same.
+        """
+        path = os.path.abspath(evtx_file)
+        st = os.stat(path)
+        known = self.file_keys.get(path)
+        if known and known[:2] == (st.st_size, st.st_mtime_ns):
+            return known[2]
+
+        db = self.db()
+        row = db.execute('SELECT size, mtime_ns, sha256, fingerprint FROM files WHERE path = ?',
+                         (path,)).fetchone()
+        fingerprint = evtx_fingerprint(path)
+        if row and (row[0], row[1], row[3]) == (st.st_size, st.st_mtime_ns,
+                                                fingerprint):
+            sha256 = row[2]
+        else:
+            sha256 = file_sha256(path)
+            with db:
+                db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                           (path, st.st_size, st.st_mtime_ns, sha256, fingerprint))
+                # The file changed, drop what was cached for its old contents
+                if row and row[2] != sha256:
+                    others = db.execute('SELECT 1 FROM files WHERE sha256 = ?',
+                                        (row[2],)).fetchone()
+                    if others is None:
+                        db.execute('DELETE FROM chunks WHERE sha256 = ?', (row[2],))
+        self.file_keys[path] = (st.st_size, st.st_mtime_ns, sha256)
+        return sha256
+
+    def chunk_events(self, evtx_file, chunk, event_ids=None):
+        """
+        Returns the records of one chunk as decode_record dicts, skipping
+        records outside event_ids like evtx_chunk_xml_view does.
+        Only decodes the chunk when the cache has no row covering event_ids.
+        """
+        sha256 = self.file_key(evtx_file)
+        db = self.db()
+        row = db.execute('SELECT event_ids, data FROM chunks WHERE sha256 = ? AND chunk = ?',
+                         (sha256, chunk)).fetchone()
+        covered = set()
+        records = None
+        if row:
+            covered = None if row[0] is None else set(json.loads(row[0]))
+            if covered is None or (event_ids is not None and
+                                   covered.issuperset(event_ids)):
+                with db:
+                    db.execute('UPDATE chunks SET last_used = ? WHERE sha256 = ? AND chunk = ?',
+                               (time.time(), sha256, chunk))
+                records = json.loads(zlib.decompress(row[1]))
+
+        if records is None:
+            # Decode enough for this script and the ones already cached
+            wanted = None if event_ids is None else covered | set(event_ids)
+            records = []
+            for record in evtx_chunk_record_view(evtx_file, chunk, chunk + 1,
+                                                 wanted):
+                records.append((record_event_id(record), record_event(record)))
+            self.put(sha256, chunk, wanted, records)
+        return [event for event_id, event in records
+                if event_ids is None or event_id is None or
+                event_id in event_ids]
+
+    def put(self, sha256, chunk, event_ids, records):
+        data = zlib.compress(json.dumps(records).encode(), 1)
+        if event_ids is not None:
+            event_ids = json.dumps(sorted(event_ids))
+        db = self.db()
+        with db:
+            db.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)',
+                       (sha256, chunk, event_ids, data, len(data), time.time()))
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used chunks until the cache fits in its
+        size limit.
+        """
+        db = self.db()
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM chunks').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for sha256, chunk, size in db.execute(
+                'SELECT sha256, chunk, size FROM chunks ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((sha256, chunk))
+            total -= size
+        db.executemany('DELETE FROM chunks WHERE sha256 = ? AND chunk = ?', doomed)
+
+    def clear(self):
+        db = self.db()
+        with db:
+            db.execute('DELETE FROM chunks')
+            db.execute('DELETE FROM files')
+        db.execute('VACUUM')
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Show or clear the decoded record cache of the parse_evtx scripts",
+        usage='evtx_cache.py evtx_cache.db --clear')
+    parser.add_argument("cache", type=str,
+        help='Path to the cache file given to the scripts with --cache')
+    parser.add_argument("--clear", default=False, action="store_true",
+        help="Delete every cached chunk")
+
+    args = parser.parse_args()
+
+    cache = EvtxCache(args.cache)
+    if args.clear:
+        cache.clear()
+    db = cache.db()
+    print('Path,Size,SHA256,Chunks,Bytes')
+    for path, size, sha256 in db.execute('SELECT path, size, sha256 FROM files ORDER BY path'):
+        chunks, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chunks '
+                                   'WHERE sha256 = ?', (sha256,)).fetchone()
+        print('%s,%d,%s,%d,%d' % (path, size, sha256, chunks, total))
+
+if __name__ == "__main__":
+    main()
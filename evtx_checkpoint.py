@@ -0,0 +1,172 @@
+#! /usr/bin/env python3
+# Record-ID checkpoints for the parse_evtx_*.py scripts
+#
+# With --checkpoint FILE a script remembers, for each (Computer, Channel)
+# it parsed, the EventRecordID up to which every record has been parsed
+# and the chunk holding it. The file is rewritten once the rows of each
+# range of chunks are written out (the output's buffered rows are flushed
+# first, see map_chunks), so an interrupted run leaves it pointing at what
+# was written (rows of a range cut off half written are written again on
+# resume).
+#
+# With --since-checkpoint as well, chunks whose records are all at or
+# below the checkpoint are skipped without being decoded (the record
+# numbers are read from the chunk headers) and only newer records are
+# written. If the log now ends below the checkpoint it was cleared, and
+# the whole file is parsed again.
+#
+# Use one checkpoint file per script, they do not write the same records.
+#
+# Run directly to list a checkpoint file:
+#     evtx_checkpoint.py logins.json
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
+
+import os
+import json
+import mmap
+import stat
+import tempfile
+import contextlib
+
+import argparse
+
+from Evtx.Evtx import FileHeader, ChunkHeader
+from Evtx.Views import evtx_record_xml_view
+
+from evtx_decoder import decode_record, evtx_chunk_records
+
+def file_mode(path):
+    """
+    The permissions for a file saved over path through mkstemp (which
+    makes it readable by the owner only): those of the file there, else
+    what open() would create it with.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def evtx_file_key(evtx_file, chunk):
+    """
+    Returns the (Computer, Channel) of the last record in chunk.
+    """
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            last = None
+            for record in ChunkHeader(buf, fh.header_chunk_size() + chunk * 0x10000).records():
+                last = record
+            if last is None:
+                return ('', '')
+            event = decode_record(evtx_record_xml_view(last))
+            return (event['Computer'] or '', event['Channel'] or '')
+
+class Checkpoint(object):
+    """
+    The checkpoints kept in the JSON file at path, since makes start()
+    leave out what the checkpoint says was already parsed.
+    """
+    def __init__(self, path, since=False):
+        self.path = path
+        self.since = since
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f):
+                    self.entries[(entry['computer'], entry['channel'])] = entry
+
+    def start(self, evtx_file):
+        """
+        Returns the FileProgress of a run over evtx_file.
+        """
+        ranges = evtx_chunk_records(evtx_file)
+        if not ranges:
+            return FileProgress(self, None, ranges, [], 0)
+        newest = max(range(len(ranges)), key=lambda i: ranges[i][1])
+        key = evtx_file_key(evtx_file, newest)
+
+        after = 0
+        entry = self.entries.get(key)
+        if self.since and entry and entry['record_id'] <= ranges[newest][1]:
+            after = entry['record_id']
+        # Chunks are kept in file order, old logs wrap around
+        chunks = [i for i, (first, last) in enumerate(ranges) if last > after]
+        return FileProgress(self, key, ranges, chunks, after)
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sorted(self.entries.values(),
+                             key=lambda e: (e['computer'], e['channel'])),
+                      f, indent=1)
+        os.chmod(temp, file_mode(self.path))
+        os.replace(temp, self.path)
+
+class FileProgress(object):
+    """
+    The chunks of one file still to parse, records numbered below
+    first_record are already in the checkpoint.
+    """
+    def __init__(self, checkpoint, key, ranges, chunks, after):
+        self.checkpoint = checkpoint
+        self.key = key
+        self.ranges = ranges
+        self.chunks = chunks
+        self.after = after
+        self.first_record = after + 1 if after else None
+        self.pending = set(chunks)
+
+    def skip(self, chunk):
+        """
+        Take chunk as parsed without handing it to the script, it holds
+        no records the script wants.
+        """
+        self.pending.discard(chunk)
+
+    def done(self, first_chunk, last_chunk):
+        """
+        Mark chunks first_chunk up to (not including) last_chunk parsed
+        and save the checkpoint.
+        """
+        self.pending.difference_update(range(first_chunk, last_chunk))
+        if self.pending:
+            # Everything below the oldest chunk still to parse is done
+            record_id = min(self.ranges[i][0] for i in self.pending) - 1
+        else:
+            record_id = max(self.ranges[i][1] for i in self.chunks)
+        record_id = max(record_id, self.after)
+        chunk = None
+        for i, (first, last) in enumerate(self.ranges):
+            if first <= record_id <= last:
+                chunk = i
+                break
+        computer, channel = self.key
+        self.checkpoint.entries[self.key] = {'computer': computer,
+            'channel': channel,
+            'record_id': record_id,
+            'chunk': chunk
+        }
+        self.checkpoint.save()
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "List the checkpoints kept by the parse_evtx scripts",
+        usage='evtx_checkpoint.py logins.json')
+    parser.add_argument("checkpoint", type=str,
+        help='Path to the file given to the scripts with --checkpoint')
+
+    args = parser.parse_args()
+
+    print('Computer,Channel,EventRecordID,Chunk')
+    for entry in Checkpoint(args.checkpoint).entries.values():
+        print('%s,%s,%s,%s' % (entry['computer'], entry['channel'],
+                               entry['record_id'], entry['chunk']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+#! /usr/bin/env python3
+# Write a made up corpus of Windows event logs for benchmark.py
+#
+# Security, TaskScheduler, BITS and the four RDP logs are written as .evtx
+# files and as evtx_dump style .evtx.jsonl files holding the same records,
+# so every parser in this repository has input of a known size without
+# real evidence. The EventIDs and field names come from the scripts that
+# parse them (evtxs of parse_evtx_logins/processes/account_changes.py,
+# evtx_ids of parse_evtx_tasks.py, bits_ids of parse_evtx_BITS.py, the
+# RDP_IDs of parse_evtx_RDP.py), mixed with EventIDs none of them keep the way
+# real logs are. The RDP logs hold whole sessions (connection, logon,
+# disconnects and reconnects, logoff) so parse_evtx_RDP.py -c joins them.
+#
+# -n is the number of Security records, the TaskScheduler and BITS logs get
+# a tenth of that and the RDP logs one session for each 50. The same -n and
+# --seed write the same corpus. corpus.json lists the records and bytes of
+# each file written.
+#     evtx_corpus.py corpus -n 1000000
+#     evtx_corpus.py corpus -n 100000 -l security,rdp --no-jsonl
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# for the parse_evtx scripts the EventIDs are taken from
+
+import os
+import json
+import uuid
+import random
+from datetime import datetime, timedelta
+
+import argparse
+
+from evtx_writer import EvtxWriter, T_WSTR, T_U8, T_U16, T_U32, T_U64, \
+    T_GUID, T_FILETIME, T_SID, T_HEX64
+import parse_evtx_logins
+import parse_evtx_processes
+import parse_evtx_account_changes
+import parse_evtx_tasks
+import parse_evtx_BITS
+from parse_evtx_RDP import Evtx_Logs
+
+# First record time of every log
+START = datetime(2023, 1, 12, 8, 0, 0)
+
+SECURITY_PROVIDER = ('Microsoft-Windows-Security-Auditing',
+                     '{54849625-5478-4994-a5ba-3e3b0328c30d}')
+TASKS_PROVIDER = ('Microsoft-Windows-TaskScheduler',
+                  '{de7b24ea-73c8-4a09-985d-5bdadcfa9017}')
+BITS_PROVIDER = ('Microsoft-Windows-Bits-Client',
+                 '{ef1cc15b-46c1-414e-bb95-e76b077bd51e}')
+EVENTLOG_NS = 'http://manifests.microsoft.com/win/2004/08/windows/eventlog'
+RDP_NS = 'Event_NS'
+
+# Provider and channel of each RDP log, in Evtx_Logs order
+RDP_LOGS = dict(zip(Evtx_Logs, [
+    ('Microsoft-Windows-TerminalServices-LocalSessionManager',
+     'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational'),
+    ('Microsoft-Windows-TerminalServices-RemoteConnectionManager',
+     'Microsoft-Windows-TerminalServices-RemoteConnectionManager/Operational'),
+    ('Microsoft-Windows-RemoteDesktopServices-RdpCoreTS',
+     'Microsoft-Windows-RemoteDesktopServices-RdpCoreTS/Operational'),
+    ('Microsoft-Windows-TerminalServices-ClientActiveXCore',
+     'Microsoft-Windows-TerminalServices-RDPClient/Operational')]))
+LSM_LOG, RCM_LOG, CORE_LOG, CLIENT_LOG = Evtx_Logs
+RDP_GUID = '{5d896912-022d-40aa-a3a8-4fa5515c76d7}'
+
+TASKS_LOG = 'Microsoft-Windows-TaskScheduler%4Operational.evtx'
+BITS_LOG = 'Microsoft-Windows-Bits-Client%4Operational.evtx'
+
+corpus_logs = ('security', 'tasks', 'bits', 'rdp')
+
+COMPUTERS = ('WS01.corp.local', 'WS02.corp.local', 'DC01.corp.local',
+             'FS01.corp.local')
+USERS = ('admin', 'jdoe', 'asmith', 'svc_backup', 'Administrator', 'SYSTEM',
+         'ANONYMOUS LOGON', 'WS01$')
+DOMAINS = ('CORP', 'NT AUTHORITY', 'WS01')
+SIDS = ('S-1-5-18', 'S-1-5-19', 'S-1-0-0',
+        'S-1-5-21-1004336348-1177238915-682003330-500',
+        'S-1-5-21-1004336348-1177238915-682003330-1104')
+# Internal addresses mostly, some public ones for ipv4inevtx to find
+ADDRESSES = ('10.0.0.5', '10.0.0.17', '10.0.4.20', '192.168.23.14',
+             '172.16.4.20', '127.0.0.1', '::1', '-', '8.8.8.8',
+             '203.0.113.9', '198.51.100.23', '45.33.32.156')
+PROCESSES = ('C:\\Windows\\System32\\svchost.exe',
+             'C:\\Windows\\System32\\lsass.exe',
+             'C:\\Windows\\System32\\cmd.exe',
+             'C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe',
+             'C:\\Windows\\explorer.exe', 'C:\\Windows\\System32\\rundll32.exe',
+             'C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe')
+COMMANDS = ('C:\\Windows\\system32\\svchost.exe -k netsvcs -p',
+            'cmd.exe /c whoami /all', 'powershell.exe -nop -enc SQBFAFgA',
+            'rundll32.exe C:\\Users\\Public\\a.dll,Start',
+            '"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe" --type=renderer',
+            'net user backup P@ss /add')
+TASKS = ('\\Microsoft\\Windows\\Defrag\\ScheduledDefrag',
+         '\\Microsoft\\Windows\\UpdateOrchestrator\\Schedule Scan',
+         '\\GoogleUpdateTaskMachineUA', '\\Updater', '\\OneDrive Standalone Update Task')
+URLS = ('http://download.windowsupdate.com/c/msdownload/update/x.cab',
+        'https://dl.google.com/update2/installers/ChromeSetup.exe',
+        'http://198.51.100.23/a.ps1', 'https://cdn.example.com/files/tool,v2.zip')
+# Text real logs hold now and then, commas, quotes, markup and non ASCII
+ODD_TEXT = ('a,b,c', 'say "hi" & <bye>', 'caf\u00e9 \u4e2d\u6587',
+            'two\r\nlines', '  spaced   out  ', '')
+
+# Share of the Security records of each EventID, any EventID of the
+# parse_evtx scripts not listed here gets 1, the ones they do not keep
+# (4703, 4799, 5058, 5379) are there as real logs have plenty of them
+security_weights = {5156: 120, 5158: 40, 4658: 60, 4656: 30, 4663: 40,
+                    4624: 60, 4634: 50, 4672: 40, 4625: 8, 4648: 6,
+                    4688: 30, 4689: 30, 4776: 10, 4768: 8, 4769: 20,
+                    4703: 25, 4799: 20, 5058: 15, 5379: 20}
+
+SUBJECT = ('SubjectUserSid', 'SubjectUserName', 'SubjectDomainName',
+           'SubjectLogonId')
+TARGET = ('TargetUserSid', 'TargetUserName', 'TargetDomainName',
+          'TargetLogonId')
+
+# EventData fields of each Security EventID, others get default_fields
+security_fields = {
+    4624: SUBJECT + TARGET + ('LogonType', 'LogonProcessName',
+        'AuthenticationPackageName', 'WorkstationName', 'LogonGuid',
+        'TransmittedServices', 'LmPackageName', 'KeyLength', 'ProcessId',
+        'ProcessName', 'IpAddress', 'IpPort'),
+    4625: SUBJECT + ('TargetUserSid', 'TargetUserName', 'TargetDomainName',
+        'Status', 'FailureReason', 'SubStatus', 'LogonType',
+        'LogonProcessName', 'AuthenticationPackageName', 'WorkstationName',
+        'TransmittedServices', 'LmPackageName', 'KeyLength', 'ProcessId',
+        'ProcessName', 'IpAddress', 'IpPort'),
+    4634: TARGET + ('LogonType',),
+    4647: TARGET,
+    4648: SUBJECT + ('LogonGuid', 'TargetUserName', 'TargetDomainName',
+        'TargetLogonGuid', 'TargetServerName', 'TargetInfo', 'ProcessId',
+        'ProcessName', 'IpAddress', 'IpPort'),
+    4672: SUBJECT + ('PrivilegeList',),
+    4688: SUBJECT + ('NewProcessId', 'NewProcessName', 'TokenElevationType',
+        'ProcessId', 'CommandLine', 'TargetUserSid', 'TargetUserName',
+        'TargetDomainName', 'TargetLogonId', 'ParentProcessName',
+        'MandatoryLabel'),
+    4689: SUBJECT + ('Status', 'ProcessId', 'ProcessName'),
+    4776: ('PackageName', 'TargetUserName', 'Workstation', 'Status'),
+    4768: ('TargetUserName', 'TargetDomainName', 'TargetSid', 'ServiceName',
+        'ServiceSid', 'TicketOptions', 'Status', 'TicketEncryptionType',
+        'PreAuthType', 'IpAddress', 'IpPort'),
+    4769: ('TargetUserName', 'TargetDomainName', 'ServiceName', 'ServiceSid',
+        'TicketOptions', 'TicketEncryptionType', 'IpAddress', 'IpPort',
+        'Status', 'LogonGuid', 'TransmittedServices'),
+    5156: ('ProcessID', 'Application', 'Direction', 'SourceAddress',
+        'SourcePort', 'DestAddress', 'DestPort', 'Protocol', 'FilterRTID',
+        'LayerName', 'LayerRTID'),
+    5158: ('ProcessID', 'Application', 'SourceAddress', 'SourcePort',
+        'Protocol', 'FilterRTID', 'LayerName', 'LayerRTID'),
+    4720: ('TargetUserName', 'TargetDomainName', 'TargetSid') + SUBJECT +
+        ('PrivilegeList', 'SamAccountName', 'DisplayName',
+         'UserPrincipalName', 'UserAccountControl'),
+    4703: SUBJECT + ('TargetUserSid', 'TargetUserName', 'TargetDomainName',
+        'TargetLogonId', 'ProcessName', 'ProcessId', 'EnabledPrivilegeList',
+        'DisabledPrivilegeList'),
+    4799: ('TargetUserName', 'TargetDomainName', 'TargetSid') + SUBJECT +
+        ('CallerProcessId', 'CallerProcessName'),
+}
+default_fields = SUBJECT + ('ObjectServer', 'ObjectType', 'ObjectName',
+                            'HandleId', 'AccessMask', 'ProcessId', 'ProcessName')
+account_fields = ('MemberName', 'MemberSid', 'TargetUserName',
+                  'TargetDomainName', 'TargetSid') + SUBJECT + ('PrivilegeList',)
+
+# EventDataName and EventData fields of the TaskScheduler EventIDs,
+# 100, 107 and 129 are not in evtx_ids, an EventID added to evtx_ids
+# and not here gets task_fields
+task_layouts = {
+    100: ('TaskStartEvent', ('TaskName', 'UserContext', 'InstanceId')),
+    102: ('TaskSuccessEvent', ('TaskName', 'UserContext', 'InstanceId')),
+    106: ('TaskRegisteredEvent', ('TaskName', 'UserContext')),
+    107: ('TimeTriggerEvent', ('TaskName', 'InstanceId')),
+    110: ('TaskRunEvent', ('TaskName', 'InstanceId', 'UserContext')),
+    129: ('CreatedTaskProcess', ('TaskName', 'Path', 'ProcessID', 'Priority')),
+    140: ('TaskRegistrationUpdatedEvent', ('TaskName', 'UserName')),
+    141: ('TaskRegistrationDeleted', ('TaskName', 'UserName')),
+    142: ('TaskDisabledEvent', ('TaskName', 'UserName')),
+    145: ('TaskQuotaExceeded', ('TaskName', 'CurrentQuota', 'ErrorDescription')),
+    200: ('ActionStart', ('TaskName', 'ActionName', 'TaskInstanceID')),
+    201: ('ActionSuccess', ('TaskName', 'TaskInstanceID', 'ActionName', 'ResultCode')),
+    202: ('ActionFailure', ('TaskName', 'TaskInstanceID', 'ActionName', 'ResultCode')),
+    319: ('TaskEngineReceivedMessageEvent', ('TaskEngineName', 'Command', 'ProcessID')),
+}
+task_fields = ('TaskName', 'UserName', 'ResultCode')
+task_weights = {100: 10, 102: 10, 107: 8, 110: 4, 129: 10, 200: 12, 201: 12}
+
+# EventData fields of the BITS EventIDs, 16403 is not in bits_ids, an
+# EventID added to bits_ids and not here gets the bits_data fields
+bits_layouts = {
+    3: ('jobTitle', 'jobId', 'jobOwner', 'processPath', 'processId'),
+    4: ('User', 'jobTitle', 'jobId', 'jobOwner', 'fileCount',
+        'bytesTransferred', 'bytesTransferredFromPeer'),
+    5: ('jobTitle', 'jobId', 'jobOwner', 'fileCount'),
+    59: ('transferId', 'name', 'Id', 'url', 'peer', 'fileTime', 'fileLength',
+         'bytesTotal', 'bytesTransferred', 'bytesTransferredFromPeer'),
+    60: ('transferId', 'name', 'Id', 'url', 'peer', 'hr', 'fileTime',
+         'fileLength', 'bytesTotal', 'bytesTransferred',
+         'bytesTransferredFromPeer'),
+    16403: ('String', 'String1'),
+}
+
+# Value types of the fields that are not strings
+field_types = {'LogonType': T_U32, 'KeyLength': T_U32, 'LogonGuid': T_GUID,
+               'TargetLogonGuid': T_GUID, 'ProcessID': T_U32,
+               'Protocol': T_U32, 'FilterRTID': T_U64, 'LayerRTID': T_U64,
+               'PreAuthType': T_U32, 'Priority': T_U32, 'ResultCode': T_U32,
+               'CurrentQuota': T_U32, 'InstanceId': T_GUID,
+               'TaskInstanceID': T_GUID, 'jobId': T_GUID,
+               'transferId': T_GUID, 'Id': T_GUID, 'processId': T_U32,
+               'fileCount': T_U32, 'bytesTransferred': T_U64,
+               'bytesTransferredFromPeer': T_U64, 'bytesTotal': T_U64,
+               'fileLength': T_U64, 'hr': T_U32, 'fileTime': T_FILETIME,
+               'SessionID': T_U32}
+
+def field_type(name):
+    if name in field_types:
+        return field_types[name]
+    if name.endswith('Sid') or name == 'MandatoryLabel':
+        return T_SID
+    if name.endswith('LogonId') or name in ('ProcessId', 'NewProcessId',
+                                            'CallerProcessId', 'HandleId'):
+        return T_HEX64
+    return T_WSTR
+
+def field_value(rng, name, vtype, time):
+    """
+    A likely value of the field name of type vtype in a record at time.
+    """
+    if vtype == T_SID:
+        return rng.choice(SIDS)
+    if vtype == T_HEX64:
+        return rng.randrange(0x3e7, 1 << 36)
+    if vtype == T_GUID:
+        return str(uuid.UUID(int=rng.choice((rng.getrandbits(128), 0))))
+    if vtype == T_FILETIME:
+        return time
+    if vtype in (T_U32, T_U64):
+        if name == 'LogonType':
+            return rng.choice((2, 3, 3, 3, 5, 5, 7, 10, 11))
+        if name == 'Protocol':
+            return rng.choice((6, 6, 17))
+        if name == 'Priority':
+            return rng.choice((4, 7))
+        if name == 'ResultCode':
+            return rng.choice((0, 0, 0, 2147942402))
+        return rng.randrange(0, 1 << (16 if vtype == T_U32 else 33))
+    if rng.random() < 0.02:
+        return rng.choice(ODD_TEXT)
+    if name.endswith('UserName') or name in ('User', 'jobOwner', 'UserContext'):
+        return rng.choice(USERS)
+    if name.endswith('DomainName'):
+        return rng.choice(DOMAINS)
+    if name in ('IpAddress', 'SourceAddress', 'DestAddress'):
+        return rng.choice(ADDRESSES)
+    if name.endswith('Port'):
+        return str(rng.choice((0, 53, 88, 135, 389, 443, 445, 3389,
+                               rng.randrange(49152, 65535))))
+    if name == 'CommandLine':
+        return rng.choice(COMMANDS)
+    if 'Process' in name or name in ('Application', 'Path'):
+        return rng.choice(PROCESSES)
+    if name == 'TaskName':
+        return rng.choice(TASKS)
+    if name == 'url':
+        return rng.choice(URLS)
+    if name == 'Direction':
+        return rng.choice(('%%14592', '%%14593'))
+    if name in ('WorkstationName', 'Workstation', 'TargetServerName'):
+        return rng.choice(COMPUTERS).split('.')[0]
+    return '%s%d' % (name, rng.randrange(20))
+
+def event_data(rng, names, time):
+    fields = []
+    for name in names:
+        vtype = field_type(name)
+        fields.append((name, vtype, field_value(rng, name, vtype, time)))
+    return fields
+
+def weighted_ids(ids, weights):
+    return [event_id for event_id in sorted(ids)
+            for _ in range(weights.get(event_id, 1))]
+
+def security_records(rng, count):
+    """
+    count Security records of the EventIDs of the three Security scripts
+    and security_weights.
+    """
+    ids = set(parse_evtx_logins.evtxs) | set(parse_evtx_processes.evtxs) | \
+        set(parse_evtx_account_changes.evtxs) | set(security_weights)
+    ids = weighted_ids(ids, security_weights)
+    time = START
+    for i in range(count):
+        time += timedelta(microseconds=rng.randrange(0, 4000000))
+        event_id = rng.choice(ids)
+        record = {'provider': SECURITY_PROVIDER[0], 'guid': SECURITY_PROVIDER[1],
+                  'channel': 'Security', 'computer': rng.choice(COMPUTERS),
+                  'event_id': event_id, 'time': time, 'version': 2,
+                  'task': 12544, 'process_id': rng.choice((4, 640, 772)),
+                  'thread_id': rng.randrange(100, 9000)}
+        if event_id == 1102:
+            record['user_data'] = ('LogFileCleared', EVENTLOG_NS,
+                                   event_data(rng, SUBJECT, time))
+            record['keywords'] = 0x4020000000000000
+        else:
+            if event_id in security_fields:
+                names = security_fields[event_id]
+            elif event_id in parse_evtx_account_changes.evtxs:
+                names = account_fields
+            else:
+                names = default_fields
+            record['event_data'] = event_data(rng, names, time)
+            if event_id == 4625 or rng.random() < 0.001:
+                record['keywords'] = 0x8010000000000000
+        yield record
+
+def task_records(rng, count):
+    ids = weighted_ids(set(parse_evtx_tasks.evtx_ids) | set(task_layouts),
+                       task_weights)
+    time = START
+    for i in range(count):
+        time += timedelta(microseconds=rng.randrange(0, 40000000))
+        event_id = rng.choice(ids)
+        name, names = task_layouts.get(event_id, ('TaskEvent', task_fields))
+        yield {'provider': TASKS_PROVIDER[0], 'guid': TASKS_PROVIDER[1],
+               'channel': 'Microsoft-Windows-TaskScheduler/Operational',
+               'computer': rng.choice(COMPUTERS), 'event_id': event_id,
+               'time': time, 'level': 4, 'task': event_id, 'process_id': 1396,
+               'thread_id': rng.randrange(100, 9000), 'user_sid': 'S-1-5-18',
+               'keywords': 0x8000000000000000, 'event_data_name': name,
+               'event_data': event_data(rng, names, time)}
+
+def bits_records(rng, count):
+    ids = weighted_ids(set(parse_evtx_BITS.bits_ids) | set(bits_layouts),
+                       {3: 3, 4: 3, 59: 3, 60: 3, 16403: 2})
+    time = START
+    for i in range(count):
+        time += timedelta(microseconds=rng.randrange(0, 40000000))
+        event_id = rng.choice(ids)
+        yield {'provider': BITS_PROVIDER[0], 'guid': BITS_PROVIDER[1],
+               'channel': 'Microsoft-Windows-Bits-Client/Operational',
+               'computer': rng.choice(COMPUTERS), 'event_id': event_id,
+               'time': time, 'level': 4, 'process_id': 1220,
+               'thread_id': rng.randrange(100, 9000), 'user_sid': 'S-1-5-18',
+               'keywords': 0x4000000000000000,
+               'event_data': event_data(rng, bits_layouts.get(event_id,
+                   parse_evtx_BITS.bits_data), time)}
+
+def rdp_records(rng, sessions):
+    """
+    The records of each RDP log for sessions RDP sessions, by log file
+    name, in time order. Besides the sessions there are connections that
+    never authenticate, authentications without a logon, outbound
+    RDPClient connections and the other RDP_IDs.
+    """
+    logs = dict((log, []) for log in Evtx_Logs)
+    second = timedelta(seconds=1)
+    next_session = dict((computer, 2) for computer in COMPUTERS)
+    addresses = ['10.0.0.%d' % i for i in range(2, 60)] + list(ADDRESSES[8:])
+    users = USERS[:5]
+
+    def add(log, time, event_id, computer, fields):
+        logs[log].append((time, event_id, computer, fields))
+
+    def lsm(time, event_id, computer, user, session, address=None):
+        fields = [('User', T_WSTR, 'CORP\\' + user), ('SessionID', T_U32, session)]
+        if event_id != 23:
+            fields.append(('Address', T_WSTR, address))
+        add(LSM_LOG, time, event_id, computer, fields)
+
+    def connect(time, computer, user, address):
+        add(CORE_LOG, time, 131, computer,
+            [('ConnType', T_WSTR, 'TCP'),
+             ('ClientIP', T_WSTR, '%s:%d' % (address, rng.randrange(1024, 65535)))])
+        add(RCM_LOG, time + 2 * second, 1149, computer,
+            [('Param1', T_WSTR, user), ('Param2', T_WSTR, 'CORP'),
+             ('Param3', T_WSTR, address)])
+
+    time = START
+    for n in range(sessions):
+        time += timedelta(seconds=rng.randrange(10, 900))
+        computer = rng.choice(COMPUTERS)
+        user, address = rng.choice(users), rng.choice(addresses)
+        kind = rng.random()
+        if kind < 0.08:
+            # Password guessing, connections only
+            for k in range(rng.randrange(3, 12)):
+                add(CORE_LOG, time + k * second, 131, computer,
+                    [('ConnType', T_WSTR, 'TCP'),
+                     ('ClientIP', T_WSTR, '203.0.113.%d:%d' % (n % 250, 5000 + k))])
+            add(CORE_LOG, time + 12 * second, 140, computer,
+                [('IPString', T_WSTR, '203.0.113.%d' % (n % 250))])
+            continue
+        if kind < 0.12:
+            connect(time, computer, user, address)
+            continue
+        if kind < 0.2:
+            # Outbound from this computer
+            server = rng.choice(COMPUTERS).split('.')[0]
+            add(CLIENT_LOG, time, 1024, computer,
+                [('Name', T_WSTR, 'Server Name'), ('Value', T_WSTR, server),
+                 ('CustomLevel', T_WSTR, 'Info')])
+            add(CLIENT_LOG, time, 1102, computer,
+                [('Name', T_WSTR, 'Server Address'),
+                 ('Value', T_WSTR, rng.choice(addresses)),
+                 ('CustomLevel', T_WSTR, 'Info')])
+            add(CLIENT_LOG, time + second, 1029, computer,
+                [('TraceMessage', T_WSTR, 'Xo8sPqA4fDkz0xJcU1m2wQ==-')])
+            add(CLIENT_LOG, time + 2 * second, 1105, computer,
+                [('Name', T_WSTR, 'Multi-transport'), ('Value', T_U32, 0),
+                 ('CustomLevel', T_WSTR, 'Info')])
+            add(CLIENT_LOG, time + timedelta(minutes=rng.randrange(1, 90)), 1026,
+                computer, [('Name', T_WSTR, 'Disconnect Reason'),
+                           ('Value', T_U32, rng.choice((1, 2, 3, 2308))),
+                           ('CustomLevel', T_WSTR, 'Info')])
+            continue
+        session = next_session[computer]
+        next_session[computer] += 1
+        add(CORE_LOG, time - second, 98, computer, [])
+        connect(time, computer, user, address)
+        lsm(time + 3 * second, 21, computer, user, session, address)
+        lsm(time + 4 * second, 22, computer, user, session, address)
+        end = time + 4 * second
+        for d in range(rng.randrange(0, 3)):
+            end += timedelta(minutes=rng.randrange(5, 120))
+            lsm(end, 24, computer, user, session, address)
+            add(LSM_LOG, end, 40, computer, [('Session', T_U32, session),
+                                             ('Reason', T_U32, rng.choice((0, 5, 11)))])
+            end += timedelta(minutes=rng.randrange(5, 60))
+            address = rng.choice(addresses)
+            connect(end, computer, user, address)
+            lsm(end + 3 * second, 25, computer, user, session, address)
+            end += 3 * second
+        if rng.random() < 0.05:
+            # Taken over from another session
+            end += timedelta(minutes=rng.randrange(1, 60))
+            add(LSM_LOG, end, 39, computer, [('TargetSession', T_U32, session),
+                                             ('Source', T_U32, session + 1)])
+        if rng.random() < 0.85:
+            end += timedelta(minutes=rng.randrange(1, 240))
+            lsm(end, 23, computer, user, session)
+    for log, events in logs.items():
+        events.sort(key=lambda event: event[0])
+        provider, channel = RDP_LOGS[log]
+        records = []
+        for time, event_id, computer, fields in events:
+            record = {'provider': provider, 'guid': RDP_GUID,
+                      'channel': channel, 'computer': computer,
+                      'event_id': event_id, 'time': time, 'level': 4,
+                      'process_id': rng.randrange(300, 2000),
+                      'thread_id': rng.randrange(100, 9000),
+                      'keywords': 0x1000000000000000}
+            if log in (LSM_LOG, RCM_LOG):
+                record['user_data'] = ('EventXML', RDP_NS, fields)
+            else:
+                record['event_data'] = fields
+            records.append(record)
+        logs[log] = records
+    return logs
+
+def json_value(vtype, value):
+    """
+    A value as evtx_dump writes it in JSON.
+    """
+    if value is None:
+        return None
+    if vtype in (T_U8, T_U16, T_U32, T_U64):
+        return value
+    if vtype == T_HEX64:
+        return '0x%x' % value
+    if vtype == T_GUID:
+        return '{%s}' % value.upper()
+    if vtype == T_FILETIME:
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return value
+
+def json_record(record, record_id):
+    """
+    The evtx_dump JSON record of record.
+    """
+    system = {'Provider': {'#attributes': {'Name': record['provider'],
+                                           'Guid': record['guid'].upper()}},
+              'EventID': record['event_id'],
+              'Version': record.get('version', 0),
+              'Level': record.get('level', 0),
+              'Task': record.get('task', 0),
+              'Opcode': 0,
+              'Keywords': '0x%x' % record.get('keywords', 0x8020000000000000),
+              'TimeCreated': {'#attributes': {'SystemTime':
+                  record['time'].strftime('%Y-%m-%dT%H:%M:%S.%fZ')}},
+              'EventRecordID': record_id,
+              'Correlation': None,
+              'Execution': {'#attributes': {
+                  'ProcessID': record.get('process_id', 4),
+                  'ThreadID': record.get('thread_id', 100)}},
+              'Channel': record['channel'],
+              'Computer': record['computer'],
+              'Security': None}
+    if record.get('user_sid'):
+        system['Security'] = {'#attributes': {'UserID': record['user_sid']}}
+    event = {'#attributes': {'xmlns': 'http://schemas.microsoft.com/win/2004/08/events/event'},
+             'System': system}
+    if record.get('event_data') is not None:
+        data = {}
+        if record.get('event_data_name'):
+            data['#attributes'] = {'Name': record['event_data_name']}
+        for name, vtype, value in record['event_data']:
+            data[name] = json_value(vtype, value)
+        event['EventData'] = data or None
+    if record.get('user_data') is not None:
+        element, namespace, fields = record['user_data']
+        data = {'#attributes': {'xmlns': namespace}}
+        for name, vtype, value in fields:
+            data[name] = json_value(vtype, value)
+        event['UserData'] = {element: data}
+    return {'Event': event}
+
+def write_log(output_dir, name, records, jsonl):
+    """
+    Write records to output_dir/name and, with jsonl, name.jsonl.
+    Returns {file name: {"records", "bytes"}}.
+    """
+    path = os.path.join(output_dir, name)
+    written = {}
+    out = open(path + '.jsonl', 'w', encoding='utf-8') if jsonl else None
+    with EvtxWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+            if out is not None:
+                out.write(json.dumps(json_record(record, writer.records),
+                                     ensure_ascii=False) + '\n')
+    written[name] = {'records': writer.records, 'bytes': os.path.getsize(path)}
+    if out is not None:
+        out.close()
+        written[name + '.jsonl'] = {'records': writer.records,
+                                    'bytes': os.path.getsize(path + '.jsonl')}
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Write made up Security, TaskScheduler, BITS and RDP logs as .evtx "
+        "and evtx_dump style .jsonl files to benchmark the parsers with",
+        usage='evtx_corpus.py corpus -n 1000000 -l security,tasks,bits,rdp --seed 1')
+    parser.add_argument("output", type=str,
+        help="directory the logs and corpus.json are written to")
+    parser.add_argument('-n', '--records', type=int, default=100000,
+        help="Security records, a tenth of it for TaskScheduler and BITS "
+             "and a session per 50 for RDP (default %(default)s)")
+    parser.add_argument('-l', '--logs', type=str, default=','.join(corpus_logs),
+        help="logs to write ( -l %s)" % ','.join(corpus_logs))
+    parser.add_argument('--seed', type=int, default=1,
+        help="random seed, the same seed and -n write the same corpus (default %(default)s)")
+    parser.add_argument('--no-jsonl', default=False, action="store_true",
+        help="write the .evtx files only")
+    args = parser.parse_args()
+
+    logs = args.logs.split(',')
+    for log in logs:
+        if log not in corpus_logs:
+            parser.error("unknown log %s, choose from %s" % (log, ','.join(corpus_logs)))
+    if args.records < 1:
+        parser.error("-n must be at least 1")
+    os.makedirs(args.output, exist_ok=True)
+    jsonl = not args.no_jsonl
+    small = max(args.records // 10, 1)
+
+    files = {}
+    if 'security' in logs:
+        files.update(write_log(args.output, 'Security.evtx',
+            security_records(random.Random(args.seed), args.records), jsonl))
+    if 'tasks' in logs:
+        files.update(write_log(args.output, TASKS_LOG,
+            task_records(random.Random(args.seed + 1), small), jsonl))
+    if 'bits' in logs:
+        files.update(write_log(args.output, BITS_LOG,
+            bits_records(random.Random(args.seed + 2), small), jsonl))
+    if 'rdp' in logs:
+        rdp_logs = rdp_records(random.Random(args.seed + 3),
+                               max(args.records // 50, 1))
+        for log in Evtx_Logs:
+            files.update(write_log(args.output, log, rdp_logs[log], jsonl))
+
+    with open(os.path.join(args.output, 'corpus.json'), 'w') as f:
+        json.dump({'records': args.records, 'seed': args.seed, 'files': files},
+                  f, indent=1, sort_keys=True)
+    for name, info in sorted(files.items()):
+        print('%s,%d,%d' % (name, info['records'], info['bytes']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,994 @@
+#! /usr/bin/env python3
+# Shared record decoder for the parse_evtx_*.py scripts
+#
+# Reads the System, EventData and UserData values out of the XML that
+# python-evtx renders with a single expat pass and returns a plain dict,
+# instead of building a BeautifulSoup tree for every record.
+# Records that expat rejects (python-evtx does not always render well
+# formed XML) fall back to BeautifulSoup so the CSV output is unchanged.
+#
+# Also splits a file into ranges of 64 KB chunks so the scripts can hand
+# them to a process pool (--workers) and still print in record order, and
+# can read a record's EventID straight from its template substitutions so
+# records the script has no use for are skipped before XML rendering.
+# Decoded records can be kept in an on-disk cache, see evtx_cache.py, and
+# runs can pick up where the last one stopped, see evtx_checkpoint.py.
+# With --stats the read, prefilter, render and decode stages of each chunk
+# are timed and the records counted, see evtx_stats.py.
+# With --since/--until the write times in the record headers of each chunk
+# are read without decoding anything and chunks that end before or start
+# after the window by more than --time-slack seconds are skipped whole,
+# the records of the chunks left are kept by their TimeCreated. Records
+# whose TimeCreated is further than that from when they were written
+# (forwarded events, hosts with a wrong clock) are lost with the chunks,
+# --time-slack 0 reads every chunk and --stats counts the chunks skipped.
+# Each template is compiled once into the event fields its substitutions
+# fill (EventID, SystemTime, Computer, each EventData Name ...), and
+# records of that template are decoded from their substitution values
+# without rendering XML. Records with values the XML round trip would
+# change, or of templates that do not compile, are rendered as before.
+# With --index the chunks without any of the script's EventIDs are skipped
+# whole as well, by the sidecar index of evtx_index.py.
+#
+# Run directly to compare records/sec against the BeautifulSoup path and
+# of records decoded by their templates:
+#     evtx_decoder.py Security.evtx
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and BeautifulSoup
+
+import re
+import copy
+import mmap
+import time
+import struct
+import hashlib
+import collections
+import datetime
+import contextlib
+import multiprocessing
+from xml.parsers import expat
+
+import argparse
+
+import Evtx.Nodes as e_nodes
+from Evtx.Evtx import FileHeader, ChunkHeader
+from Evtx.Views import evtx_file_xml_view, evtx_record_xml_view, \
+    render_root_node_with_subs
+
+# Chunks in each task handed to a worker, 16 x 64 KB = 1 MB of the file
+CHUNKS_PER_TASK = 16
+
+# Seconds a record's TimeCreated may be apart from the time it was
+# written, chunks are only skipped when the window misses them by more
+# (default of --time-slack)
+TIME_SLACK = 600
+
+# What --since/--until take, a time or a prefix of one, 0 for a digit
+time_template = '0000-00-00 00:00:00.000000'
+
+# FILETIME of 1970-01-01, in 100 ns since 1601-01-01
+FILETIME_EPOCH = 116444736000000000
+
+# Where each template keeps its EventID, keyed by template GUID and length:
+# ('sub', substitution index), ('value', text) or None when unknown
+_event_id_sources = {}
+
+# Compiled field extractor of each template keyed like _event_id_sources,
+# None for templates whose records are rendered
+_template_extractors = {}
+
+# A template is compiled by rendering it with substitution i replaced by
+# chr(MARKER_BASE + i) and decoding that, so the markers land in the
+# fields they fill
+MARKER_BASE = 0xE000
+MARKER_COUNT = 0x1900
+_markers = re.compile('([\ue000-\uf8ff])')
+
+# Values that would not come out of render and decode unchanged (control
+# characters, bad code points and in attributes quotes and whitespace)
+_text_unsafe = re.compile('[\x00-\x08\x0b-\x1f\x7f\ud800-\udfff\ufffe\uffff]')
+_attr_unsafe = re.compile('[\x00-\x1f\x7f"\ud800-\udfff\ufffe\uffff]')
+
+# Substitution types that can hold such values, and BXml which renders
+# an XML fragment
+_string_types = (0x01, 0x02, 0x81)
+BXML_TYPE = 0x21
+
+# Text values of the Event/System children
+system_text_names = ('EventID',
+'EventRecordID',
+'Channel',
+'Computer',
+'Keywords'
+)
+
+# Attribute values of the Event/System children
+system_attr_names = {('TimeCreated', 'SystemTime'): 'SystemTime',
+('Execution', 'ProcessID'): 'ProcessID',
+('Execution', 'ThreadID'): 'ThreadID'
+}
+
+def new_event():
+    """
+    Returns an empty decoded record.
+    System values are strings, or None when the element is missing or
+    empty. EventData is a list of (Name, text) pairs in document order,
+    UserData maps lowercased tag names to their text (last one wins).
+    """
+    event = dict.fromkeys(system_text_names)
+    event.update(dict.fromkeys(system_attr_names.values()))
+    event['EventDataName'] = None
+    event['EventData'] = []
+    event['UserData'] = {}
+    return event
+
+def decode_record(xml):
+    """
+    Decode one record rendered by evtx_file_xml_view into a dict
+    (see new_event).
+    """
+    try:
+        return _decode_expat(xml)
+    except expat.ExpatError:
+        return _decode_soup(xml)
+
+def _decode_expat(xml):
+    event = new_event()
+    event_data = event['EventData']
+    user_data = event['UserData']
+    # [tag, Name attribute, text parts] for each open element
+    stack = []
+    # [current Event child, EventData already seen]
+    section = [None, False]
+
+    def start(tag, attrs):
+        depth = len(stack)
+        if depth == 1:
+            section[0] = tag
+            if tag == 'EventData' and not section[1]:
+                event['EventDataName'] = attrs.get('Name')
+        elif depth == 2 and section[0] == 'System':
+            for attr, value in attrs.items():
+                key = system_attr_names.get((tag, attr))
+                if key:
+                    event[key] = value
+        stack.append([tag, attrs.get('Name'), []])
+
+    def end(tag):
+        tag, name, parts = stack.pop()
+        depth = len(stack)
+        if depth == 1:
+            if section[0] == 'EventData':
+                section[1] = True
+            section[0] = None
+        elif depth == 2 and section[0] == 'System':
+            if tag in system_text_names:
+                event[tag] = ''.join(parts) or None
+        elif depth == 2 and section[0] == 'EventData':
+            if not section[1]:
+                event_data.append((name, ''.join(parts)))
+        elif depth >= 2:
+            text = ''.join(parts)
+            if section[0] == 'UserData':
+                user_data[tag.lower()] = text
+            if depth > 2:
+                stack[-1][2].append(text)
+
+    def data(text):
+        if stack:
+            stack[-1][2].append(text)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.Parse(xml, True)
+    return event
+
+def _decode_soup(xml):
+    from bs4 import BeautifulSoup, element
+
+    event = new_event()
+    soup = BeautifulSoup(xml, "lxml")
+    system = soup.event.system
+    for name in system_text_names:
+        tag = system.find(name.lower(), recursive=False)
+        if tag is not None:
+            event[name] = tag.string
+    for (name, attr), key in system_attr_names.items():
+        tag = system.find(name.lower(), recursive=False)
+        if tag is not None:
+            event[key] = tag.get(attr.lower())
+    if soup.eventdata is not None:
+        event['EventDataName'] = soup.eventdata.get('name')
+        for child in soup.eventdata.children:
+            if type(child) is element.Tag:
+                event['EventData'].append((child.get('name'), child.text))
+    if soup.userdata is not None:
+        for tag in soup.userdata.find_all(True):
+            event['UserData'][tag.name] = tag.text
+    return event
+
+def evtx_chunk_count(evtx_file):
+    """
+    Returns the number of chunks FileHeader.chunks() walks in evtx_file.
+    """
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            available = (len(buf) - fh.header_chunk_size()) // 0x10000
+            return max(0, min(fh.chunk_count(), available))
+
+def evtx_fingerprint(evtx_file):
+    """
+    Returns a SHA-256 of the file header and of the header of every chunk
+    in evtx_file. The chunk headers hold the checksums of their records,
+    so it changes with the records without reading all of them.
+    """
+    sha256 = hashlib.sha256()
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            sha256.update(buf[:0x80])
+            for chunk in range(fh.header_chunk_size(), len(buf), 0x10000):
+                sha256.update(buf[chunk:chunk + 0x80])
+    return sha256.hexdigest()
+
+def evtx_chunk_records(evtx_file):
+    """
+    Returns the (first, last) EventRecordID of each chunk in evtx_file,
+    read from the chunk headers.
+    """
+    count = evtx_chunk_count(evtx_file)
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            ranges = []
+            for i in range(count):
+                chunk = ChunkHeader(buf, fh.header_chunk_size() + i * 0x10000)
+                ranges.append((chunk.log_first_record_number(),
+                               chunk.log_last_record_number()))
+            return ranges
+
+def time_prefix(text):
+    """
+    --since/--until text as it is compared with record times, a UTC time
+    like time_template or a prefix of one ("2023-01-13 09"), with a T
+    between date and time or a space. Raises ValueError for other text.
+    """
+    text = text.strip().replace('T', ' ')
+    if not text or len(text) > len(time_template):
+        raise ValueError(text)
+    for char, kind in zip(text, time_template):
+        if char != kind and not (kind == '0' and char.isdigit()):
+            raise ValueError(text)
+    return text
+
+def time_text(SystemTime):
+    """
+    A SystemTime (2023-01-12 08:00:00.563564+00:00) as time_template, so
+    it compares with time_prefix text.
+    """
+    if SystemTime[19:20] == '.':
+        return SystemTime[:19] + '.' + SystemTime[20:26].ljust(6, '0')
+    return SystemTime[:19] + '.000000'
+
+def filetime_text(filetime):
+    seconds, ticks = divmod(filetime - FILETIME_EPOCH, 10000000)
+    when = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=seconds)
+    return '%s.%06d' % (when.strftime('%Y-%m-%d %H:%M:%S'), ticks // 10)
+
+def in_window(text, since, until):
+    """
+    True when the time_text text is from since on and up to until (the
+    end of its prefix), either of them None for no limit.
+    """
+    if since is not None and text < since:
+        return False
+    if until is not None and text[:len(until)] > until:
+        return False
+    return True
+
+def evtx_chunk_times(evtx_file):
+    """
+    Returns the (records, first, last) written time of each chunk in
+    evtx_file as FILETIMEs, read from the record headers without decoding
+    the records, first and last are None for a chunk without records.
+    """
+    count = evtx_chunk_count(evtx_file)
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            times = []
+            for i in range(count):
+                chunk = fh.header_chunk_size() + i * 0x10000
+                end = chunk + min(struct.unpack_from('<I', buf, chunk + 0x30)[0],
+                                  0x10000)
+                ofs = chunk + 0x200
+                records = 0
+                first = last = None
+                # Record header: magic, size, number, written FILETIME
+                while ofs + 24 <= end:
+                    magic, size, number, written = \
+                        struct.unpack_from('<IIQQ', buf, ofs)
+                    if magic != 0x2a2a or size < 24:
+                        break
+                    records += 1
+                    if first is None or written < first:
+                        first = written
+                    if last is None or written > last:
+                        last = written
+                    ofs += size
+                times.append((records, first, last))
+            return times
+
+def chunk_in_window(times, since, until, time_slack=TIME_SLACK):
+    """
+    False when a chunk's evtx_chunk_times entry shows it has no record
+    written within time_slack seconds of the since/until window.
+    """
+    records, first, last = times
+    if first is None:
+        return False
+    slack = time_slack * 10000000
+    try:
+        first = filetime_text(first - slack)
+        last = filetime_text(last + slack)
+    except (OverflowError, ValueError):
+        # A broken time, leave it to the records' TimeCreated
+        return True
+    return in_window(last, since, None) and in_window(first, None, until)
+
+def _find_element(node, path):
+    for child in node.children():
+        if isinstance(child, e_nodes.OpenStartElementNode) and \
+                child.tag_name() == path[0]:
+            if len(path) == 1:
+                return child
+            found = _find_element(child, path[1:])
+            if found is not None:
+                return found
+    return None
+
+def _template_event_id(root):
+    element = _find_element(root.template(), ('Event', 'System', 'EventID'))
+    if element is None:
+        return None
+    content = [child for child in element.children()
+               if not isinstance(child, (e_nodes.AttributeNode,
+                                         e_nodes.CloseStartElementNode,
+                                         e_nodes.CloseEmptyElementNode,
+                                         e_nodes.CloseElementNode))]
+    if len(content) != 1:
+        return None
+    if isinstance(content[0], (e_nodes.NormalSubstitutionNode,
+                               e_nodes.ConditionalSubstitutionNode)):
+        return ('sub', content[0].index())
+    if isinstance(content[0], e_nodes.ValueNode):
+        return ('value', content[0].children()[0].string())
+    return None
+
+def _record_template(record):
+    # The template key (GUID and data length) of record and the offset of
+    # its substitution count, None when it has no template instance
+    buf = record._buf
+    chunk = record._chunk
+    ofs = record.offset() + 0x18
+    if buf[ofs] & 0x0F == 0x0F:
+        ofs += 4
+    if buf[ofs] & 0x0F != 0x0C:
+        return None
+    template_offset = struct.unpack_from('<I', buf, ofs + 6)[0]
+    template = chunk.offset() + template_offset
+    key = bytes(buf[template + 4:template + 24])
+    resident = template_offset > ofs - chunk.offset()
+    ofs += 10
+    if resident:
+        ofs += 0x18 + struct.unpack_from('<I', buf, template + 20)[0]
+    return key, ofs
+
+def record_event_id(record):
+    """
+    Returns the EventID of record read from its template substitutions
+    without rendering XML, or None when the record has to be rendered to
+    find out.
+    """
+    buf = record._buf
+    chunk = record._chunk
+    try:
+        found = _record_template(record)
+        if found is None:
+            return None
+        key, ofs = found
+
+        if key not in _event_id_sources:
+            _event_id_sources[key] = _template_event_id(record.root())
+        source = _event_id_sources[key]
+        if source is None:
+            return None
+        if source[0] == 'value':
+            return int(source[1])
+
+        index = source[1]
+        count = struct.unpack_from('<I', buf, ofs)[0]
+        if index >= count:
+            return None
+        ofs += 4
+        value = ofs + count * 4
+        for i in range(index):
+            value += struct.unpack_from('<H', buf, ofs + i * 4)[0]
+        size, type_ = struct.unpack_from('<HB', buf, ofs + index * 4)
+        node = e_nodes.get_variant_value(buf, value, chunk, None, type_, length=size)
+        return int(node.string())
+    except Exception:
+        return None
+
+class _TemplateValue(object):
+    # Stands in for a substitution value when a template is rendered
+    def __init__(self, text):
+        self.text = text
+
+    def string(self):
+        return self.text
+
+class _TemplateValues(object):
+    # The substitutions of a template rendering, markers or all text
+    def __init__(self, text=None):
+        self.text = text
+
+    def __getitem__(self, index):
+        if index >= MARKER_COUNT:
+            raise ValueError('substitution %d' % index)
+        if self.text is not None:
+            return _TemplateValue(self.text)
+        return _TemplateValue(chr(MARKER_BASE + index))
+
+def _value_spec(text):
+    # text of a decoded template as the constant text, the substitution
+    # index it is, or a tuple of text and substitution index pieces
+    if text is None or not _markers.search(text):
+        return text
+    pieces = []
+    for i, piece in enumerate(_markers.split(text)):
+        if i % 2:
+            pieces.append(ord(piece) - MARKER_BASE)
+        elif piece:
+            pieces.append(piece)
+    if len(pieces) == 1 and type(pieces[0]) is int:
+        return pieces[0]
+    return tuple(pieces)
+
+def _spec_indexes(spec):
+    if type(spec) is int:
+        return {spec}
+    if type(spec) is tuple:
+        return set(piece for piece in spec if type(piece) is int)
+    return set()
+
+def _fill(spec, values):
+    if type(spec) is int:
+        return values[spec]
+    if type(spec) is tuple:
+        return ''.join(values[piece] if type(piece) is int else piece
+                       for piece in spec)
+    return spec
+
+def _compile_template(root):
+    """
+    The field extractor of the template of root (see _template_event),
+    None when its records have to be rendered.
+    """
+    try:
+        if _markers.search(render_root_node_with_subs(root, _TemplateValues(''))):
+            # Markers would be mixed up with the template's own text
+            return None
+        xml = render_root_node_with_subs(root, _TemplateValues())
+        template = _decode_expat(xml)
+    except Exception:
+        return None
+
+    # Where each substitution is rendered, values going into attributes
+    # are checked for more characters
+    unsafe = {}
+
+    def start(tag, attrs):
+        for value in attrs.values():
+            for index in _spec_indexes(_value_spec(value)):
+                unsafe[index] = _attr_unsafe
+
+    def data(text):
+        for index in _spec_indexes(_value_spec(text)):
+            unsafe.setdefault(index, _text_unsafe)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = data
+    parser.Parse(xml, True)
+
+    fields = []
+    for key in system_text_names + tuple(system_attr_names.values()) + \
+            ('EventDataName',):
+        spec = _value_spec(template[key])
+        if type(spec) is not str and spec is not None:
+            fields.append((key, spec, key in system_text_names))
+            template[key] = None
+    event_data = [(_value_spec(name), _value_spec(text))
+                  for name, text in template['EventData']]
+    user_data = [(tag, _value_spec(text))
+                 for tag, text in template['UserData'].items()]
+    template['EventData'] = None
+    template['UserData'] = None
+
+    used = set()
+    for key, spec, empty_none in fields:
+        used |= _spec_indexes(spec)
+    for name, text in event_data:
+        used |= _spec_indexes(name) | _spec_indexes(text)
+    for tag, text in user_data:
+        used |= _spec_indexes(text)
+    subs = tuple((index, unsafe[index], index in used)
+                 for index in sorted(unsafe))
+    return template, fields, event_data, user_data, subs
+
+def _template_event(record, ofs, extractor):
+    # record decoded by its template's extractor from the substitutions at
+    # ofs, None when one of them would not render as it is
+    template, fields, event_data, user_data, subs = extractor
+    buf = record._buf
+    chunk = record._chunk
+    count = struct.unpack_from('<I', buf, ofs)[0]
+    if subs and subs[-1][0] >= count:
+        return None
+    ofs += 4
+    # Substitution sizes and types
+    decl = struct.unpack_from('<' + 'HBx' * count, buf, ofs)
+    value = ofs + count * 4
+    starts = []
+    for size in decl[0::2]:
+        starts.append(value)
+        value += size
+    values = {}
+    for index, unsafe, used in subs:
+        size = decl[index * 2]
+        type_ = decl[index * 2 + 1]
+        if type_ == BXML_TYPE:
+            return None
+        if not used and type_ not in _string_types:
+            continue
+        node = e_nodes.get_variant_value(buf, starts[index], chunk, None,
+                                         type_, length=size)
+        if abs(size - node.length()) > 4:
+            return None
+        text = node.string()
+        if unsafe.search(text):
+            return None
+        values[index] = text
+
+    event = template.copy()
+    for key, spec, empty_none in fields:
+        text = _fill(spec, values)
+        event[key] = (text or None) if empty_none else text
+    event['EventData'] = [(_fill(name, values), _fill(text, values))
+                          for name, text in event_data]
+    event['UserData'] = dict((tag, _fill(text, values))
+                             for tag, text in user_data)
+    return event
+
+def record_event(record):
+    """
+    Returns record decoded like decode_record(evtx_record_xml_view(record)),
+    from its substitution values by the compiled extractor of its
+    template when it has one, else by rendering it.
+    """
+    event = _compiled_event(record)
+    if event is None:
+        event = decode_record(evtx_record_xml_view(record))
+    return event
+
+def _compiled_event(record):
+    try:
+        found = _record_template(record)
+        if found is None:
+            return None
+        key, ofs = found
+        if key not in _template_extractors:
+            _template_extractors[key] = _compile_template(record.root())
+        extractor = _template_extractors[key]
+        if extractor is None:
+            return None
+        return _template_event(record, ofs, extractor)
+    except Exception:
+        return None
+
+def evtx_chunk_record_view(evtx_file, first_chunk, last_chunk, event_ids=None,
+                           first_record=None, stats=None):
+    """
+    Generate the records of chunks first_chunk up to (not including)
+    last_chunk, skipping records like evtx_chunk_xml_view.
+    """
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            for i in range(first_chunk, last_chunk):
+                chunk = ChunkHeader(buf, fh.header_chunk_size() + i * 0x10000)
+                if stats is not None:
+                    yield from _stats_chunk_records(chunk, event_ids,
+                                                    first_record, stats)
+                    continue
+                for record in chunk.records():
+                    if first_record is not None and \
+                            record.record_num() < first_record:
+                        continue
+                    if event_ids is not None:
+                        event_id = record_event_id(record)
+                        if event_id is not None and event_id not in event_ids:
+                            continue
+                    yield record
+
+def _stats_chunk_records(chunk, event_ids, first_record, stats):
+    # The loop of evtx_chunk_record_view with each step timed
+    start = time.perf_counter()
+    for record in chunk.records():
+        stats.count('seen')
+        if first_record is not None and record.record_num() < first_record:
+            stats.count('skipped')
+            continue
+        start = stats.lap('read', start)
+        if event_ids is not None:
+            event_id = record_event_id(record)
+            start = stats.lap('prefilter', start)
+            if event_id is not None and event_id not in event_ids:
+                stats.count('skipped')
+                continue
+        yield record
+        start = time.perf_counter()
+
+def evtx_chunk_xml_view(evtx_file, first_chunk, last_chunk, event_ids=None,
+                        first_record=None, stats=None):
+    """
+    Generate (xml, record) like evtx_file_xml_view, but only for chunks
+    first_chunk up to (not including) last_chunk.
+    When event_ids is given, records whose EventID (see record_event_id)
+    is not in it are skipped without being rendered, as are records
+    numbered below first_record when that is given.
+    With stats (see evtx_stats.py) the steps are timed and the records
+    counted.
+    """
+    for record in evtx_chunk_record_view(evtx_file, first_chunk, last_chunk,
+                                         event_ids, first_record, stats):
+        if stats is None:
+            yield evtx_record_xml_view(record), record
+            continue
+        start = time.perf_counter()
+        xml = evtx_record_xml_view(record)
+        stats.lap('render', start)
+        yield xml, record
+
+def evtx_chunk_events(evtx_file, first_chunk, last_chunk, event_ids=None,
+                      args=None):
+    """
+    Generate the records of chunks first_chunk up to (not including)
+    last_chunk decoded by record_event, skipping records outside
+    event_ids like evtx_chunk_xml_view.
+    args is the script's parsed arguments: with args.cache (see
+    evtx_cache.py) chunks decoded before are read from the cache, and
+    records below args.first_record (set by map_chunks for
+    --since-checkpoint) are skipped. With args.stats (see evtx_stats.py)
+    reading, rendering and decoding are timed. With args.since or
+    args.until (time_prefix text) records whose TimeCreated is outside
+    that window are skipped.
+    """
+    since = getattr(args, 'since', None)
+    until = getattr(args, 'until', None)
+    if since is None and until is None:
+        yield from _chunk_events(evtx_file, first_chunk, last_chunk,
+                                 event_ids, args)
+        return
+    stats = getattr(args, 'stats', None)
+    for event in _chunk_events(evtx_file, first_chunk, last_chunk,
+                               event_ids, args):
+        if in_window(time_text(event['SystemTime'] or ''), since, until):
+            yield event
+        elif stats is not None:
+            stats.count('skipped')
+
+def _chunk_events(evtx_file, first_chunk, last_chunk, event_ids, args):
+    cache = getattr(args, 'cache', None)
+    first_record = getattr(args, 'first_record', None)
+    stats = getattr(args, 'stats', None)
+    if stats is not None:
+        yield from _stats_chunk_events(evtx_file, first_chunk, last_chunk,
+                                       event_ids, first_record, cache, stats)
+    elif cache is None:
+        for record in evtx_chunk_record_view(evtx_file, first_chunk,
+                                             last_chunk, event_ids,
+                                             first_record):
+            yield record_event(record)
+    else:
+        for chunk in range(first_chunk, last_chunk):
+            for event in cache.chunk_events(evtx_file, chunk, event_ids):
+                if first_record is not None and event['EventRecordID'] and \
+                        int(event['EventRecordID']) < first_record:
+                    continue
+                yield event
+
+def _stats_chunk_events(evtx_file, first_chunk, last_chunk, event_ids,
+                        first_record, cache, stats):
+    # evtx_chunk_events with each step timed, records decoded from their
+    # substitutions are counted as compiled and records that expat rejects
+    # as beautifulsoup
+    if cache is None:
+        for record in evtx_chunk_record_view(evtx_file, first_chunk,
+                                             last_chunk, event_ids,
+                                             first_record, stats):
+            start = time.perf_counter()
+            event = _compiled_event(record)
+            start = stats.lap('extract', start)
+            if event is not None:
+                stats.count('compiled')
+                stats.count('decoded')
+                yield event
+                continue
+            xml = evtx_record_xml_view(record)
+            start = stats.lap('render', start)
+            try:
+                event = _decode_expat(xml)
+                stats.lap('decode', start)
+            except expat.ExpatError:
+                event = _decode_soup(xml)
+                stats.lap('beautifulsoup', start)
+                stats.count('beautifulsoup')
+            stats.count('decoded')
+            yield event
+        return
+    for chunk in range(first_chunk, last_chunk):
+        start = time.perf_counter()
+        for event in cache.chunk_events(evtx_file, chunk, event_ids):
+            stats.lap('cache', start)
+            stats.count('seen')
+            if first_record is not None and event['EventRecordID'] and \
+                    int(event['EventRecordID']) < first_record:
+                stats.count('skipped')
+                start = time.perf_counter()
+                continue
+            stats.count('cached')
+            yield event
+            start = time.perf_counter()
+
+def _run_task(task):
+    func, evtx_file, first_chunk, last_chunk, args = task
+    return func(evtx_file, first_chunk, last_chunk, args)
+
+def _run_stats_task(task):
+    # In a worker args is a copy, count the task on its own and send the
+    # counts back with the result for map_chunks to add up
+    func, evtx_file, first_chunk, last_chunk, args = task
+    args.stats = args.stats.new()
+    return func(evtx_file, first_chunk, last_chunk, args), args.stats
+
+def map_chunks(evtx_file, func, args, workers=1, record_order=False,
+               event_ids=None, flush=None):
+    """
+    Call func(evtx_file, first_chunk, last_chunk, args) for consecutive
+    ranges of chunks and yield each result in file order, or with
+    record_order in order of the chunks' first EventRecordID (a log that
+    wrapped around has its oldest records part way through the file).
+    func must be a module level function so it can be sent to the
+    worker processes when workers is more than 1.
+    With args.checkpoint (see evtx_checkpoint.py) only the chunks it
+    leaves to parse are handed to func, and the checkpoint is moved on
+    once each result has been consumed, after calling flush() (the
+    output's, so rows it buffered are written before the checkpoint
+    passes them). With args.since or args.until
+    (time_prefix text) chunks outside that window by more than
+    args.time_slack seconds are left out (see chunk_in_window), a
+    time_slack of 0 keeps them all. With args.index (an EvtxIndex, see evtx_index.py)
+    chunks the index shows hold none of event_ids are left out as well,
+    and the window is checked against the index's chunk times. With
+    args.stats (see evtx_stats.py) the counts of the worker processes
+    are added to it.
+    """
+    stats = getattr(args, 'stats', None)
+    tasks, progress = chunk_tasks(evtx_file, func, args, record_order,
+                                  event_ids)
+
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            if stats is None:
+                results = pool.imap(_run_task, tasks)
+            else:
+                results = _merge_stats(pool.imap(_run_stats_task, tasks), stats)
+            for task, result in zip(tasks, results):
+                yield result
+                if progress is not None:
+                    _checkpoint_done(progress, task, flush)
+    else:
+        for task in tasks:
+            yield _run_task(task)
+            if progress is not None:
+                _checkpoint_done(progress, task, flush)
+
+def _checkpoint_done(progress, task, flush):
+    if flush is not None:
+        flush()
+    progress.done(task[2], task[3])
+
+def chunk_tasks(evtx_file, func, args, record_order=False, event_ids=None):
+    """
+    The (func, evtx_file, first_chunk, last_chunk, args) tasks map_chunks
+    runs for evtx_file, left out and ordered as it describes, and the
+    checkpoint progress of the file (None without args.checkpoint) to
+    mark each task done on.
+    """
+    stats = getattr(args, 'stats', None)
+    chunks = range(evtx_chunk_count(evtx_file))
+    cache = getattr(args, 'cache', None)
+    if cache is not None:
+        # Hash the file once here rather than in every worker
+        cache.file_key(evtx_file)
+    progress = None
+    checkpoint = getattr(args, 'checkpoint', None)
+    if checkpoint is not None:
+        progress = checkpoint.start(evtx_file)
+        chunks = progress.chunks
+        args = copy.copy(args)
+        args.first_record = progress.first_record
+    since = getattr(args, 'since', None)
+    until = getattr(args, 'until', None)
+    index = getattr(args, 'index', None)
+    entries = index.chunks(evtx_file) if index else None
+    time_slack = getattr(args, 'time_slack', TIME_SLACK)
+    if (since is not None or until is not None) and time_slack:
+        times = entries if entries is not None else evtx_chunk_times(evtx_file)
+        kept = []
+        for chunk in chunks:
+            if chunk_in_window(times[chunk][:3], since, until, time_slack):
+                kept.append(chunk)
+            elif stats is not None:
+                stats.count('seen', times[chunk][0])
+                stats.count('skipped', times[chunk][0])
+                stats.count('chunks skipped by time')
+        chunks = kept
+    if entries is not None and event_ids is not None:
+        kept = []
+        for chunk in chunks:
+            chunk_ids = entries[chunk][3]
+            if chunk_ids is None or not chunk_ids.isdisjoint(event_ids):
+                kept.append(chunk)
+                continue
+            if progress is not None:
+                progress.skip(chunk)
+            if stats is not None:
+                stats.count('seen', entries[chunk][0])
+                stats.count('skipped', entries[chunk][0])
+                stats.count('chunks skipped by index')
+        chunks = kept
+    if record_order:
+        records = evtx_chunk_records(evtx_file)
+        chunks = sorted(chunks, key=lambda chunk: records[chunk][0])
+
+    # Runs of consecutive chunks, at most CHUNKS_PER_TASK long
+    ranges = []
+    for chunk in chunks:
+        if ranges and ranges[-1][1] == chunk and \
+                chunk - ranges[-1][0] < CHUNKS_PER_TASK:
+            ranges[-1][1] = chunk + 1
+        else:
+            ranges.append([chunk, chunk + 1])
+    tasks = [(func, evtx_file, first, last, args) for first, last in ranges]
+    return tasks, progress
+
+def pool_chunks(pool, tasks, stats=None, ahead=2):
+    """
+    Yield the results of tasks (see chunk_tasks) in order, run in pool, a
+    multiprocessing.Pool shared with other files, with at most ahead of
+    them queued at a time. Several files read this way through one pool
+    are parsed at the same time, each as far as it is consumed. With
+    stats the counts of the tasks are added to it.
+    """
+    tasks = iter(tasks)
+    run = _run_task if stats is None else _run_stats_task
+    queued = collections.deque()
+    while True:
+        while len(queued) < ahead:
+            task = next(tasks, None)
+            if task is None:
+                break
+            queued.append(pool.apply_async(run, (task,)))
+        if not queued:
+            return
+        result = queued.popleft().get()
+        if stats is not None:
+            result, task_stats = result
+            stats.merge(task_stats)
+        yield result
+
+def _merge_stats(results, stats):
+    for result, task_stats in results:
+        stats.merge(task_stats)
+        yield result
+
+def _soup_record(xml):
+    # The per-record work the scripts did before this module existed
+    from bs4 import BeautifulSoup, element
+
+    soup = BeautifulSoup(xml, "lxml")
+    Date = soup.event.system.timecreated['systemtime']
+    EventID = int(soup.event.system.eventid.string)
+    Computer = soup.event.system.computer.string
+    event_data = {}
+    if soup.eventdata is not None:
+        for child in soup.eventdata.children:
+            if type(child) is element.Tag:
+                event_data[child.get('name')] = ' '.join(child.text.split())
+    return Date, EventID, Computer, event_data
+
+def _decoder_record(xml):
+    event = decode_record(xml)
+    Date = event['SystemTime']
+    EventID = int(event['EventID'])
+    Computer = event['Computer']
+    event_data = {}
+    for name, text in event['EventData']:
+        event_data[name] = ' '.join(text.split())
+    return Date, EventID, Computer, event_data
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Compare records/sec of the shared decoder and the BeautifulSoup path",
+        usage='evtx_decoder.py Security.evtx -c 10000')
+    parser.add_argument("evtx", type=str,
+        help='Path to a Windows EVTX event log file')
+    parser.add_argument("-c", "--Count", type=int, default=0,
+        help="Stop after this many records (default all)")
+
+    args = parser.parse_args()
+
+    with open(args.evtx, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            xmls = []
+            records = []
+            start = time.perf_counter()
+            for xml, record in evtx_file_xml_view(fh):
+                xmls.append(xml)
+                records.append(record)
+                if len(xmls) == args.Count:
+                    break
+            render = time.perf_counter() - start
+
+            # Records decoded by their template extractors, compiling
+            # each template is part of the time
+            start = time.perf_counter()
+            events = [record_event(record) for record in records]
+            compiled = time.perf_counter() - start
+            extracted = sum(_compiled_event(record) is not None
+                            for record in records)
+
+    print('records,%d' % len(xmls))
+    print('render,%.1f records/sec' % (len(xmls) / render))
+    results = {}
+    for name, func in (('beautifulsoup', _soup_record),
+                       ('decoder', _decoder_record)):
+        start = time.perf_counter()
+        results[name] = [func(xml) for xml in xmls]
+        elapsed = time.perf_counter() - start
+        print('%s,%.1f records/sec' % (name, len(xmls) / elapsed))
+    if results['beautifulsoup'] != results['decoder']:
+        print('warning,decoder and BeautifulSoup results differ')
+    print('templates,%.1f records/sec (no rendering)' % (len(xmls) / compiled))
+    print('template records,%d of %d in %d templates' %
+          (extracted, len(xmls),
+           sum(extractor is not None for extractor in _template_extractors.values())))
+    if events != [decode_record(xml) for xml in xmls]:
+        print('warning,template and rendered results differ')
+
+if __name__ == "__main__":
+    main()
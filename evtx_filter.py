@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+# Compiled -i/-x/-m filters for the parse_evtx_*.py scripts
+#
+# The word lists are compiled once against the script's CSV columns and
+# checked on the column values before they are joined into a row, so a
+# rejected record costs one casefold of the row and one regular
+# expression search instead of a casefold and a scan per word.
+#
+# A word naming a column, like TargetUserName=admin, only matches that
+# column. Any other word matches the whole casefolded row, words are not
+# casefolded themselves, the same as before.
+
+import re
+
+class _Words(object):
+    """
+    One word list split into column scoped and whole row words.
+    """
+    def __init__(self, words, columns):
+        self.scoped = []
+        self.plain = []
+        lowered = [column.lower() for column in columns]
+        for word in words:
+            name, sep, text = word.partition('=')
+            if sep and name in columns:
+                self.scoped.append((columns.index(name), text))
+            elif sep and name.lower() in lowered:
+                self.scoped.append((lowered.index(name.lower()), text))
+            else:
+                self.plain.append(word)
+        self.pattern = None
+        if self.plain:
+            self.pattern = re.compile('|'.join(map(re.escape, self.plain)))
+
+    def any(self, fields, row):
+        for index, text in self.scoped:
+            if text in str(fields[index]).casefold():
+                return True
+        return self.pattern is not None and \
+            self.pattern.search(row()) is not None
+
+    def all(self, fields, row):
+        for index, text in self.scoped:
+            if text not in str(fields[index]).casefold():
+                return False
+        if self.plain:
+            folded = row()
+            return all(text in folded for text in self.plain)
+        return True
+
+class RowFilter(object):
+    """
+    The -i (any word), -x (no word) and -m (every word, -i is then
+    ignored) lists compiled for rows with these columns.
+    """
+    def __init__(self, columns, includes=None, excludes=None, matches=None):
+        columns = list(columns)
+        self.matches = _Words(matches, columns) if matches else None
+        self.includes = None
+        if includes and not matches:
+            self.includes = _Words(includes, columns)
+        self.excludes = _Words(excludes, columns) if excludes else None
+
+    def selected(self, fields):
+        """
+        Returns True when the row with these column values passes the
+        filters, every row is selected when none of them are given.
+        """
+        folded = []
+
+        def row():
+            if not folded:
+                folded.append(','.join(map(str, fields)).casefold())
+            return folded[0]
+
+        if self.matches and not self.matches.all(fields, row):
+            return False
+        if self.includes and not self.includes.any(fields, row):
+            return False
+        if self.excludes and self.excludes.any(fields, row):
+            return False
+        return True
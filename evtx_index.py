@@ -0,0 +1,222 @@
+#! /usr/bin/env python3
+# Sidecar EventID index for the parse_evtx_*.py scripts
+#
+# For every 64 KB chunk of an EVTX file the index keeps the number of
+# records, the first and last time they were written and the set of their
+# EventIDs, in a small JSON file next to the log (Security.evtx.idx). The
+# EventIDs are read from the template substitutions like the scripts'
+# prefilter does, only records where that fails are rendered.
+#
+# With --index a script reads the index of each file it parses (writing
+# it first when it is missing or out of date) and only hands the chunks
+# holding one of its EventIDs to the parser, --since/--until take the
+# chunk times from it as well. Running parse_evtx_logins.py, then
+# parse_evtx_account_changes.py, then other EventID queries on the same
+# file only visits the chunks each one needs.
+#
+# The index keeps the size, modification time, SHA-256 and fingerprint
+# (a hash of the file and chunk headers, which hold the checksums of the
+# records, see evtx_fingerprint) of the file it was built from. Each time
+# it is read the size and fingerprint are compared, so a file replaced by
+# another of the same size and modification time (a copy keeping times)
+# is indexed again. A file with another modification time is hashed and
+# only indexed again when the hash differs too. The index file gets the
+# permissions of the file it indexes.
+#
+# Run directly to build or check the indexes of some files, -l lists the
+# chunks:
+#     evtx_index.py Security.evtx System.evtx -w 4
+#     evtx_index.py Security.evtx -l
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
+
+import os
+import sys
+import json
+import mmap
+import stat
+import struct
+import tempfile
+import contextlib
+
+import argparse
+
+from Evtx.Evtx import FileHeader, ChunkHeader
+from Evtx.Views import evtx_record_xml_view
+
+from evtx_cache import file_sha256
+from evtx_decoder import decode_record, evtx_fingerprint, filetime_text, \
+    map_chunks, record_event_id
+
+index_format = {'format': 'parse_evtx index', 'version': 2}
+
+def index_path(evtx_file):
+    return evtx_file + '.idx'
+
+def index_chunks(evtx_file, first_chunk, last_chunk, args):
+    """
+    The [records, first, last, EventIDs] index entry of each chunk in the
+    range: first and last are written FILETIMEs (None without records),
+    EventIDs are sorted, or None when a record's EventID cannot be read.
+    """
+    entries = []
+    with open(evtx_file, 'r') as f:
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)) as buf:
+            fh = FileHeader(buf, 0x0)
+            for i in range(first_chunk, last_chunk):
+                chunk = ChunkHeader(buf, fh.header_chunk_size() + i * 0x10000)
+                records = 0
+                first = last = None
+                event_ids = set()
+                for record in chunk.records():
+                    records += 1
+                    written = struct.unpack_from('<Q', buf, record.offset() + 16)[0]
+                    if first is None or written < first:
+                        first = written
+                    if last is None or written > last:
+                        last = written
+                    if event_ids is None:
+                        continue
+                    event_id = record_event_id(record)
+                    if event_id is None:
+                        try:
+                            event = decode_record(evtx_record_xml_view(record))
+                            event_id = int(event['EventID'])
+                        except Exception:
+                            # Could hold anything, the chunk is always parsed
+                            event_ids = None
+                            continue
+                    event_ids.add(event_id)
+                entries.append([records, first, last,
+                                sorted(event_ids) if event_ids is not None else None])
+    return entries
+
+class EvtxIndex(object):
+    """
+    The sidecar indexes of the files a script parses, built with workers
+    processes when they are missing or out of date.
+    Can be sent to worker processes, the loaded indexes stay behind.
+    """
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.loaded = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['loaded'] = {}
+        return state
+
+    def chunks(self, evtx_file):
+        """
+        Returns the (records, first, last, EventIDs) of each chunk of
+        evtx_file, EventIDs a frozenset or None for any.
+        """
+        path = os.path.abspath(evtx_file)
+        if path not in self.loaded:
+            index = self.read(evtx_file)
+            if index is None:
+                index = self.build(evtx_file)
+            self.loaded[path] = [(records, first, last,
+                                  frozenset(event_ids) if event_ids is not None else None)
+                                 for records, first, last, event_ids in index['chunks']]
+        return self.loaded[path]
+
+    def read(self, evtx_file):
+        """
+        The index of evtx_file from its sidecar file, None when there is
+        none or it was built from other contents.
+        """
+        try:
+            with open(index_path(evtx_file)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(index, dict) or \
+                index.get('format') != index_format['format'] or \
+                index.get('version') != index_format['version']:
+            return None
+        st = os.stat(evtx_file)
+        if index['size'] != st.st_size or \
+                index['fingerprint'] != evtx_fingerprint(evtx_file):
+            return None
+        if index['mtime_ns'] != st.st_mtime_ns:
+            if index['sha256'] != file_sha256(evtx_file):
+                return None
+            # Same contents, a copy or a touch, hash it only once
+            index['mtime_ns'] = st.st_mtime_ns
+            self.save(evtx_file, index)
+        return index
+
+    def build(self, evtx_file):
+        """
+        Index evtx_file and write the sidecar file, returns the index.
+        """
+        st = os.stat(evtx_file)
+        index = dict(index_format)
+        index.update({'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                      'sha256': file_sha256(evtx_file),
+                      'fingerprint': evtx_fingerprint(evtx_file), 'chunks': []})
+        for entries in map_chunks(evtx_file, index_chunks, argparse.Namespace(),
+                                  self.workers):
+            index['chunks'].extend(entries)
+        self.save(evtx_file, index)
+        return index
+
+    def save(self, evtx_file, index):
+        path = index_path(evtx_file)
+        directory = os.path.dirname(os.path.abspath(path))
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f, separators=(',', ':'))
+            # mkstemp makes it readable by the owner only
+            os.chmod(temp, stat.S_IMODE(os.stat(evtx_file).st_mode))
+            os.replace(temp, path)
+        except OSError as e:
+            # Read-only evidence, the index is only used for this run
+            sys.stderr.write('cannot write index %s: %s\n' % (path, e))
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Build or check the EventID index the parse_evtx scripts use with --index",
+        usage='evtx_index.py Security.evtx System.evtx -w 4 -l')
+    parser.add_argument("evtx", type=str, nargs='+',
+        help='Paths to EVTX event log files')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="index chunks of each file in this many processes ( -w 8)")
+    parser.add_argument('-f', '--force', default=False, action="store_true",
+        help="index the files again even when their index is up to date")
+    parser.add_argument('-l', '--list', default=False, action="store_true",
+        help="print the records, times and EventIDs of each chunk")
+
+    args = parser.parse_args()
+
+    index = EvtxIndex(args.workers)
+    if args.list:
+        print('File,Chunk,Records,First,Last,EventIDs')
+    else:
+        print('File,Index,Chunks,Records,Status')
+    for evtx_file in args.evtx:
+        status = 'up to date'
+        entries = None if args.force else index.read(evtx_file)
+        if entries is None:
+            entries = index.build(evtx_file)
+            status = 'built'
+        chunks = entries['chunks']
+        if not args.list:
+            print('%s,%s,%d,%d,%s' % (evtx_file, index_path(evtx_file), len(chunks),
+                                      sum(chunk[0] for chunk in chunks), status))
+            continue
+        for i, (records, first, last, event_ids) in enumerate(chunks):
+            print('%s,%d,%d,%s,%s,%s' % (evtx_file, i, records,
+                filetime_text(first) if first is not None else '',
+                filetime_text(last) if last is not None else '',
+                ';'.join(map(str, event_ids)) if event_ids is not None else 'any'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+# Run options shared by the parse_evtx_*.py scripts
+#
+# --since/--until/--time-slack, --index, --cache, --checkpoint, --stats
+# and --profile work the same in every script. add_run_options() adds
+# them to a script's parser with that script's own examples,
+# check_run_options() checks them once parsed and replaces the option
+# strings with the objects map_chunks() and evtx_chunk_events() use
+# (args.cache, args.index, args.checkpoint, args.stats, args.profile).
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
+
+from evtx_cache import EvtxCache, CACHE_SIZE
+from evtx_index import EvtxIndex
+from evtx_checkpoint import Checkpoint
+from evtx_decoder import time_prefix, TIME_SLACK
+from evtx_stats import RunStats, RunProfile
+
+def add_run_options(parser, log='Security.evtx', checkpoint='logins.json',
+                    event_ids=True):
+    """
+    Add the run options to parser, log is the file name a script reads
+    and checkpoint a checkpoint file name for it, both only for the help
+    examples. Without event_ids (a script writing every EventID) --index
+    only gives the chunk times.
+    """
+    # argparse formats help with %
+    log = log.replace('%', '%%')
+    parser.add_argument('--since', type=time_prefix,
+        help="only records from this UTC time on ( --since \"2023-01-12 23:\"), records are kept by TimeCreated but whole chunks written more than --time-slack before it are skipped")
+    parser.add_argument('--until', type=time_prefix,
+        help="only records up to this UTC time or the end of this prefix of one ( --until \"2023-01-13 09\"), chunks written more than --time-slack after it are skipped")
+    parser.add_argument('--time-slack', type=int, default=TIME_SLACK,
+        help="seconds a record's TimeCreated may be from when it was written for --since/--until to still find it, raise it for forwarded events or hosts with a wrong clock, 0 reads every chunk (default %(default)s)")
+    if event_ids:
+        parser.add_argument('--index', default=False, action="store_true",
+            help="skip chunks without the script's Event IDs using the sidecar index of evtx_index.py ( %s.idx), written first when missing or out of date" % log)
+    else:
+        parser.add_argument('--index', default=False, action="store_true",
+            help="take the chunk times for --since/--until from the sidecar index of evtx_index.py ( %s.idx), written first when missing or out of date" % log)
+    parser.add_argument('--cache', type=str,
+        help="keep decoded records in this file for later runs ( --cache evtx_cache.db)")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+        help="size limit of the cache file in MB (default %(default)s)")
+    parser.add_argument('--checkpoint', type=str,
+        help="remember the last record parsed for each computer and channel in this file ( --checkpoint %s)" % checkpoint)
+    parser.add_argument('--since-checkpoint', default=False, action="store_true",
+        help="only parse records newer than the ones in --checkpoint")
+    parser.add_argument('--stats', default=False, action="store_true",
+        help="write the time of each stage and the records seen, matched, skipped and errored to stderr")
+    parser.add_argument('--stats-file', type=str,
+        help="write the --stats report to this JSON file instead ( --stats-file run.json)")
+    parser.add_argument('--profile', type=str,
+        help="dump a cProfile of the run to this file, see python -m pstats ( --profile run.prof)")
+
+def check_run_options(parser, args):
+    """
+    Check the run options of args and open what they name, exits through
+    parser.error() when they do not go together.
+    """
+    if args.cache:
+        args.cache = EvtxCache(args.cache, args.cache_size)
+    if args.index:
+        args.index = EvtxIndex(args.workers)
+    if args.checkpoint:
+        args.checkpoint = Checkpoint(args.checkpoint, args.since_checkpoint)
+    elif args.since_checkpoint:
+        parser.error("--since-checkpoint needs --checkpoint")
+    if args.checkpoint and (args.since or args.until):
+        # Records outside the window would be taken as parsed
+        parser.error("--since/--until do not take --checkpoint")
+    if args.time_slack < 0:
+        parser.error("--time-slack cannot be negative")
+    args.stats = RunStats(args.stats_file) if args.stats or args.stats_file else None
+    if args.profile:
+        args.profile = RunProfile(args.profile)
@@ -0,0 +1,273 @@
+#! /usr/bin/env python3
+# Output writers for the parse_evtx_*.py scripts
+#
+# The scripts hand their rows (a sequence of values per row, in column
+# order) to one of these writers instead of joining and printing each
+# line. Rows are kept in a buffer and written BATCH_ROWS at a time:
+#     csv      through the csv module, values holding a comma, a quote or
+#              a line break are quoted, to stdout or --output
+#     jsonl    one JSON object per row keyed by column name
+#     parquet  one row group per batch of string columns, --output only
+# Column names repeated in a header (the two ProcessID columns of the
+# tasks CSV) get a _2, _3 ... suffix as JSON keys and Parquet columns.
+#
+# Run directly to check the writers: rows crossing BATCH_ROWS (with a
+# repeated column, empty values and values to quote) are written in each
+# format and read back, the Parquet file's schema, row count and row
+# groups are compared as well. The exit status is 1 when one differs.
+#     evtx_output.py
+#     evtx_output.py --rows 25001 -f parquet
+#
+# Requires pyarrow https://arrow.apache.org/docs/python/ for parquet only
+
+import os
+import csv
+import sys
+import json
+import shutil
+import tempfile
+
+import argparse
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows buffered before they are written, and rows in a Parquet row group
+BATCH_ROWS = 10000
+
+formats = ('csv', 'jsonl', 'parquet')
+
+def unique_columns(columns):
+    """
+    columns with a _2, _3 ... suffix on names seen before.
+    """
+    seen = {}
+    names = []
+    for name in columns:
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else '%s_%d' % (name, seen[name]))
+    return names
+
+class RowOutput(object):
+    """
+    Buffers rows and writes them batch_rows at a time to path, to stdout
+    when path is None. Subclasses write a batch in write_batch().
+    """
+    def __init__(self, path, columns, header=True, batch_rows=BATCH_ROWS):
+        self.path = path
+        self.columns = list(columns)
+        self.batch_rows = batch_rows
+        self.rows = []
+        self.file = sys.stdout if path is None else self.open(path)
+        self.start(header)
+
+    def open(self, path):
+        return open(path, 'w', newline='')
+
+    def start(self, header):
+        pass
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows and hand them to the operating system, the
+        scripts call it before --checkpoint moves past them.
+        """
+        if self.rows:
+            self.write_batch(self.rows)
+            self.rows = []
+        if self.file is not None:
+            self.file.flush()
+
+    def write_batch(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+        if self.file is sys.stdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvOutput(RowOutput):
+    def start(self, header):
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        if header:
+            self.writer.writerow(self.columns)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+
+class JsonlOutput(RowOutput):
+    def start(self, header):
+        self.keys = unique_columns(self.columns)
+
+    def write_batch(self, rows):
+        keys = self.keys
+        self.file.write(''.join(json.dumps(dict(zip(keys, row))) + '\n'
+                                for row in rows))
+
+class ParquetOutput(RowOutput):
+    def __init__(self, path, columns, header=True, batch_rows=BATCH_ROWS):
+        if pyarrow is None:
+            raise ValueError("parquet output needs pyarrow (pip install pyarrow)")
+        if path is None:
+            raise ValueError("parquet output needs a file ( --output rows.parquet)")
+        self.schema = pyarrow.schema([(name, pyarrow.string())
+                                      for name in unique_columns(columns)])
+        RowOutput.__init__(self, path, columns, header, batch_rows)
+
+    def open(self, path):
+        # The ParquetWriter keeps the file
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        return None
+
+    def write_batch(self, rows):
+        arrays = [pyarrow.array([None if value is None else str(value)
+                                 for value in column], pyarrow.string())
+                  for column in zip(*rows)]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+outputs = {'csv': CsvOutput, 'jsonl': JsonlOutput, 'parquet': ParquetOutput}
+
+def open_output(format, path, columns, header=True, batch_rows=BATCH_ROWS):
+    """
+    The writer of format (one of formats) for rows of columns, header is
+    only written to CSV. Raises ValueError when the format cannot be
+    written (parquet without pyarrow or to stdout).
+    """
+    return outputs[format](path, columns, header, batch_rows)
+
+def check_rows(count):
+    """
+    count test rows for the self-check and their columns: a repeated
+    column, a None every few rows and values holding commas, quotes and
+    line breaks.
+    """
+    columns = ['Date', 'ProcessID', 'CommandLine', 'ProcessID']
+    rows = [('2023-01-12 23:%02d:%02d' % (i // 60 % 60, i % 60), str(i),
+             None if i % 5 == 0 else 'cmd.exe /c "echo %d, done"\nexit' % i,
+             str(i * 2))
+            for i in range(count)]
+    return columns, rows
+
+def read_back(format, path, columns):
+    """
+    The rows of a file written by check_output as lists of strings (None
+    for a missing value), and a list of what differs from the format's
+    schema.
+    """
+    problems = []
+    if format == 'csv':
+        with open(path, newline='') as f:
+            lines = list(csv.reader(f))
+        if lines[:1] != [columns]:
+            problems.append('header %s' % lines[:1])
+        # CSV has no None, an empty value reads back as ''
+        return [[value or None for value in line] for line in lines[1:]], problems
+    keys = unique_columns(columns)
+    if format == 'jsonl':
+        rows = []
+        with open(path) as f:
+            for line in f:
+                values = json.loads(line)
+                if list(values) != keys:
+                    problems.append('keys %s' % list(values))
+                    break
+                rows.append([values[key] for key in keys])
+        return rows, problems
+    parquet = pyarrow.parquet.ParquetFile(path)
+    expected = pyarrow.schema([(name, pyarrow.string()) for name in keys])
+    if not parquet.schema_arrow.equals(expected):
+        problems.append('schema %s' % parquet.schema_arrow)
+    table = parquet.read()
+    return [list(row.values()) for row in table.to_pylist()], problems
+
+def check_output(format, directory, count, batch_rows=BATCH_ROWS):
+    """
+    Write count test rows as format to a file in directory and read them
+    back, returns (rows, row groups or None, problems).
+    """
+    columns, rows = check_rows(count)
+    path = os.path.join(directory, 'rows.' + format)
+    output = open_output(format, path, columns, True, batch_rows)
+    # One at a time, as evtx_stats.write_rows hands them over
+    for row in rows:
+        output.write(row)
+    output.close()
+
+    groups = None
+    got, problems = read_back(format, path, columns)
+    if len(got) != count:
+        problems.append('%d rows read back' % len(got))
+    for i, (row, expected) in enumerate(zip(got, rows)):
+        if row != list(expected):
+            problems.append('row %d reads back as %s' % (i, row))
+            break
+    if format == 'parquet':
+        metadata = pyarrow.parquet.ParquetFile(path).metadata
+        groups = metadata.num_row_groups
+        if metadata.num_rows != count:
+            problems.append('%d rows in the metadata' % metadata.num_rows)
+        # One row group per batch
+        if groups != -(-count // batch_rows):
+            problems.append('%d row groups' % groups)
+    return len(got), groups, problems
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Check the csv, jsonl and parquet writers by writing rows past a "
+        "batch and reading them back",
+        usage='evtx_output.py --rows 25001 -f parquet')
+    parser.add_argument('--rows', type=int, default=2 * BATCH_ROWS + 1,
+        help="rows to write (default %(default)s)")
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS,
+        help="rows per batch and Parquet row group (default %(default)s)")
+    parser.add_argument('-f', '--formats', type=str, default=','.join(formats),
+        help="formats to check ( -f %s)" % ','.join(formats))
+    args = parser.parse_args()
+
+    selected = args.formats.split(',')
+    for format in selected:
+        if format not in formats:
+            parser.error("unknown format %s, choose from %s" % (format, ','.join(formats)))
+    if args.rows < 1 or args.batch_rows < 1:
+        parser.error("--rows and --batch-rows must be at least 1")
+
+    failed = 0
+    directory = tempfile.mkdtemp(prefix='evtx_output')
+    print('Format,Rows,Row groups,Status')
+    try:
+        for format in selected:
+            if format == 'parquet' and pyarrow is None:
+                print('parquet,,,needs pyarrow')
+                continue
+            count, groups, problems = check_output(format, directory, args.rows,
+                                                   args.batch_rows)
+            print('%s,%d,%s,%s' % (format, count, '' if groups is None else groups,
+                                   '; '.join(problems) or 'ok'))
+            failed += bool(problems)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#! /usr/bin/env python3
+# Per-stage timings and record counts for --stats, and --profile
+#
+# With --stats a script times each stage of its work (reading chunks or
+# lines, the EventID prefilter, decoding records from their templates'
+# substitutions, XML rendering and decoding of the others, BeautifulSoup
+# fallbacks, the script's own field extraction, -i/-x/-m filtering and
+# writing the rows) and counts the records seen, decoded (compiled when
+# from substitutions), matched (rows written), skipped and errored.
+# Records a script cannot turn into a row are counted with the first few
+# errors kept, without --stats they are written to stderr. The report
+# goes to stderr, or as JSON to the --stats-file given. Stage times of
+# -w worker processes are summed, so with workers they can add up to
+# more than the wall clock.
+#
+# --profile FILE dumps a cProfile of the main process to FILE, read it
+# with "python -m pstats FILE" (run with -w 1 to profile the parsing).
+
+import sys
+import json
+import time
+import cProfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Errors kept in the report, the rest are only counted
+ERROR_SAMPLES = 10
+
+# Counts in the order they are reported
+count_names = ('seen', 'decoded', 'matched', 'skipped', 'errors')
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the largest one of this process and its
+    waited for children (pool workers) on its own, not their sum, in MB,
+    None where the resource module is missing.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1048576 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+class RunStats(object):
+    """
+    Stage seconds and record counts of one run, reported to the JSON
+    file path or to stderr when path is None. Stages are timed with lap():
+        start = time.perf_counter()
+        ...
+        start = stats.lap('render', start)
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = dict.fromkeys(count_names, 0)
+        self.errors = []
+
+    def new(self):
+        """
+        An empty RunStats for the same report, for a worker to fill.
+        """
+        return RunStats(self.path)
+
+    def lap(self, stage, start):
+        """
+        Add the time since start to stage, returns the time now.
+        """
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - start
+        return now
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def error(self, where, error):
+        self.counts['errors'] += 1
+        if len(self.errors) < ERROR_SAMPLES:
+            self.errors.append('%s: %s: %s' % (where, type(error).__name__, error))
+
+    def merge(self, other, counts=True):
+        """
+        Add the stage times of other, and unless counts is False its
+        counts and errors.
+        """
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if not counts:
+            return
+        for name, n in other.counts.items():
+            self.count(name, n)
+        self.errors.extend(other.errors[:ERROR_SAMPLES - len(self.errors)])
+
+    def result(self):
+        wall = time.perf_counter() - self.start
+        rss = peak_rss_mb()
+        return {'command': sys.argv,
+                'wall_seconds': round(wall, 3),
+                'records_per_sec': round(self.counts['seen'] / wall, 1) if wall else None,
+                'peak_rss_mb': round(rss, 1) if rss is not None else None,
+                'stages': dict((stage, round(seconds, 3))
+                               for stage, seconds in self.stages.items()),
+                'counts': self.counts,
+                'errors': self.errors}
+
+    def report(self):
+        result = self.result()
+        if self.path is not None:
+            with open(self.path, 'w') as f:
+                json.dump(result, f, indent=1)
+                f.write('\n')
+            return
+        wall = result['wall_seconds'] or 1
+        lines = ['Stage,Seconds,Percent']
+        for stage, seconds in sorted(result['stages'].items(),
+                                     key=lambda item: -item[1]):
+            lines.append('%s,%.3f,%.1f' % (stage, seconds, seconds * 100.0 / wall))
+        lines.append('Count,Records')
+        for name, n in result['counts'].items():
+            lines.append('%s,%d' % (name, n))
+        lines.append('wall seconds,%.3f' % result['wall_seconds'])
+        lines.append('records/sec,%s' % result['records_per_sec'])
+        lines.append('largest process RSS MB,%s' % result['peak_rss_mb'])
+        for error in result['errors']:
+            lines.append('error,' + error)
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+class RunProfile(object):
+    """
+    cProfile of the run from now until save(), dumped to path.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def save(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+
+def timed(stats, stage, func, *args):
+    """
+    Returns func(*args), with stats (a RunStats or None) its time is
+    added to stage.
+    """
+    if stats is None:
+        return func(*args)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stats.lap(stage, start)
+
+def write_rows(stats, write, rows):
+    """
+    write(row) for each of rows, with stats timed as the output stage and
+    counted as matched.
+    """
+    if stats is None:
+        for row in rows:
+            write(row)
+        return
+    start = time.perf_counter()
+    for row in rows:
+        write(row)
+    stats.lap('output', start)
+    stats.count('matched', len(rows))
+
+def record_error(args, event, error):
+    """
+    Count a record the script could not turn into a row, to args.stats
+    with --stats, on stderr otherwise.
+    """
+    where = 'EventRecordID %s' % event.get('EventRecordID')
+    stats = getattr(args, 'stats', None)
+    if stats is not None:
+        stats.error(where, error)
+    else:
+        sys.stderr.write('%s skipped: %s: %s\n' % (where, type(error).__name__, error))
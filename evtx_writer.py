@@ -0,0 +1,338 @@
+#! /usr/bin/env python3
+# Write .evtx files of made up records for evtx_corpus.py
+#
+# A minimal writer of the EVTX format python-evtx reads: a 4 KB file
+# header, then 64 KB chunks of records in binary XML. Each record is the
+# Event/System/EventData (or UserData) of a template, the template is
+# written once per chunk for each layout of fields, and the record holds
+# only its substitution values, the way Windows writes its logs, so the
+# decoder and the EventID template lookups of evtx_decoder.py take the
+# same paths they take on real logs.
+#
+# Only the value types the corpus uses are written (strings, unsigned
+# integers, hex integers, GUIDs, SIDs and FILETIMEs, given as an int or a
+# naive UTC datetime).
+
+import uuid
+import struct
+import binascii
+
+# Substitution value types
+T_NULL = 0x00
+T_WSTR = 0x01
+T_U8 = 0x04
+T_U16 = 0x06
+T_U32 = 0x08
+T_U64 = 0x0A
+T_GUID = 0x0F
+T_FILETIME = 0x11
+T_SID = 0x13
+T_HEX32 = 0x14
+T_HEX64 = 0x15
+
+CHUNK_SIZE = 0x10000
+FILE_HEADER_SIZE = 0x1000
+CHUNK_HEADER_SIZE = 0x200
+
+# Event namespace of the Event element
+EVENT_NS = 'http://schemas.microsoft.com/win/2004/08/events/event'
+
+class Sub(object):
+    """
+    A substitution in a template, index into the record's values.
+    """
+    def __init__(self, index, vtype):
+        self.index = index
+        self.vtype = vtype
+
+def name_hash(name):
+    h = 0
+    for c in name:
+        h = (h * 65599 + ord(c)) & 0xFFFFFFFF
+    return h & 0xFFFF
+
+def filetime(dt):
+    """
+    FILETIME of a naive UTC datetime, 100ns intervals since 1601.
+    """
+    days = (dt.toordinal() - 584389)
+    return ((days * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second)
+            * 10**7 + dt.microsecond * 10)
+
+def encode_value(vtype, value):
+    if value is None or vtype == T_NULL:
+        return b''
+    if vtype == T_WSTR:
+        return (value + '\x00').encode('utf-16-le')
+    if vtype == T_U8:
+        return struct.pack('<B', value)
+    if vtype == T_U16:
+        return struct.pack('<H', value)
+    if vtype in (T_U32, T_HEX32):
+        return struct.pack('<I', value)
+    if vtype == T_FILETIME and not isinstance(value, int):
+        return struct.pack('<Q', filetime(value))
+    if vtype in (T_U64, T_HEX64, T_FILETIME):
+        return struct.pack('<Q', value)
+    if vtype == T_GUID:
+        return uuid.UUID(value).bytes_le
+    if vtype == T_SID:
+        parts = value.split('-')
+        revision, authority = int(parts[1]), int(parts[2])
+        subs = [int(part) for part in parts[3:]]
+        return struct.pack('<BB', revision, len(subs)) + \
+            authority.to_bytes(6, 'big') + \
+            b''.join(struct.pack('<I', sub) for sub in subs)
+    raise ValueError('unsupported value type %#x' % vtype)
+
+# Substitutions of the System element, the record's values start with
+# the ones of system_values
+def system_template(provider, guid, channel, computer):
+    return ('System', None, [
+        ('Provider', [('Name', provider), ('Guid', guid)], None),
+        ('EventID', [('Qualifiers', Sub(4, T_U16))], Sub(3, T_U16)),
+        ('Version', None, Sub(5, T_U8)),
+        ('Level', None, Sub(0, T_U8)),
+        ('Task', None, Sub(2, T_U16)),
+        ('Opcode', None, Sub(1, T_U8)),
+        ('Keywords', None, Sub(12, T_HEX64)),
+        ('TimeCreated', [('SystemTime', Sub(6, T_FILETIME))], None),
+        ('EventRecordID', None, Sub(7, T_U64)),
+        ('Correlation', [('ActivityID', Sub(8, T_GUID)),
+                         ('RelatedActivityID', Sub(9, T_GUID))], None),
+        ('Execution', [('ProcessID', Sub(10, T_U32)),
+                       ('ThreadID', Sub(11, T_U32))], None),
+        ('Channel', None, channel),
+        ('Computer', None, computer),
+        ('Security', [('UserID', Sub(13, T_SID))], None),
+    ])
+
+SYSTEM_VALUES = 14
+
+def system_values(record, record_id):
+    return [(T_U8, record.get('level', 0)), (T_U8, 0),
+            (T_U16, record.get('task', 0)), (T_U16, record['event_id']),
+            (T_U16, None), (T_U8, record.get('version', 0)),
+            (T_FILETIME, filetime(record['time'])), (T_U64, record_id),
+            (T_GUID, None), (T_GUID, None),
+            (T_U32, record.get('process_id', 4)),
+            (T_U32, record.get('thread_id', 100)),
+            (T_HEX64, record.get('keywords', 0x8020000000000000)),
+            (T_SID, record.get('user_sid'))]
+
+def record_template(record):
+    """
+    The (key, template) of a record, records with the same key share a
+    template. A record is a dict of
+        provider, guid, channel, computer, event_id, time (datetime)
+        event_data: [(name, type, value)] and event_data_name, or
+        user_data: (element, namespace, [(name, type, value)])
+    and optionally level, task, version, process_id, thread_id,
+    keywords and user_sid.
+    """
+    event_data = record.get('event_data')
+    user_data = record.get('user_data')
+    key = (record['provider'], record['guid'], record['channel'],
+           record['computer'], record.get('event_data_name'),
+           tuple((name, vtype) for name, vtype, value in event_data or ()),
+           user_data and (user_data[0], user_data[1],
+                          tuple((name, vtype) for name, vtype, value in user_data[2])))
+    children = [system_template(record['provider'], record['guid'],
+                                record['channel'], record['computer'])]
+    if event_data is not None:
+        attrs = None
+        if record.get('event_data_name'):
+            attrs = [('Name', record['event_data_name'])]
+        children.append(('EventData', attrs,
+            [('Data', [('Name', name)], Sub(SYSTEM_VALUES + i, vtype))
+             for i, (name, vtype, value) in enumerate(event_data)]))
+    if user_data is not None:
+        element, namespace, fields = user_data
+        children.append(('UserData', None, [(element, [('xmlns', namespace)],
+            [(name, None, Sub(SYSTEM_VALUES + i, vtype))
+             for i, (name, vtype, value) in enumerate(fields)])]))
+    return key, ('Event', [('xmlns', EVENT_NS)], children)
+
+def record_values(record, record_id):
+    fields = record.get('event_data')
+    if fields is None and record.get('user_data') is not None:
+        fields = record['user_data'][2]
+    return system_values(record, record_id) + \
+        [(vtype, value) for name, vtype, value in fields or ()]
+
+class ChunkWriter(object):
+    """
+    One 64 KB chunk being filled with records.
+    """
+    def __init__(self):
+        self.data = bytearray(CHUNK_HEADER_SIZE)
+        self.strings = {}
+        self.templates = {}
+        self.string_table = [0] * 64
+        self.template_table = [0] * 32
+        self.first = None
+        self.last = None
+        self.last_offset = 0
+
+    def _name(self, out, name, ref_pos):
+        """
+        Point the dword at out[ref_pos] at name, writing the name there
+        the first time it is used in the chunk.
+        """
+        if name in self.strings:
+            struct.pack_into('<I', out, ref_pos, self.strings[name])
+            return
+        offset = len(self.data) + len(out)
+        struct.pack_into('<I', out, ref_pos, offset)
+        self.strings[name] = offset
+        h = name_hash(name)
+        bucket = h % 64
+        out += struct.pack('<IHH', self.string_table[bucket], h, len(name)) + \
+            name.encode('utf-16-le') + b'\x00\x00'
+        self.string_table[bucket] = offset
+
+    def _element(self, out, node):
+        tag, attrs, content = node
+        start = len(out)
+        out += struct.pack('<BHII', 0x41 if attrs else 0x01, 0xFFFF, 0, 0)
+        self._name(out, tag, start + 7)
+        if attrs:
+            length_pos = len(out)
+            out += b'\x00\x00\x00\x00'
+            attrs_start = len(out)
+            for i, (name, value) in enumerate(attrs):
+                pos = len(out)
+                out += struct.pack('<BI', 0x46 if i < len(attrs) - 1 else 0x06, 0)
+                self._name(out, name, pos + 1)
+                self._content(out, value)
+            struct.pack_into('<I', out, length_pos, len(out) - attrs_start)
+        if not content:
+            out += b'\x03'
+        else:
+            out += b'\x02'
+            if isinstance(content, list):
+                for child in content:
+                    self._element(out, child)
+            else:
+                self._content(out, content)
+            out += b'\x04'
+        struct.pack_into('<I', out, start + 3, len(out) - start - 7)
+
+    def _content(self, out, value):
+        if isinstance(value, Sub):
+            # Optional substitution, an empty value leaves the element empty
+            out += struct.pack('<BHB', 0x0E, value.index, value.vtype)
+        else:
+            out += struct.pack('<BBH', 0x05, T_WSTR, len(value)) + \
+                value.encode('utf-16-le')
+
+    def _record(self, record_id, time, key, template, values):
+        out = bytearray()
+        out += struct.pack('<IIQQ', 0x00002a2a, 0, record_id, time)
+        out += b'\x0f\x01\x01\x00'
+        if key in self.templates:
+            offset, template_id = self.templates[key]
+            out += struct.pack('<BBII', 0x0C, 0x01, template_id, offset)
+        else:
+            offset = len(self.data) + len(out) + 10
+            guid = uuid.uuid5(uuid.NAMESPACE_OID, repr(key)).bytes_le
+            template_id = struct.unpack('<I', guid[:4])[0]
+            out += struct.pack('<BBII', 0x0C, 0x01, template_id, offset)
+            template_start = len(out)
+            out += struct.pack('<I', 0) + guid + struct.pack('<I', 0)
+            data_start = len(out)
+            out += b'\x0f\x01\x01\x00'
+            self._element(out, template)
+            out += b'\x00'
+            struct.pack_into('<I', out, template_start + 20, len(out) - data_start)
+            self.templates[key] = (offset, template_id)
+            bucket = template_id % 32
+            struct.pack_into('<I', out, template_start, self.template_table[bucket])
+            self.template_table[bucket] = offset
+        blobs = [encode_value(vtype, value) for vtype, value in values]
+        out += struct.pack('<I', len(values))
+        for (vtype, value), blob in zip(values, blobs):
+            out += struct.pack('<HBB', len(blob), vtype if value is not None else T_NULL, 0)
+        for blob in blobs:
+            out += blob
+        out += struct.pack('<I', len(out) + 4)
+        struct.pack_into('<I', out, 4, len(out))
+        return out
+
+    def add(self, record_id, time, key, template, values):
+        """
+        Add a record, False (leaving the chunk as it was) when it does
+        not fit.
+        """
+        state = (dict(self.strings), dict(self.templates),
+                 list(self.string_table), list(self.template_table))
+        data = self._record(record_id, time, key, template, values)
+        if len(self.data) + len(data) > CHUNK_SIZE:
+            self.strings, self.templates, self.string_table, self.template_table = state
+            return False
+        self.last_offset = len(self.data)
+        self.data += data
+        if self.first is None:
+            self.first = record_id
+        self.last = record_id
+        return True
+
+    def finish(self):
+        free_offset = len(self.data)
+        self.data += bytes(CHUNK_SIZE - len(self.data))
+        header = struct.pack('<8sQQQQIII', b'ElfChnk\x00', self.first, self.last,
+                             self.first, self.last, 0x80, self.last_offset,
+                             free_offset)
+        self.data[0:len(header)] = header
+        for i, offset in enumerate(self.string_table):
+            struct.pack_into('<I', self.data, 0x80 + 4 * i, offset)
+        for i, offset in enumerate(self.template_table):
+            struct.pack_into('<I', self.data, 0x180 + 4 * i, offset)
+        struct.pack_into('<I', self.data, 0x34,
+            binascii.crc32(bytes(self.data[CHUNK_HEADER_SIZE:free_offset])))
+        struct.pack_into('<I', self.data, 0x7C,
+            binascii.crc32(bytes(self.data[0:0x78]) + bytes(self.data[0x80:0x200])))
+        return bytes(self.data)
+
+class EvtxWriter(object):
+    """
+    Writes records (see record_template) to a new .evtx file at path,
+    numbered from 1, a chunk at a time.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(bytes(FILE_HEADER_SIZE))
+        self.chunk = ChunkWriter()
+        self.chunks = 0
+        self.records = 0
+
+    def write(self, record):
+        self.records += 1
+        key, template = record_template(record)
+        values = record_values(record, self.records)
+        time = filetime(record['time'])
+        if not self.chunk.add(self.records, time, key, template, values):
+            self.file.write(self.chunk.finish())
+            self.chunks += 1
+            self.chunk = ChunkWriter()
+            if not self.chunk.add(self.records, time, key, template, values):
+                raise ValueError('record %d does not fit in a chunk' % self.records)
+
+    def close(self):
+        if self.chunk.first is not None:
+            self.file.write(self.chunk.finish())
+            self.chunks += 1
+        header = bytearray(0x80)
+        struct.pack_into('<8sQQQIHHHH', header, 0, b'ElfFile\x00', 0,
+                         max(self.chunks - 1, 0), self.records + 1, 0x80, 1, 3,
+                         FILE_HEADER_SIZE, self.chunks)
+        struct.pack_into('<I', header, 0x7C, binascii.crc32(bytes(header[:0x78])))
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
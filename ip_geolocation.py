@@ -0,0 +1,229 @@
+#! /usr/bin/env python3
+# Country lookups of IP addresses for ipv4inevtx.py
+#
+# Addresses are looked up in-process in a MaxMind format country database
+# (GeoLite2-Country.mmdb or GeoIP2-Country.mmdb) and the answers kept in
+# an LRU cache. Without a database, or without the maxminddb module, each
+# address is looked up by running geoiplookup as before.
+# A lookup returns "US United States", "Non-Internet" for an address that
+# is not in the database, or "-".
+#
+# Run directly to look up addresses, or to write a small database of a
+# few test networks to check the lookups without downloading one:
+#     ip_geolocation.py 8.8.8.8 10.0.0.1 -g GeoLite2-Country.mmdb
+#     ip_geolocation.py --make-test-db test.mmdb
+#
+# Optionally uses maxminddb https://github.com/maxmind/MaxMind-DB-Reader-python
+
+import os
+import sys
+import time
+import functools
+import ipaddress
+import subprocess
+
+import argparse
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+# Where a database is looked for when none is given
+DATABASE_PATHS = ('/usr/share/GeoIP/GeoLite2-Country.mmdb',
+                  '/var/lib/GeoIP/GeoLite2-Country.mmdb',
+                  '/usr/local/share/GeoIP/GeoLite2-Country.mmdb')
+
+# Addresses kept in the LRU cache
+CACHE_SIZE = 65536
+
+# Networks of the database written by --make-test-db
+test_networks = (('1.1.1.0/24', 'AU', 'Australia'),
+                 ('8.8.8.0/24', 'US', 'United States'),
+                 ('81.2.69.0/24', 'GB', 'United Kingdom'),
+                 ('89.160.20.0/24', 'SE', 'Sweden'),
+                 ('175.16.199.0/24', 'CN', 'China'),
+                 ('216.160.83.0/24', 'US', 'United States'))
+
+def geoiplookup(ip):
+    """
+    Country of ip from the geoiplookup command.
+    """
+    try:
+        result = subprocess.run(['geoiplookup', ip], capture_output=True, text=True)
+        if result.returncode == 0:
+            output = result.stdout
+            if "IP Address not found" in output:
+                return "Non-Internet"
+            if "GeoIP Country Edition" in output:
+                parts = output.split(':')
+                if len(parts) > 1:
+                    country_info = parts[1].strip()
+                    country_parts = country_info.split(',')
+                    if len(country_parts) > 1:
+                        country_code = country_parts[0].strip()
+                        country_name = country_parts[1].strip()
+                        return f"{country_code} {country_name}"
+        return "-"  # Return a dash if no valid country code is found
+    except Exception:
+        return "-"  # Return a dash in case of an error
+
+def find_database():
+    for path in DATABASE_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+class GeoIP(object):
+    """
+    Country lookups in the MaxMind database at database (the first of
+    DATABASE_PATHS found when None), through geoiplookup when there is
+    none. The last cache_size answers are kept.
+    """
+    def __init__(self, database=None, cache_size=CACHE_SIZE):
+        self.reader = None
+        if database is None:
+            database = find_database()
+        elif not os.path.exists(database):
+            sys.stderr.write('%s not found, using geoiplookup\n' % database)
+            database = None
+        if database is not None:
+            if maxminddb is None:
+                sys.stderr.write('maxminddb is not installed, using geoiplookup\n')
+            else:
+                self.reader = maxminddb.open_database(database)
+        self.database = database if self.reader is not None else None
+        self.country = functools.lru_cache(maxsize=cache_size)(self._country)
+
+    def _country(self, ip):
+        if self.reader is None:
+            return geoiplookup(ip)
+        try:
+            record = self.reader.get(ip)
+        except ValueError:
+            return "-"
+        if record is None:
+            return "Non-Internet"
+        country = record.get('country') or record.get('registered_country')
+        if not country or 'iso_code' not in country:
+            return "-"
+        name = country.get('names', {}).get('en')
+        if not name:
+            return "-"
+        return f"{country['iso_code']} {name}"
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+
+def _mmdb_control(data_type, size):
+    """
+    Control byte(s) of a MaxMind DB data section field.
+    """
+    if size < 29:
+        first, extra = size, b''
+    elif size < 285:
+        first, extra = 29, bytes([size - 29])
+    elif size < 65821:
+        first, extra = 30, (size - 285).to_bytes(2, 'big')
+    else:
+        first, extra = 31, (size - 65821).to_bytes(3, 'big')
+    if data_type <= 7:
+        return bytes([data_type << 5 | first]) + extra
+    # Extended types
+    return bytes([first, data_type - 7]) + extra
+
+def _mmdb_uint(data_type, value, size):
+    data = value.to_bytes(size, 'big').lstrip(b'\0')
+    return _mmdb_control(data_type, len(data)) + data
+
+def _mmdb_encode(value):
+    if isinstance(value, dict):
+        return _mmdb_control(7, len(value)) + b''.join(
+            _mmdb_encode(key) + _mmdb_encode(item) for key, item in value.items())
+    if isinstance(value, list):
+        return _mmdb_control(11, len(value)) + b''.join(map(_mmdb_encode, value))
+    if isinstance(value, bytes):
+        # Already encoded, for the typed metadata integers
+        return value
+    data = value.encode('utf-8')
+    return _mmdb_control(2, len(data)) + data
+
+def write_test_database(path, networks=test_networks):
+    """
+    Write an IPv4 country database in MaxMind DB format with networks,
+    (cidr, iso_code, english_name) tuples that do not overlap.
+    """
+    data = b''
+    offsets = {}
+    # Trie of the network bits, an entry is a node number, a data offset
+    # (as a tuple) or None
+    nodes = [[None, None]]
+    for cidr, iso_code, name in networks:
+        if (iso_code, name) not in offsets:
+            offsets[(iso_code, name)] = len(data)
+            data += _mmdb_encode({'country': {'iso_code': iso_code,
+                                              'names': {'en': name}}})
+        network = ipaddress.IPv4Network(cidr)
+        bits = int(network.network_address)
+        node = 0
+        for depth in range(network.prefixlen - 1):
+            bit = bits >> (31 - depth) & 1
+            if nodes[node][bit] is None:
+                nodes[node][bit] = len(nodes)
+                nodes.append([None, None])
+            node = nodes[node][bit]
+        bit = bits >> (32 - network.prefixlen) & 1
+        nodes[node][bit] = (offsets[(iso_code, name)],)
+
+    node_count = len(nodes)
+
+    def record(entry):
+        if entry is None:
+            return node_count
+        if isinstance(entry, tuple):
+            return node_count + 16 + entry[0]
+        return entry
+
+    tree = b''.join(record(left).to_bytes(3, 'big') + record(right).to_bytes(3, 'big')
+                    for left, right in nodes)
+    metadata = _mmdb_encode({
+        'binary_format_major_version': _mmdb_uint(5, 2, 2),
+        'binary_format_minor_version': _mmdb_uint(5, 0, 2),
+        'build_epoch': _mmdb_uint(9, int(time.time()), 8),
+        'database_type': 'Test-Country',
+        'description': {'en': 'ip_geolocation.py test database'},
+        'ip_version': _mmdb_uint(5, 4, 2),
+        'languages': ['en'],
+        'node_count': _mmdb_uint(6, node_count, 4),
+        'record_size': _mmdb_uint(5, 24, 2)
+    })
+    with open(path, 'wb') as f:
+        f.write(tree + b'\0' * 16 + data + b'\xab\xcd\xefMaxMind.com' + metadata)
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Look up the country of IP addresses the way ipv4inevtx.py does",
+        usage='ip_geolocation.py 8.8.8.8 -g GeoLite2-Country.mmdb')
+    parser.add_argument("ips", type=str, nargs='*',
+        help='IP addresses to look up')
+    parser.add_argument('-g', '--geoip-db', type=str,
+        help="MaxMind country database (default the first of %s)" % ', '.join(DATABASE_PATHS))
+    parser.add_argument('--make-test-db', type=str,
+        help="write a database of a few test networks to this file")
+
+    args = parser.parse_args()
+
+    if args.make_test_db:
+        write_test_database(args.make_test_db)
+        if args.geoip_db is None:
+            args.geoip_db = args.make_test_db
+
+    geoip = GeoIP(args.geoip_db)
+    print('IP Address,Country,Source')
+    for ip in args.ips:
+        print('%s,%s,%s' % (ip, geoip.country(ip), geoip.database or 'geoiplookup'))
+    geoip.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,154 @@
 import os
 import csv
 import argparse
-import subprocess
 import re
-import json
 import sys
+import time
+import ipaddress
 
-def extract_ip_addresses_from_json(json_file, search_eventid):
-    ip_addresses = set()  # Use a set to store unique IP addresses
+from evtx_stats import RunStats, RunProfile, timed, write_rows
+from ip_geolocation import GeoIP, CACHE_SIZE
+from jsonl_reader import jsonl_batches, loads, projection
+
+# Addresses left out of the results unless -x gives other lists
+default_exclusions = ('100.0.0.0/8', '127.0.0.0/8', '224.0.0.0/8', '239.0.0.0/8')
+
+# Finds the runs of digits and dots in a raw line that hold a dotted quad
+quad_regex = re.compile(rb'\.\d{1,3}\.\d{1,3}\.\d')
+run_bytes = frozenset(b'0123456789.')
+
+class Networks(object):
+    """
+    A set of IPv4 networks, looking up an address takes one set lookup
+    per prefix length in use.
+    """
+    def __init__(self, networks):
+        prefixes = {}
+        for network in networks:
+            network = ipaddress.IPv4Network(network, strict=False)
+            shift = 32 - network.prefixlen
+            prefixes.setdefault(shift, set()).add(int(network.network_address) >> shift)
+        self.prefixes = sorted(prefixes.items(), reverse=True)
+
+    def __contains__(self, address):
+        for shift, networks in self.prefixes:
+            if address >> shift in networks:
+                return True
+        return False
+
+def load_networks(path):
+    """
+    The networks in a file of one CIDR per line, # starts a comment.
+    """
+    networks = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                networks.append(line)
+    return networks
+
+def ip_number(ip):
+    a, b, c, d = map(int, ip.split('.'))
+    return a << 24 | b << 16 | c << 8 | d
+
+def has_candidate(line, excluded):
+    """
+    True when the raw line holds a dotted quad that is a valid address
+    outside excluded, lines without one cannot give any result.
+    Every quad of a run of digits and dots is tried, the first octet as
+    each of the last 1 to 3 digits of its group (the digits before it may
+    end a \\u escape), so any address the field regex finds in the decoded
+    line is among them.
+    """
+    match = quad_regex.search(line)
+    while match is not None:
+        start, end = match.start(), match.end()
+        while start > 0 and line[start - 1] in run_bytes:
+            start -= 1
+        while end < len(line) and line[end] in run_bytes:
+            end += 1
+        groups = line[start:end].split(b'.')
+        for i in range(len(groups) - 3):
+            b, c, d = groups[i + 1:i + 4]
+            if not (0 < len(b) <= 3 and 0 < len(c) <= 3 and 0 < len(d) <= 3):
+                continue
+            b, c, d = int(b), int(c), int(d)
+            if b > 255 or c > 255 or d > 255:
+                continue
+            for digits in range(1, min(len(groups[i]), 3) + 1):
+                a = int(groups[i][-digits:])
+                if a <= 255 and (a << 24 | b << 16 | c << 8 | d) not in excluded:
+                    return True
+        match = quad_regex.search(line, end)
+    return False
+
+class IPHit(object):
+    """
+    Hits of one (ip, event_id, log_name, field) key: how many, the first
+    and last SystemTime seen and the Field_Info of the first hit.
+    """
+    __slots__ = ('count', 'first', 'last', 'sample')
+
+    def __init__(self, sample, timestamp):
+        self.count = 1
+        self.first = timestamp
+        self.last = timestamp
+        self.sample = sample
+
+class IPStore(object):
+    """
+    Addresses found in the logs counted by (ip, event_id, log_name, field).
+    Only the keys, with their strings interned, and one sample value are
+    held, so memory grows with the distinct keys and not with the records.
+    """
+    def __init__(self):
+        self.hits = {}
+
+    def add(self, ip, event_id, log_name, field, sample, timestamp=None):
+        key = (sys.intern(ip), sys.intern(event_id), sys.intern(log_name), sys.intern(field))
+        hit = self.hits.get(key)
+        if hit is None:
+            self.hits[key] = IPHit(sample, timestamp)
+            return
+        hit.count += 1
+        if timestamp:
+            if hit.first is None or timestamp < hit.first:
+                hit.first = timestamp
+            if hit.last is None or timestamp > hit.last:
+                hit.last = timestamp
+
+    def counts(self):
+        return dict((key, hit.count) for key, hit in self.hits.items())
+
+    def items(self, by_count=False):
+        """
+        The (key, IPHit) pairs in the order first seen, or most hits first.
+        """
+        items = list(self.hits.items())
+        if by_count:
+            items.sort(key=lambda item: item[1].count, reverse=True)
+        return items
+
+# SystemTime of a decoded record
+event_time = projection([('Event', 'System', 'TimeCreated', '#attributes', 'SystemTime')])
+
+def extract_ip_addresses_from_json(json_file, search_eventid, excluded, store=None, raw_scan=False,
+                                   stats=None):
+    """
+    Count the addresses outside excluded (a Networks) found in json_file
+    into store, a new IPStore when None, and return it.
+    With raw_scan only lines whose raw bytes hold such an address are
+    decoded. With stats (a RunStats) the stages are timed and the lines
+    counted into it.
+    """
+    if store is None:
+        store = IPStore()
+    log_name = os.path.basename(json_file)  # Use only the filename
 
     # Updated regex to match valid IPv4 addresses
     ip_regex = re.compile(r'(?<!\d)(?<!\d\.)\b(?:[1-9]\d{0,2}|1\d{0,2}|2[0-4]\d|25[0-5])\.(?:[0-9]{1,3}\.){2}(?:[0-9]{1,3})(?!\.\d)(?!\d)')
-    event_id_regex = re.compile(r'"EventID"\s*:\s*(\d+)')
+    event_id_regex = re.compile(rb'"EventID"\s*:\s*(\d+)')
 
     def is_valid_ipv4(ip):
         parts = ip.split('.')
@@ -22,106 +159,157 @@ def extract_ip_addresses_from_json(json_file, search_eventid):
                 return False
         return True
 
-    def find_ips_in_dict(d, log_name, event_id):
+    def find_ips_in_dict(d, event_id, timestamp):
         for key, value in d.items():
             if isinstance(value, str):
-                ips = ip_regex.findall(value)
-                for ip in ips:
+                if value.count('.') < 3:
+                    continue
+                field_info = None
+                for ip in set(ip_regex.findall(value)):
                     # Exclude IPs that start or end with a period
-                    if is_valid_ipv4(ip) and not (ip.startswith('.') or ip.endswith('.')):
-                        ip_addresses.add((ip, event_id, log_name, key, value))
+                    if not is_valid_ipv4(ip) or ip.startswith('.') or ip.endswith('.'):
+                        continue
+                    # Exclude IPs in the excluded networks
+                    if ip_number(ip) in excluded:
+                        continue
+                    if field_info is None:
+                        # Combine field name and content, and remove line breaks
+                        field_info = f"{key}: {value}".replace('\n', ' ').replace('\r', ' ')
+                    # Skip hits where "version" is in the "Field_Info"
+                    if "version" in field_info.lower():
+                        break
+                    store.add(ip, event_id, log_name, key, field_info, timestamp)
             elif isinstance(value, dict):
-                find_ips_in_dict(value, log_name, event_id)
+                find_ips_in_dict(value, event_id, timestamp)
 
-    with open(json_file, 'r') as file:
-        for line in file:
+    start = time.perf_counter()
+    for lines in jsonl_batches(json_file):
+        if stats is not None:
+            stats.lap('read', start)
+            stats.count('seen', len(lines))
+        for line in lines:
+            if raw_scan and not timed(stats, 'prescan', has_candidate, line, excluded):
+                if stats is not None:
+                    stats.count('skipped')
+                continue
             try:
                 event_id = "No EventID"
                 if search_eventid:
                     # Search for EventID in the JSON string
                     event_id_match = event_id_regex.search(line)
-                    event_id = event_id_match.group(1) if event_id_match else "No EventID"
+                    event_id = event_id_match.group(1).decode() if event_id_match else "No EventID"
 
-                event = json.loads(line)
-                find_ips_in_dict(event, os.path.basename(json_file), event_id)  # Use only the filename
-            except json.JSONDecodeError:
+                event = timed(stats, 'decode', loads, line)
+                if stats is not None:
+                    stats.count('decoded')
+                timed(stats, 'search', find_ips_in_dict, event, event_id, event_time(event)[0])
+            except ValueError as e:
                 # Suppress JSON decoding errors
+                if stats is not None:
+                    stats.error('JSON line', e)
                 continue
+        start = time.perf_counter()
 
-    return ip_addresses
-
-def get_geolocation(ip):
-    try:
-        result = subprocess.run(['geoiplookup', ip], capture_output=True, text=True)
-        if result.returncode == 0:
-            output = result.stdout
-            if "IP Address not found" in output:
-                return "Non-Internet"
-            if "GeoIP Country Edition" in output:
-                parts = output.split(':')
-                if len(parts) > 1:
-                    country_info = parts[1].strip()
-                    country_parts = country_info.split(',')
-                    if len(country_parts) > 1:
-                        country_code = country_parts[0].strip()
-                        country_name = country_parts[1].strip()
-                        return f"{country_code} {country_name}"
-        return "-"  # Return a dash if no valid country code is found
-    except Exception:
-        return "-"  # Return a dash in case of an error
-
-def process_json_file(json_file, search_eventid):
-    ip_addresses = extract_ip_addresses_from_json(json_file, search_eventid)
+    return store
+
+def ip_results(store, search_eventid, geoip, by_count=False):
+    """
+    The CSV rows of the addresses in store.
+    """
+    # Look up each address once, however many rows it is in
+    countries = dict((ip, geoip.country(ip)) for ip in set(key[0] for key in store.hits))
     results = []
-    for ip, event_id, log_name, field_name, field_content in ip_addresses:
-        # Exclude IPs that start with 100, 127, 239, or 224
-        if ip.startswith(('100.', '127.', '239.', '224.')):
-            continue
-        # Combine field name and content, and remove line breaks
-        field_info = f"{field_name}: {field_content}".replace('\n', ' ').replace('\r', ' ')
-        # Skip rows where "version" is in the "Field_Info"
-        if "version" in field_info.lower():
-            continue
-        country = get_geolocation(ip)
+    for (ip, event_id, log_name, field_name), hit in store.items(by_count):
+        country = countries[ip]
         # Prepare the result based on whether EventID is included
         if search_eventid:
-            result = [ip, country, event_id, log_name, field_info]
+            result = [ip, country, event_id, log_name, hit.sample]
         else:
-            result = [ip, country, log_name, field_info]
+            result = [ip, country, log_name, hit.sample]
+        result += [str(hit.count), hit.first or '-', hit.last or '-']
         # Replace commas with semicolons in all fields
         result = [field.replace(',', ';') for field in result]
         results.append(result)
     return results
 
+def benchmark(json_files, search_eventid, excluded):
+    print('path,seconds,MB/sec,addresses')
+    size = sum(os.path.getsize(json_file) for json_file in json_files)
+    found = {}
+    for name, raw_scan in (('decode every line', False), ('raw scan', True)):
+        start = time.perf_counter()
+        store = IPStore()
+        for json_file in json_files:
+            extract_ip_addresses_from_json(json_file, search_eventid, excluded, store, raw_scan)
+        elapsed = time.perf_counter() - start
+        found[name] = store.counts()
+        print('%s,%.2f,%.1f,%d' % (name, elapsed, size / elapsed / 1024 / 1024, len(found[name])))
+    if found['decode every line'] != found['raw scan']:
+        print('the two paths found different addresses')
+
 def main():
-    parser = argparse.ArgumentParser(description='Extract unique IP addresses from JSON logs.')
+    parser = argparse.ArgumentParser(description='Extract unique IP addresses from JSON logs with how often and when they were seen.')
     parser.add_argument('-f', '--file', help='Single JSON or JSONL file to process')
     parser.add_argument('-d', '--directory', help='Directory of JSON or JSONL files to process')
     parser.add_argument('-e', '--eventid', action='store_true', help='Include search for EventID')
+    parser.add_argument('-g', '--geoip-db', help='MaxMind country database (GeoLite2-Country.mmdb), geoiplookup is run when there is none')
+    parser.add_argument('--geoip-cache', type=int, default=CACHE_SIZE, help='Countries of this many IP addresses are kept in memory (default %(default)s)')
+    parser.add_argument('-x', '--exclusions', action='append', help='File of CIDR networks to leave out, one per line (default %s), can be given more than once ( -x ipv4_exclusions.txt)' % ','.join(default_exclusions))
+    parser.add_argument('-r', '--raw-scan', action='store_true', help='Only decode lines whose raw text holds an address outside the excluded networks')
+    parser.add_argument('-s', '--sort-count', action='store_true', help='Write the addresses with the most hits first')
+    parser.add_argument('--benchmark', action='store_true', help='Time extracting the addresses with and without --raw-scan instead of writing the CSV')
+    parser.add_argument('--stats', default=False, action='store_true',
+        help='write the time of each stage and the records seen, matched, skipped and errored to stderr')
+    parser.add_argument('--stats-file', type=str,
+        help='write the --stats report to this JSON file instead ( --stats-file run.json)')
+    parser.add_argument('--profile', type=str,
+        help='dump a cProfile of the run to this file, see python -m pstats ( --profile run.prof)')
     args = parser.parse_args()
 
-    all_results = []
-
     if args.file:
-        all_results.extend(process_json_file(args.file, args.eventid))
+        json_files = [args.file]
     elif args.directory:
-        for filename in os.listdir(args.directory):
-            if filename.endswith('.json') or filename.endswith('.jsonl'):
-                all_results.extend(process_json_file(os.path.join(args.directory, filename), args.eventid))
+        json_files = [os.path.join(args.directory, filename) for filename in os.listdir(args.directory)
+                      if filename.endswith('.json') or filename.endswith('.jsonl')]
     else:
         print("Please provide a JSON file or directory to process.")
         return
 
+    if args.exclusions:
+        excluded = Networks(network for path in args.exclusions for network in load_networks(path))
+    else:
+        excluded = Networks(default_exclusions)
+
+    if args.benchmark:
+        benchmark(json_files, args.eventid, excluded)
+        return
+
+    geoip = GeoIP(args.geoip_db, args.geoip_cache)
+    args.stats = RunStats(args.stats_file) if args.stats or args.stats_file else None
+    if args.profile:
+        args.profile = RunProfile(args.profile)
+
+    store = IPStore()
+    for json_file in json_files:
+        extract_ip_addresses_from_json(json_file, args.eventid, excluded, store, args.raw_scan,
+                                       args.stats)
+    all_results = timed(args.stats, 'geoip', ip_results, store, args.eventid, geoip,
+                        args.sort_count)
+
     if all_results:
         # Use csv.writer to write to sys.stdout
         csv_writer = csv.writer(sys.stdout)
         # Write the header row based on whether EventID is included
         if args.eventid:
-            csv_writer.writerow(['IP Address', 'Country', 'EventID', 'Event Log Name', 'Field_Info'])
+            csv_writer.writerow(['IP Address', 'Country', 'EventID', 'Event Log Name', 'Field_Info', 'Count', 'First Seen', 'Last Seen'])
         else:
-            csv_writer.writerow(['IP Address', 'Country', 'Event Log Name', 'Field_Info'])
+            csv_writer.writerow(['IP Address', 'Country', 'Event Log Name', 'Field_Info', 'Count', 'First Seen', 'Last Seen'])
         # Write all results
-        csv_writer.writerows(all_results)
+        write_rows(args.stats, csv_writer.writerow, all_results)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+# Shared JSONL reader for the JSONL based scripts
+#
+# Reads the file in binary batches of lines and decodes each line with
+# orjson when it is installed, lines orjson rejects (NaN, integers over
+# 64 bits, lone surrogates) and systems without orjson use the json
+# module. Given key paths, only the values at those paths are kept for
+# each record, looked up by a function compiled once for those paths.
+#
+# With stats (a RunStats of evtx_stats.py) read_jsonl times the reading
+# and decoding of each batch and counts the lines seen, decoded and
+# skipped as errors.
+#
+# Run directly to compare records/sec against json.loads on every line:
+#     jsonl_reader.py Security.evtx.jsonl
+#
+# Optionally uses orjson https://github.com/ijl/orjson
+
+import json
+import time
+
+import argparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Lines are read in batches of about this many bytes
+BATCH_SIZE = 1024 * 1024
+
+def loads(line):
+    """
+    Decode one JSON line (bytes or str) with the fastest backend that
+    accepts it, raises ValueError when none does.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='replace')
+    return json.loads(line)
+
+def jsonl_batches(jsonl_file):
+    """
+    Generate lists of the raw (bytes) non blank lines of jsonl_file.
+    """
+    with open(jsonl_file, 'rb') as f:
+        while True:
+            lines = f.readlines(BATCH_SIZE)
+            if not lines:
+                break
+            yield [line for line in lines if not line.isspace()]
+
+def projection(paths):
+    """
+    Returns a function that takes a decoded record and returns a tuple
+    with the value at each key path, None where a key is missing or the
+    value on the way is not an object.
+    The lookups are written out once as straight line code, paths that
+    share a prefix share its lookups.
+    """
+    lines = ['def project(v0):']
+    names = {(): 'v0'}
+    values = []
+    for path in paths:
+        path = tuple(path)
+        for i in range(1, len(path) + 1):
+            if path[:i] not in names:
+                name = 'v%d' % len(names)
+                parent = names[path[:i - 1]]
+                lines.append('    %s = %s.get(%r) if %s.__class__ is dict else None' %
+                             (name, parent, path[i - 1], parent))
+                names[path[:i]] = name
+        values.append(names[path])
+    lines.append('    return (%s)' % ''.join(value + ', ' for value in values))
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace['project']
+
+def read_jsonl(jsonl_file, paths=None, skip_errors=False, stats=None):
+    """
+    Generate each record of jsonl_file, or when paths (a sequence of key
+    tuples like ('Event', 'System', 'EventID')) is given the tuple of
+    their values (see projection).
+    Lines that are not JSON raise ValueError unless skip_errors is set.
+    """
+    project = projection(paths) if paths is not None else None
+    if stats is not None:
+        yield from _stats_read_jsonl(jsonl_file, project, skip_errors, stats)
+        return
+    for lines in jsonl_batches(jsonl_file):
+        for line in lines:
+            try:
+                record = loads(line)
+            except ValueError:
+                if skip_errors:
+                    continue
+                raise
+            if paths is None:
+                yield record
+            else:
+                yield project(record)
+
+def _stats_read_jsonl(jsonl_file, project, skip_errors, stats):
+    """
+    read_jsonl timing the read and decode stages into stats, each batch is
+    decoded before its records are handed on.
+    """
+    start = time.perf_counter()
+    for lines in jsonl_batches(jsonl_file):
+        start = stats.lap('read', start)
+        records = []
+        for line in lines:
+            try:
+                record = loads(line)
+            except ValueError as e:
+                if not skip_errors:
+                    raise
+                stats.error('JSON line', e)
+                continue
+            records.append(record if project is None else project(record))
+        stats.count('seen', len(lines))
+        stats.count('decoded', len(records))
+        stats.lap('decode', start)
+        yield from records
+        start = time.perf_counter()
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Compare records/sec of the shared JSONL reader and json.loads",
+        usage='jsonl_reader.py Security.evtx.jsonl')
+    parser.add_argument("jsonl", type=str,
+        help='Path to a JSONL export of an EVTX event log file')
+
+    args = parser.parse_args()
+
+    paths = (('Event', 'System', 'EventID'),
+             ('Event', 'System', 'Computer'),
+             ('Event', 'System', 'TimeCreated', '#attributes', 'SystemTime'),
+             ('Event', 'EventData', 'TargetUserName'))
+
+    def stdlib():
+        with open(args.jsonl) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def stdlib_fields():
+        # The dict.get chains the scripts used to write by hand
+        for record in stdlib():
+            event = record.get('Event', {})
+            system = event.get('System', {})
+            yield (system.get('EventID'), system.get('Computer'),
+                   system.get('TimeCreated', {}).get('#attributes', {}).get('SystemTime'),
+                   (event.get('EventData') or {}).get('TargetUserName'))
+
+    print('backend,%s' % ('orjson' if orjson is not None else 'json'))
+    for name, records in (('json.loads', stdlib),
+                          ('reader', lambda: read_jsonl(args.jsonl)),
+                          ('json.loads fields', stdlib_fields),
+                          ('reader fields', lambda: read_jsonl(args.jsonl, paths))):
+        start = time.perf_counter()
+        count = 0
+        for record in records():
+            count += 1
+        elapsed = time.perf_counter() - start
+        print('%s,%d records,%.1f records/sec' % (name, count, count / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,147 @@
-import pandas as pd
-import json
 import argparse
 import csv
 import sys
+import time
 
-# Create the parser and add the filename argument
-parser = argparse.ArgumentParser()
-parser.add_argument('filename', help='The name of the file to process')
-args = parser.parse_args()
+from evtx_stats import RunStats, RunProfile, timed
+from jsonl_reader import read_jsonl
+
+# Rows written at a time in --stream mode
+CHUNK_ROWS = 10000
+
+def flatten(record, sep='.'):
+    """
+    Flatten one record the way pandas.json_normalize does: keys of nested
+    objects are joined with sep, top level values come first, then the
+    nested ones, lists are kept as values and empty objects dropped.
+    """
+    flat = dict((key, value) for key, value in record.items()
+                if not isinstance(value, dict))
+
+    def nested(value, prefix):
+        for key, child in value.items():
+            name = prefix + sep + key if prefix else key
+            if isinstance(child, dict):
+                nested(child, name)
+            else:
+                flat[name] = child
+
+    nested(dict((key, value) for key, value in record.items()
+                if isinstance(value, dict)), '')
+    return flat
+
+def stream_csv(filename, out, chunk_rows=CHUNK_ROWS, stats=None):
+    """
+    Write filename as CSV to out reading it twice, once for the union of
+    the flattened columns (in order of first appearance, like the
+    DataFrame) and once to write the rows chunk_rows at a time, so only
+    the columns and one chunk of rows are held in memory.
+    With stats (a RunStats) the records are counted once, the stages of
+    both passes are timed.
+    """
+    columns = {}
+    records = 0
+    present = {}
+    not_numbers = set()
+    has_floats = set()
+    for record in read_jsonl(filename, stats=stats):
+        records += 1
+        for name, value in timed(stats, 'flatten', flatten, record).items():
+            columns.setdefault(name, None)
+            if value is None:
+                continue
+            present[name] = present.get(name, 0) + 1
+            if value.__class__ is float:
+                has_floats.add(name)
+            elif value.__class__ is not int:
+                not_numbers.add(name)
+    columns = list(columns)
+    # pandas makes a column of numbers with a float or a gap float64,
+    # its whole numbers are then written as 4624.0
+    floats = set(name for name in columns if name not in not_numbers and
+                 (name in has_floats or present.get(name, 0) < records))
 
-# Open the jsonl file and load data
-with open(args.filename, 'r') as json_file:
-    json_list = list(json_file)
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    rows = []
+    second = stats.new() if stats is not None else None
+    for record in read_jsonl(filename, stats=second):
+        flat = timed(stats, 'flatten', flatten, record)
+        row = []
+        for name in columns:
+            value = flat.get(name)
+            # What fillna('-') replaces, None and NaN
+            if value is None or value != value:
+                value = '-'
+            elif name in floats:
+                value = float(value)
+            row.append(value)
+        rows.append(row)
+        if len(rows) >= chunk_rows:
+            write_chunk(stats, writer, rows)
+            rows = []
+    write_chunk(stats, writer, rows)
+    if stats is not None:
+        stats.merge(second, counts=False)
 
-# Convert json strings to dictionaries
-json_data = [json.loads(jline) for jline in json_list]
+def write_chunk(stats, writer, rows):
+    timed(stats, 'output', writer.writerows, rows)
+    if stats is not None:
+        stats.count('matched', len(rows))
 
-# Normalize semi-structured JSON data into a flat table.
-df = pd.json_normalize(json_data)
+def pandas_csv(filename, out, stats=None):
+    import pandas as pd
 
-# Replace 'nan' values with '-'
-df.fillna('-', inplace=True)
+    # Open the jsonl file and convert json lines to dictionaries
+    json_data = list(read_jsonl(filename, stats=stats))
 
-# Create a CSV writer that writes to the console
-writer = csv.writer(sys.stdout)
+    # Normalize semi-structured JSON data into a flat table.
+    start = time.perf_counter()
+    df = pd.json_normalize(json_data)
+
+    # Replace 'nan' values with '-'
+    df.fillna('-', inplace=True)
+    if stats is not None:
+        stats.lap('normalize', start)
+
+    # Create a CSV writer that writes to the console
+    writer = csv.writer(out)
+
+    # Write the header to the CSV
+    writer.writerow(df.columns)
+
+    # Write the rows to the CSV
+    start = time.perf_counter()
+    for index, row in df.iterrows():
+        writer.writerow(row)
+    if stats is not None:
+        stats.lap('output', start)
+        stats.count('matched', len(df))
+
+# Create the parser and add the filename argument
+parser = argparse.ArgumentParser()
+parser.add_argument('filename', help='The name of the file to process')
+parser.add_argument('-s', '--stream', default=False, action='store_true',
+    help='Read the file twice instead of loading it into pandas, memory stays the same for any file size')
+parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+    help='Rows written at a time with --stream (default %(default)s)')
+parser.add_argument('--stats', default=False, action='store_true',
+    help='write the time of each stage and the records seen, matched, skipped and errored to stderr')
+parser.add_argument('--stats-file', type=str,
+    help='write the --stats report to this JSON file instead ( --stats-file run.json)')
+parser.add_argument('--profile', type=str,
+    help='dump a cProfile of the run to this file, see python -m pstats ( --profile run.prof)')
+args = parser.parse_args()
+stats = RunStats(args.stats_file) if args.stats or args.stats_file else None
+if args.profile:
+    args.profile = RunProfile(args.profile)
 
-# Write the header to the CSV
-writer.writerow(df.columns)
+if args.stream:
+    stream_csv(args.filename, sys.stdout, args.chunk_rows, stats)
+else:
+    pandas_csv(args.filename, sys.stdout, stats)
 
-# Write the rows to the CSV
-for index, row in df.iterrows():
-    writer.writerow(row)
+if args.profile:
+    args.profile.save()
+if stats:
+    stats.report()
@@ -6,18 +6,14 @@
 # Microsoft-Windows-Bits-Client/Operational.evtx
 #
 # Requires Python-evtx https://github.com/williballenthin/python-evtx
-# and BeautifulSoup
-
-import sys
-import re
-import mmap
-import contextlib
+# and evtx_decoder.py from this repository
 
 import argparse
-from bs4 import BeautifulSoup, element
 
-from Evtx.Evtx import FileHeader
-from Evtx.Views import evtx_file_xml_view
+from evtx_decoder import evtx_chunk_events, map_chunks
+from evtx_output import open_output, formats
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
 
 bits_ids = {3: 'Bits Service Created a new job',
  4: 'Bits job completed',
@@ -47,54 +43,79 @@ Bits_Header = 'Date,EventID,Description,Computer,ProcessID,ThreadID,Name,'\
 'User,jobTitle,URL,fileTime,fileLength,bytesTotal,bytesTransferred,'\
 'bytesTransferredFromPeer,jobId,jobOwner,fileCount,String,String1'
 
+def event_row(event):
+    """
+    The CSV column values of one decoded event, None for other Event IDs.
+    """
+    Date = event['SystemTime']
+    Date = Date[:-7]
+    EventID = int(event['EventID'])
+    Computer = event['Computer']
+    ProcessID = event['ProcessID']
+    ThreadID = event['ThreadID']
+    if EventID in bits_ids:
+        event_info = [Date,EventID,bits_ids[EventID],Computer,ProcessID,ThreadID]
+
+        event_data = {}
+        for name, text in event['EventData']:
+            event_data[name] = ' '.join(text.split())
+
+        event_data_result = []
+        for value in bits_data:
+            result = event_data.get(value)
+            if result is None:
+                result = ''
+            event_data_result.append(result)
+        return tuple(map(str,event_info + event_data_result))
+    return None
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   bits_ids, args):
+        try:
+            row = timed(args.stats, 'fields', event_row, event)
+        except Exception as e:
+            record_error(args, event, e)
+            continue
+        if row is not None:
+            results.append(row)
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description=
         "Find and Extract Windows Bits Events and output CSV",
-        usage='parse_evtx_BITS.py Microsoft-Windows-Bits-Client%4Operational.evtx -n')
+        usage='parse_evtx_BITS.py Microsoft-Windows-Bits-Client%%4Operational.evtx -n -w')
     parser.add_argument("evtx", type=str,
-        help='Microsoft-Windows-Bits-Client%4Operational.evtx ')
+        help='Microsoft-Windows-Bits-Client%%4Operational.evtx ')
     parser.add_argument("-n", "--NoHeader", default=False, action="store_true",
         help="Do not print Header")
-
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of the file in this many processes ( -w 8)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the rows as csv, jsonl or parquet (default %(default)s)")
+    parser.add_argument('--output', type=str,
+        help="write the rows to this file instead of stdout, parquet needs one ( --output rows.parquet)")
+    add_run_options(parser, 'Microsoft-Windows-Bits-Client%4Operational.evtx', 'bits.json')
         
     args = parser.parse_args()
+    check_run_options(parser, args)
 
-    if not args.NoHeader:
-        print(Bits_Header)
-        
-    with open(args.evtx, 'r') as f:
-        with contextlib.closing(mmap.mmap(f.fileno(), 0,
-                                          access=mmap.ACCESS_READ)) as buf:
-            fh = FileHeader(buf, 0x0)
-            for xml, record in evtx_file_xml_view(fh):
-                soup = BeautifulSoup(xml, "lxml")
-                Date = soup.event.system.timecreated['systemtime']
-                Date = Date[:-7]
-                EventID = int(soup.event.system.eventid.string)
-                Computer = soup.event.system.computer.string
-                ProcessID = soup.event.system.execution['processid']
-                ThreadID = soup.event.system.execution['threadid']                
-                if EventID in bits_ids:
-                    event_info = "%s,%s,%s,%s,%s,%s," % (Date,EventID,bits_ids[EventID],Computer,ProcessID,ThreadID)
-
-                    try:
-
-                        event_data = {}
-                        for child in soup.eventdata.children:
-                            if type(child) is element.Tag:
-                                val = child.text.replace(',', ';')
-                                event_data[child['name']] = ' '.join(val.split())
-
-                        event_data_result = []
-                        for value in bits_data:
-                            result = event_data.get(value)
-                            if result is None:
-                                result = ''
-                            event_data_result.append(result)
-                        output = ((event_info) + ','.join(map(str,event_data_result)))                   
-                        print(output)           
-                    except:
-                        pass
+    try:
+        output = open_output(args.format, args.output, Bits_Header.split(','),
+                             not args.NoHeader)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        for results in map_chunks(args.evtx, parse_chunks, args, args.workers,
+                                  event_ids=bits_ids, flush=output.flush):
+            write_rows(args.stats, output.write, results)
+    finally:
+        timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
 
 if __name__ == "__main__":
     main()
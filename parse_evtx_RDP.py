@@ -10,19 +10,37 @@
 # https://www.13cubed.com/downloads/rdp_flowchart.pdf
 # https://ponderthebits.com/2018/02/windows-rdp-related-event-logs-identification-tracking-and-investigation/
 # https://frsecure.com/blog/rdp-connection-event-logs/
+#
+# With -c the inbound events are joined into one row per session instead:
+# RdpCoreTS 131 (connection) and RemoteConnectionManager 1149
+# (authentication) are matched to the LocalSessionManager 21 logon or 25
+# reconnect from the same address and user within --window seconds, and
+# 21/22/24/25/23 are joined by Computer and SessionID. The logs are read
+# at the same time by one pool of -w worker processes and merged in time
+# order, a session is written when it logs off, has been idle for --idle
+# seconds or more than --max-sessions are open, so memory stays bounded
+# however long the logs are.
+#
+# --format jsonl or parquet writes the rows in those formats, see
+# evtx_output.py.
+#
 # Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
 
 import os
-import sys
-import mmap
-import contextlib
+import heapq
+import multiprocessing
 import textwrap
+import collections
+from datetime import datetime
 
 import argparse
-from bs4 import BeautifulSoup, element
 
-from Evtx.Evtx import FileHeader
-from Evtx.Views import evtx_file_xml_view
+from evtx_decoder import evtx_chunk_events, map_chunks, chunk_tasks, \
+    pool_chunks
+from evtx_output import open_output, formats
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
 
 RDP_IDs = {21: 'RDP Session logon succeeded',
  22: 'RDP Shell start notification received (GUI)',
@@ -65,82 +83,371 @@ Evtx_Logs = [
 RDP_Header = 'Date,Channel,RecordID,Computer,EventID,Description,Domain,User,' \
 'Host/IP Address,Session,Direction'
 
-def parse_evtx(evtx_file):
-    with open(evtx_file, 'r') as f:
-        with contextlib.closing(mmap.mmap(f.fileno(), 0,
-                                          access=mmap.ACCESS_READ)) as buf:
-            fh = FileHeader(buf, 0x0)
-            for xml, record in evtx_file_xml_view(fh):
-                soup = BeautifulSoup(xml, "lxml")
-                Date = soup.event.system.timecreated['systemtime']
-                Date = Date[:-7]
-                EventID = int(soup.event.system.eventid.string)
-                Computer = soup.event.system.computer.string
-                Channel = soup.event.system.channel.string
-                RecordID = soup.event.system.eventrecordid.string 
-                if EventID in RDP_IDs:
-                    event_info = "%s,%s,%s,%s,%s,%s," % (Date,Channel,RecordID,Computer,EventID,RDP_IDs[EventID])
-                    # Find a process each EVTX log file
-                    user_data = []
-                    if Channel == "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational":
-                        for info in RDP_local_info:
-                            if soup.userdata.eventxml.find_all(info):
-                                for tag in soup.find_all(info):
-                                    tag_text = (tag.text)
-                            else:
-                                tag_text = ''
-                            
-                            user_data.append(tag_text)
-                        output = ((event_info) + ','.join(map(str,user_data)))
-                        if not ",LOCAL," in output:
-                            print(output + ",RDP<-in")
-                    ############################        
-                    if Channel == "Microsoft-Windows-TerminalServices-RemoteConnectionManager/Operational":
-                        for info in RDP_remote_info:
-                            if soup.userdata.eventxml.find_all(info):
-                                for tag in soup.find_all(info):
-                                    tag_text = (tag.text)
-                            else:
-                                tag_text = ''
-                            user_data.append(tag_text)
-                        output = ((event_info) + ','.join(map(str,user_data)))
-                        print(output + ",RDP<-in") 
-                    ############################
-                    if Channel == "Microsoft-Windows-RemoteDesktopServices-RdpCoreTS/Operational":
-                        tag_exists = soup.eventdata.find
-                        if not tag_exists:
-                            user_data.append(",,,,")
-                        else:
-                            for child in soup.eventdata.children:
-                                if type(child) is element.Tag:
-                                    if (child['name']) == 'ClientIP':
-                                        IP = (child.text)
-                                    else:
-                                        IP = ''
-                                    if (child['name']) == 'ConnType':
-                                        Port = (child.text)
-                                    else:
-                                        Port = ''
-                                user_data.append(",," + IP + "," + Port + ",")
-                        output = ((event_info) + ','.join(map(str,user_data)))
-                        print(output + "RDP<-in")
-                    ############################
-                    if Channel == "Microsoft-Windows-TerminalServices-RDPClient/Operational":
-                        User = ''
-                        IP = ''               
-                        for child in soup.eventdata.children:
-                            if type(child) is element.Tag:
-                                if (child['name']) == 'TraceMessage':
-                                    User = (child.text).rstrip("-")
-                                if (child['name']) == 'Server Name':
-                                    IP = (child.text)
-                                if (child['name']) == 'Value':
-                                    IP = (child.text)
-                                    if IP.isnumeric():
-                                        IP = ''
-                        user_data.append("," + User + "," + IP + ",,")
-                        output = ((event_info) + ','.join(map(str,user_data)))
-                        print(output + "RDP->out")
+# EventIDs joined into sessions by -c and the channel of each
+Session_IDs = {21, 22, 23, 24, 25, 131, 1149}
+Session_Channels = {'131': 'Microsoft-Windows-RemoteDesktopServices-RdpCoreTS/Operational',
+'1149': 'Microsoft-Windows-TerminalServices-RemoteConnectionManager/Operational'
+}
+Session_Channel = 'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational'
+
+# Seconds from a connection (131) to its authentication (1149) and logon (21/25)
+WINDOW = 120
+
+# Seconds without an event after which an open session is written out
+IDLE = 7 * 24 * 3600
+
+# Open sessions kept, the least recently active is written out past this
+MAX_SESSIONS = 100000
+
+Session_Header = 'Start,End,Computer,Session,Domain,User,Host/IP Address,' \
+'Connected,Authenticated,Logon,Shell,Disconnects,Reconnects,Logoff,Status'
+
+def event_rows(event):
+    """
+    The CSV column values of each row of one decoded event, none for
+    console logons and other Event IDs.
+    """
+    results = []
+    Date = event['SystemTime']
+    Date = Date[:-7]
+    EventID = int(event['EventID'])
+    Computer = event['Computer']
+    Channel = event['Channel']
+    RecordID = event['EventRecordID']
+    if EventID in RDP_IDs:
+        event_info = [Date,Channel,RecordID,Computer,EventID,RDP_IDs[EventID]]
+        # Find a process each EVTX log file
+        user_data = []
+        if Channel == "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational":
+            for info in RDP_local_info:
+                tag_text = event['UserData'].get(info, '')
+                user_data.append(tag_text)
+            output = event_info + user_data
+            if not 'LOCAL' in output[1:-1]:
+                results.append(output + ["RDP<-in"])
+        ############################        
+        if Channel == "Microsoft-Windows-TerminalServices-RemoteConnectionManager/Operational":
+            for info in RDP_remote_info:
+                tag_text = event['UserData'].get(info, '')
+                user_data.append(tag_text)
+            output = event_info + user_data
+            results.append(output + ["RDP<-in"])
+        ############################
+        if Channel == "Microsoft-Windows-RemoteDesktopServices-RdpCoreTS/Operational":
+            IP = ''
+            Port = ''
+            for name, text in event['EventData']:
+                if name == 'ClientIP':
+                    IP = text
+                if name == 'ConnType':
+                    Port = text
+            user_data = ['', '', IP, Port]
+            output = event_info + user_data
+            results.append(output + ["RDP<-in"])
+        ############################
+        if Channel == "Microsoft-Windows-TerminalServices-RDPClient/Operational":
+            User = ''
+            IP = ''               
+            for name, text in event['EventData']:
+                if name == 'TraceMessage':
+                    User = text.rstrip("-")
+                if name == 'Server Name':
+                    IP = text
+                if name == 'Value':
+                    IP = text
+                    if IP.isnumeric():
+                        IP = ''
+            user_data = ['', User, IP, '']
+            output = event_info + user_data
+            results.append(output + ["RDP->out"])
+    return [tuple(map(str,row)) for row in results]
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   RDP_IDs, args):
+        try:
+            results.extend(timed(args.stats, 'fields', event_rows, event))
+        except Exception as e:
+            record_error(args, event, e)
+    return results
+
+def session_event(event):
+    """
+    The (SystemTime, EventID, Computer, Domain, User, Address, SessionID)
+    tuple of one decoded session event, all strings, None for events of
+    another channel or without a time.
+    """
+    EventID = event['EventID']
+    if not event['SystemTime'] or \
+            event['Channel'] != Session_Channels.get(EventID, Session_Channel):
+        return None
+    Domain = User = Address = SessionID = ''
+    if EventID == '131':
+        for name, text in event['EventData']:
+            if name == 'ClientIP':
+                # 192.168.1.5:50123 or [fe80::1]:50123
+                Address = text.rsplit(':', 1)[0].strip('[]')
+    elif EventID == '1149':
+        User = event['UserData'].get('param1', '')
+        Domain = event['UserData'].get('param2', '')
+        Address = event['UserData'].get('param3', '')
+    else:
+        User = event['UserData'].get('user', '')
+        if '\\' in User:
+            Domain, User = User.split('\\', 1)
+        Address = event['UserData'].get('address', '')
+        SessionID = event['UserData'].get('sessionid', '')
+    return (event['SystemTime'], EventID, event['Computer'] or '',
+            Domain, User, Address, SessionID)
+
+def session_chunks(evtx_file, first_chunk, last_chunk, args):
+    """
+    The session_event tuples of the session events in a range of chunks.
+    """
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   Session_IDs, args):
+        try:
+            session = timed(args.stats, 'fields', session_event, event)
+        except Exception as e:
+            record_error(args, event, e)
+            continue
+        if session is not None:
+            results.append(session)
+    return results
+
+class Session(object):
+    """
+    The events of one RDP session joined so far.
+    """
+    __slots__ = ('Computer', 'Session', 'Domain', 'User', 'Addresses',
+                 'Start', 'End', 'Connected', 'Authenticated', 'Logon',
+                 'Shell', 'Disconnects', 'Reconnects', 'Logoff', 'last')
+
+    def __init__(self, Computer, Session, Domain, User):
+        self.Computer = Computer
+        self.Session = Session
+        self.Domain = Domain
+        self.User = User
+        self.Addresses = []
+        self.Start = self.End = None
+        self.Connected = self.Authenticated = self.Logon = None
+        self.Shell = self.Logoff = None
+        self.Disconnects = self.Reconnects = 0
+        self.last = None
+
+    def seen(self, SystemTime, seconds):
+        if self.Start is None or SystemTime < self.Start:
+            self.Start = SystemTime
+        if self.End is None or SystemTime > self.End:
+            self.End = SystemTime
+        self.last = seconds
+
+    def row(self, Status):
+        times = [self.Start, self.End, self.Connected, self.Authenticated,
+                 self.Logon, self.Shell, self.Logoff]
+        Start, End, Connected, Authenticated, Logon, Shell, Logoff = \
+            [(Date[:-7] if Date else '') for Date in times]
+        return tuple(map(str, [Start, End, self.Computer, self.Session,
+            self.Domain, self.User, ';'.join(self.Addresses), Connected,
+            Authenticated, Logon, Shell, self.Disconnects, self.Reconnects,
+            Logoff, Status]))
+
+class SessionJoin(object):
+    """
+    Joins session events (see session_chunks), fed in time order to add(),
+    into sessions and calls write with the row of each one finished.
+    Connections and authentications wait window seconds for their logon,
+    sessions idle seconds for their next event, at most max_sessions
+    sessions are open at a time.
+    """
+    def __init__(self, write, window=WINDOW, idle=IDLE,
+                 max_sessions=MAX_SESSIONS):
+        self.write = write
+        self.window = window
+        self.idle = idle
+        self.max_sessions = max_sessions
+        self.now = None
+        # (Computer, SessionID) -> Session, least recently active first
+        self.sessions = collections.OrderedDict()
+        # [seconds, event, connection, taken] of each 131 and 1149 in
+        # arrival order, and by (EventID, Computer, Address)
+        self.pending = collections.deque()
+        self.waiting = {}
+
+    def add(self, event):
+        SystemTime, EventID, Computer, Domain, User, Address, SessionID = event
+        try:
+            seconds = datetime.fromisoformat(SystemTime).timestamp()
+        except ValueError:
+            return
+        if self.now is None or seconds > self.now:
+            self.now = seconds
+            self.expire()
+
+        if EventID in ('131', '1149'):
+            connection = None
+            if EventID == '1149':
+                connection = self.take('131', Computer, Address, None, seconds)
+            item = [seconds, event, connection, False]
+            self.pending.append(item)
+            self.waiting.setdefault((EventID, Computer, Address), []).append(item)
+            return
+
+        key = (Computer, SessionID)
+        session = self.sessions.get(key)
+        if session is not None and EventID == '21':
+            # SessionID reused without a logoff
+            self.close(key, 'no logoff')
+            session = None
+        if session is None:
+            session = Session(Computer, SessionID, Domain, User)
+            self.sessions[key] = session
+        else:
+            self.sessions.move_to_end(key)
+        session.seen(SystemTime, seconds)
+        if User and not session.User:
+            session.Domain, session.User = Domain, User
+        if Address and Address not in session.Addresses:
+            session.Addresses.append(Address)
+
+        if EventID in ('21', '25'):
+            authentication = self.take('1149', Computer, Address, User, seconds)
+            if authentication is not None:
+                connection = authentication[2]
+            else:
+                connection = self.take('131', Computer, Address, None, seconds)
+            if EventID == '21':
+                session.Logon = SystemTime
+                if authentication is not None:
+                    session.Authenticated = authentication[1][0]
+                    session.seen(authentication[1][0], seconds)
+                if connection is not None:
+                    session.Connected = connection[1][0]
+                    session.seen(connection[1][0], seconds)
+            else:
+                session.Reconnects += 1
+        elif EventID == '22':
+            if session.Shell is None:
+                session.Shell = SystemTime
+        elif EventID == '24':
+            session.Disconnects += 1
+        elif EventID == '23':
+            session.Logoff = SystemTime
+            self.close(key, 'logged off')
+            return
+
+        while len(self.sessions) > self.max_sessions:
+            self.close(next(iter(self.sessions)), 'evicted')
+
+    def take(self, EventID, Computer, Address, User, seconds):
+        """
+        Remove and return the newest pending EventID item from Address
+        (and User when given) of the last window seconds, or None.
+        """
+        items = self.waiting.get((EventID, Computer, Address))
+        if not items:
+            return None
+        for i in range(len(items) - 1, -1, -1):
+            item = items[i]
+            if item[0] < seconds - self.window:
+                break
+            if User is not None and item[1][4].lower() != User.lower():
+                continue
+            item[3] = True
+            del items[i]
+            if not items:
+                del self.waiting[(EventID, Computer, Address)]
+            return item
+        return None
+
+    def expire(self):
+        while self.pending and self.pending[0][0] < self.now - self.window:
+            self.drop(self.pending.popleft())
+        while self.sessions:
+            key = next(iter(self.sessions))
+            if self.sessions[key].last >= self.now - self.idle:
+                break
+            self.close(key, 'idle')
+
+    def drop(self, item):
+        """
+        Forget a pending item, an authentication without a logon is
+        written as a session of its own.
+        """
+        if item[3]:
+            return
+        seconds, event, connection, taken = item
+        SystemTime, EventID, Computer, Domain, User, Address, SessionID = event
+        waiting_key = (EventID, Computer, Address)
+        # Items leave in arrival order, so it is the oldest one waiting
+        self.waiting[waiting_key].pop(0)
+        if not self.waiting[waiting_key]:
+            del self.waiting[waiting_key]
+        if EventID == '1149':
+            session = Session(Computer, '', Domain, User)
+            session.Addresses.append(Address)
+            session.seen(SystemTime, seconds)
+            session.Authenticated = SystemTime
+            if connection is not None:
+                session.Connected = connection[1][0]
+                session.seen(connection[1][0], seconds)
+            self.write(session.row('no logon'))
+
+    def close(self, key, Status):
+        session = self.sessions.pop(key)
+        # Console logons, like the event rows
+        if session.Addresses == ['LOCAL']:
+            return
+        self.write(session.row(Status))
+
+    def finish(self):
+        """
+        Write what is still pending or open at the end of the logs.
+        """
+        while self.pending:
+            self.drop(self.pending.popleft())
+        while self.sessions:
+            self.close(next(iter(self.sessions)), 'open')
+
+def channel_events(pool, evtx_file, args, ahead):
+    # -c does not take --checkpoint, there is no progress to mark
+    tasks, progress = chunk_tasks(evtx_file, session_chunks, args,
+                                  record_order=True, event_ids=Session_IDs)
+    for results in pool_chunks(pool, tasks, args.stats, ahead):
+        for event in results:
+            yield event
+
+def join_sessions(evtx_files, args, output):
+    """
+    Write the sessions in evtx_files to output. The chunks of every file
+    are parsed in one pool of --workers processes, each file keeping a few
+    tasks queued ahead of the merge, so the channels are read at the same
+    time (even with one worker, while the merge runs) as the merge pulls
+    them in time order.
+    """
+    write = output.write
+    if args.stats:
+        # The join stage includes writing the session rows
+        def write(row):
+            output.write(row)
+            args.stats.count('matched')
+    join = SessionJoin(write, args.window, args.idle, args.max_sessions)
+    # Evtx_Logs order reversed, so events of the same time come as
+    # connection, authentication, logon
+    workers = max(args.workers, 1)
+    with multiprocessing.Pool(workers) as pool:
+        streams = [channel_events(pool, evtx_file, args, 2 * workers)
+                   for evtx_file in reversed(evtx_files)]
+        for event in heapq.merge(*streams, key=lambda event: event[0]):
+            timed(args.stats, 'join', join.add, event)
+    timed(args.stats, 'join', join.finish)
+
+def parse_evtx(evtx_file, args, output):
+    for results in map_chunks(evtx_file, parse_chunks, args, args.workers,
+                              event_ids=RDP_IDs, flush=output.flush):
+        write_rows(args.stats, output.write, results)
 
 def main():
     parser= argparse.ArgumentParser(
@@ -155,26 +462,63 @@ def main():
     parser.add_argument('Evtx_Source', help="Windows event log file or directory")
     parser.add_argument("-n", "--NoHeader", default=False, action="store_true",
         help="Do not print Header")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of each file in this many processes ( -w 8)")
+    parser.add_argument('-c', '--sessions', default=False, action="store_true",
+        help="join the inbound events into one row per session, the logs are parsed at the same time in one pool of -w processes")
+    parser.add_argument('--window', type=int, default=WINDOW,
+        help="seconds from a connection to its logon with -c (default %(default)s)")
+    parser.add_argument('--idle', type=int, default=IDLE,
+        help="seconds without an event before a session is written with -c (default %(default)s)")
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS,
+        help="open sessions kept with -c (default %(default)s)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the rows as csv, jsonl or parquet (default %(default)s)")
+    parser.add_argument('--output', type=str,
+        help="write the rows to this file instead of stdout, parquet needs one ( --output rows.parquet)")
+    add_run_options(parser, 'Microsoft-Windows-TerminalServices-LocalSessionManager%4Operational.evtx',
+                    'rdp.json')
     args = parser.parse_args()
+    check_run_options(parser, args)
+    if args.sessions and args.checkpoint:
+        # Sessions still open when a run ends would be cut in two
+        parser.error("-c does not take --checkpoint")
 
-    if not args.NoHeader:
-        print(RDP_Header)
+    try:
+        output = open_output(args.format, args.output,
+            (Session_Header if args.sessions else RDP_Header).split(','),
+            not args.NoHeader)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
 
     #Enumerate and verify files in directory path, then send to parser
+    files_to_parse = []
     if (os.path.isdir(args.Evtx_Source)):
         for evt_log in Evtx_Logs:
             file_to_parse = os.path.join(args.Evtx_Source, evt_log)
             if os.path.isfile(file_to_parse):
-               parse_evtx(file_to_parse)
+               files_to_parse.append(file_to_parse)
 
     #Enumerate and verify file in input string, then send to parser
     elif os.path.isfile(args.Evtx_Source):
         if  args.Evtx_Source.lower().endswith('evtx'):
-            file_to_parse = args.Evtx_Source
-            parse_evtx(file_to_parse)
+            files_to_parse.append(args.Evtx_Source)
     else:
         print("invalid path!!") 
 
+    try:
+        if args.sessions:
+            join_sessions(files_to_parse, args, output)
+        else:
+            for file_to_parse in files_to_parse:
+                parse_evtx(file_to_parse, args, output)
+    finally:
+        timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
+
 
 if __name__ == "__main__":
     main()
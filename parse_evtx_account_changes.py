@@ -3,19 +3,15 @@
 # from the Security.evtx log file
 # 
 # Requires Python-evtx https://github.com/williballenthin/python-evtx
-# and BeautifulSoup
+# and evtx_decoder.py from this repository
 # Event IDs can be added or removed by editing the "evtxs" variable
 
-import sys
-import re
-import mmap
-import contextlib
-
 import argparse
-from bs4 import BeautifulSoup, element
 
-from Evtx.Evtx import FileHeader
-from Evtx.Views import evtx_file_xml_view
+from evtx_decoder import evtx_chunk_events, map_chunks
+from evtx_output import open_output, formats
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
 
 evtxs = {1102: 'Log Cleared',
 4704: 'A User Right was Assigned',
@@ -69,49 +65,80 @@ event_data_names = ('LogonType',
 'ProcessId'
 )
 
+def event_fields(event):
+    """
+    Returns the CSV column values for a record decoded by decode_record,
+    or None when its EventID is not in evtxs
+    1102 (Log Cleared) keeps its values in UserData, its rows have the
+    EventData columns empty (before the shared decoder this script
+    dropped them)
+    """
+    Date = event['SystemTime']
+    Date = Date[:-7]
+    EventID = int(event['EventID'])
+    Computer = event['Computer']
+    if EventID in evtxs:
+        event_info = [Date,EventID,evtxs[EventID],Computer]
+
+        event_data = {}
+        for name, text in event['EventData']:
+            event_data[name] = ' '.join(text.split())
+        event_data_result = []
+        for value in event_data_names:
+            result = event_data.get(value)
+            if result is None:
+                result = ''
+            event_data_result.append(result)
+        return event_info + event_data_result
+    return None
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   evtxs, args):
+        try:
+            fields = timed(args.stats, 'fields', event_fields, event)
+        except Exception as e:
+            record_error(args, event, e)
+            continue
+        if fields is not None:
+            results.append(tuple(map(str,fields)))
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description=
         "Extract Common Windows Account Change Events",
-        usage='parse_evtx_account_changes.py Security.evtx -n')
+        usage='parse_evtx_account_changes.py Security.evtx -n -w')
     parser.add_argument("evtx", type=str,
         help='Security.evtx ')
     parser.add_argument("-n", "--NoHeader", default=False, action="store_true",
         help="Do not print Header")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of the file in this many processes ( -w 8)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the rows as csv, jsonl or parquet (default %(default)s)")
+    parser.add_argument('--output', type=str,
+        help="write the rows to this file instead of stdout, parquet needs one ( --output rows.parquet)")
+    add_run_options(parser, 'Security.evtx', 'account_changes.json')
       
     args = parser.parse_args()
+    check_run_options(parser, args)
 
-    header = (','.join(map(str,event_info_names + event_data_names)))
-    if not args.NoHeader:
-        print(header)
-        
-    with open(args.evtx, 'r') as f:
-        with contextlib.closing(mmap.mmap(f.fileno(), 0,
-                                          access=mmap.ACCESS_READ)) as buf:
-            fh = FileHeader(buf, 0x0)
-            for xml, record in evtx_file_xml_view(fh):
-                soup = BeautifulSoup(xml, "lxml")
-                Date = soup.event.system.timecreated['systemtime']
-                Date = Date[:-7]
-                EventID = int(soup.event.system.eventid.string)
-                Computer = soup.event.system.computer.string               
-                if EventID in evtxs:
-                    event_info = "%s,%s,%s,%s," % (Date,EventID,evtxs[EventID],Computer)
-
-                    try:
-                        event_data = {}
-                        for child in soup.eventdata.children:
-                            if type(child) is element.Tag:
-                                event_data[child['name']] = ' '.join(child.text.split())
-                        event_data_result = []
-                        for value in event_data_names:
-                            result = event_data.get(value)
-                            if result is None:
-                                result = ''
-                            event_data_result.append(result)
-                        output = ((event_info) + ','.join(map(str,event_data_result)))                   
-                        print(output)  
-                    except:
-                        pass
+    try:
+        output = open_output(args.format, args.output, event_info_names + event_data_names,
+                             not args.NoHeader)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        for results in map_chunks(args.evtx, parse_chunks, args, args.workers,
+                                  event_ids=evtxs, flush=output.flush):
+            write_rows(args.stats, output.write, results)
+    finally:
+        timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
                         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,257 @@
+#! /usr/bin/env python3
+# Run the parse_evtx scripts over collections from many hosts
+#
+# The evidence directory holds one directory per host, each with that
+# host's .evtx files anywhere below it. For every host the logs of each
+# job are looked up by file name:
+#     security  Security.evtx -> logins.csv, processes.csv, account_changes.csv
+#     tasks     Microsoft-Windows-TaskScheduler%4Operational.evtx -> tasks.csv
+#     bits      Microsoft-Windows-Bits-Client%4Operational.evtx -> bits.csv
+#     rdp       the four RDP logs of parse_evtx_RDP.py -> rdp.csv
+# and the jobs of all hosts run on a pool of --workers processes, the
+# largest logs first so one big Security.evtx does not start last and
+# hold up the end of the run. The CSV files go to <output>/<host>/.
+#
+# Each finished job is written to <output>/manifest.json with the size
+# and modification time of its logs. Running again skips the jobs done
+# with the same logs, so a killed run picks up where it stopped (a job cut
+# off is run again from the start, its CSV files only appear when done).
+# A job that fails is run again too, the end of its error output is in the
+# manifest and all of it in <output>/<host>/<job>.err.
+#     parse_evtx_batch.py /cases/collections -o /cases/csv -w 8
+#     parse_evtx_batch.py /cases/collections -o /cases/csv -j security,rdp --dry-run
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and the parse_evtx_*.py scripts from this repository
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+
+import argparse
+
+from parse_evtx_RDP import Evtx_Logs
+
+# Logs of each job, the script run on them and the CSV files it writes
+batch_jobs = {'security': (('Security.evtx',), 'parse_evtx_security.py',
+              ('logins.csv', 'processes.csv', 'account_changes.csv')),
+'tasks': (('Microsoft-Windows-TaskScheduler%4Operational.evtx',),
+          'parse_evtx_tasks.py', ('tasks.csv',)),
+'bits': (('Microsoft-Windows-Bits-Client%4Operational.evtx',),
+         'parse_evtx_BITS.py', ('bits.csv',)),
+'rdp': (tuple(Evtx_Logs), 'parse_evtx_RDP.py', ('rdp.csv',))
+}
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Lines of a failed job's error output kept in the manifest
+ERROR_LINES = 20
+
+def find_logs(host_dir):
+    """
+    The path of each .evtx file below host_dir by lowercased file name,
+    the first one in sorted order when a name is found more than once.
+    """
+    logs = {}
+    for directory, subdirs, files in os.walk(host_dir):
+        subdirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith('.evtx'):
+                continue
+            path = os.path.join(directory, name)
+            if name.lower() in logs:
+                sys.stderr.write('%s: using %s, not %s\n'
+                                 % (name, logs[name.lower()], path))
+                continue
+            logs[name.lower()] = path
+    return logs
+
+def file_state(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def find_jobs(evidence, selected):
+    """
+    The (host, job, logs) of every job with at least one log, hosts being
+    the directories in evidence.
+    """
+    jobs = []
+    for host in sorted(os.listdir(evidence)):
+        host_dir = os.path.join(evidence, host)
+        if not os.path.isdir(host_dir):
+            continue
+        logs = find_logs(host_dir)
+        for name in selected:
+            names = batch_jobs[name][0]
+            paths = [logs[log.lower()] for log in names if log.lower() in logs]
+            if paths:
+                jobs.append((host, name, paths))
+    return jobs
+
+class Manifest(object):
+    """
+    The jobs finished so far, kept in the JSON file at path by
+    "host/job": {"status", "logs", "outputs", "seconds", "error"}.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def done(self, host, name, logs, output_dir):
+        """
+        True when the job finished with the same logs and its CSV files
+        are still there.
+        """
+        entry = self.entries.get(host + '/' + name)
+        if entry is None or entry['status'] != 'done' or entry['logs'] != logs:
+            return False
+        return all(os.path.exists(os.path.join(output_dir, host, output))
+                   for output in entry['outputs'])
+
+    def record(self, host, name, entry):
+        self.entries[host + '/' + name] = entry
+        self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+def run_job(task):
+    """
+    Run one job's script into a .part directory of the host's output
+    directory and move its CSV files into place when it succeeds.
+    Returns (host, job, manifest entry).
+    """
+    host, name, paths, logs, output_dir, parse_workers = task
+    names, script, outputs = batch_jobs[name]
+    script = os.path.join(script_dir, script)
+    host_dir = os.path.join(output_dir, host)
+    part = os.path.join(host_dir, '.%s.part' % name)
+    shutil.rmtree(part, ignore_errors=True)
+    os.makedirs(part)
+    errors = os.path.join(part, name + '.err')
+    start = time.perf_counter()
+    entry = {'logs': logs, 'outputs': list(outputs)}
+    try:
+        with open(errors, 'w') as err:
+            if name == 'security':
+                subprocess.run([sys.executable, script, paths[0], '-o', part,
+                                '-w', str(parse_workers)],
+                               stdout=err, stderr=err, check=True)
+            else:
+                with open(os.path.join(part, outputs[0]), 'w') as out:
+                    for i, path in enumerate(paths):
+                        command = [sys.executable, script, path,
+                                   '-w', str(parse_workers)]
+                        if i:
+                            # One header for the logs of the RDP job
+                            command.append('-n')
+                        subprocess.run(command, stdout=out, stderr=err,
+                                       check=True)
+        for output in outputs:
+            os.replace(os.path.join(part, output),
+                       os.path.join(host_dir, output))
+        entry['status'] = 'done'
+        if os.path.exists(os.path.join(host_dir, name + '.err')):
+            os.remove(os.path.join(host_dir, name + '.err'))
+    except (OSError, subprocess.CalledProcessError) as e:
+        entry['status'] = 'failed'
+        lines = [str(e)]
+        if os.path.exists(errors):
+            with open(errors, errors='replace') as f:
+                lines = f.read().splitlines()[-ERROR_LINES:] + lines
+            os.replace(errors, os.path.join(host_dir, name + '.err'))
+        entry['error'] = '\n'.join(lines)
+    shutil.rmtree(part, ignore_errors=True)
+    entry['seconds'] = round(time.perf_counter() - start, 1)
+    return host, name, entry
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Run the parse_evtx scripts over a directory of host collections, "
+        "largest logs first, resuming where the last run stopped",
+        usage='parse_evtx_batch.py evidence_dir -o output_dir -w 8 -j security,tasks,bits,rdp')
+    parser.add_argument("evidence", type=str,
+        help="directory with one directory of .evtx files for each host")
+    parser.add_argument('-o', '--OutputDir', type=str, default='.',
+        help="directory for the host directories of CSV files and manifest.json (default current directory)")
+    parser.add_argument('-j', '--jobs', type=str, default=','.join(batch_jobs),
+        help="jobs to run ( -j %s)" % ','.join(batch_jobs))
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+        help="jobs run at the same time (default %(default)s)")
+    parser.add_argument('--parse-workers', type=int, default=1,
+        help="-w handed to each script, processes parsing the chunks of one log (default %(default)s)")
+    parser.add_argument('--force', default=False, action="store_true",
+        help="run the jobs the manifest has as done again")
+    parser.add_argument('--dry-run', default=False, action="store_true",
+        help="list the jobs in the order they would run and exit")
+    args = parser.parse_args()
+
+    selected = args.jobs.split(',')
+    for name in selected:
+        if name not in batch_jobs:
+            parser.error("unknown job %s, choose from %s" % (name, ','.join(batch_jobs)))
+    if not os.path.isdir(args.evidence):
+        parser.error("%s is not a directory" % args.evidence)
+
+    os.makedirs(args.OutputDir, exist_ok=True)
+    manifest = Manifest(os.path.join(args.OutputDir, 'manifest.json'))
+
+    tasks = []
+    skipped = 0
+    for host, name, paths in find_jobs(args.evidence, selected):
+        logs = [[os.path.relpath(path, args.evidence)] + file_state(path)
+                for path in paths]
+        if not args.force and manifest.done(host, name, logs, args.OutputDir):
+            skipped += 1
+            continue
+        tasks.append((host, name, paths, logs, args.OutputDir, args.parse_workers))
+    # Largest first, sizes are the second item of each log's state
+    tasks.sort(key=lambda task: (-sum(log[1] for log in task[3]), task[0], task[1]))
+
+    if args.dry_run:
+        print('Host,Job,MB,Logs')
+        for host, name, paths, logs, output_dir, parse_workers in tasks:
+            print('%s,%s,%.1f,%s' % (host, name, sum(log[1] for log in logs) / 1048576,
+                                     ';'.join(log[0] for log in logs)))
+        sys.stderr.write('%d jobs to run, %d done before\n' % (len(tasks), skipped))
+        return
+
+    for host in set(task[0] for task in tasks):
+        os.makedirs(os.path.join(args.OutputDir, host), exist_ok=True)
+
+    failed = 0
+    if args.workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(args.workers, len(tasks)))
+        results = pool.imap_unordered(run_job, tasks)
+    else:
+        pool = None
+        results = map(run_job, tasks)
+    try:
+        for count, (host, name, entry) in enumerate(results, 1):
+            manifest.record(host, name, entry)
+            if entry['status'] != 'done':
+                failed += 1
+            sys.stderr.write('[%d/%d] %s %s %s in %.1fs\n' % (count, len(tasks),
+                             host, name, entry['status'], entry['seconds']))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    sys.stderr.write('%d jobs run, %d failed, %d done before\n'
+                     % (len(tasks), failed, skipped))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
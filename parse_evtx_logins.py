@@ -2,19 +2,18 @@
 # Extract Common Windows Logins Events and field from the Security.evtx log file
 # 
 # Requires Python-evtx https://github.com/williballenthin/python-evtx
-# and BeautifulSoup
+# and evtx_decoder.py from this repository
 # Event IDs can be added or removed by editing the "evtxs" variable
 
-import sys
 import re
-import mmap
-import contextlib
 
 import argparse
-from bs4 import BeautifulSoup, element
 
-from Evtx.Evtx import FileHeader
-from Evtx.Views import evtx_file_xml_view
+from evtx_decoder import evtx_chunk_events, map_chunks
+from evtx_output import open_output, formats
+from evtx_filter import RowFilter
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
 
 evtxs = {1102: 'Log Cleared',
 4624: 'User logon',
@@ -64,10 +63,49 @@ event_data_names = ('LogonType',
 'ProcessId'
 )
 
+def event_fields(event):
+    """
+    Returns the CSV column values for a record decoded by decode_record,
+    or None when its EventID is not in evtxs
+    """
+    Date = event['SystemTime']
+    Date = Date[:-7]
+    EventID = int(event['EventID'])
+    Computer = event['Computer']
+    if EventID in evtxs:
+        event_info = [Date,EventID,evtxs[EventID],Computer]
+
+        event_data = {}
+        for name, text in event['EventData']:
+            event_data[name] = ' '.join(text.split())
+        event_data_result = []
+        for value in event_data_names:
+            result = event_data.get(value)
+            if result is None:
+                result = ''
+            event_data_result.append(result)
+
+        return event_info + event_data_result
+    return None
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   evtxs, args):
+        try:
+            fields = timed(args.stats, 'fields', event_fields, event)
+        except Exception as e:
+            record_error(args, event, e)
+            continue
+        if fields is not None and \
+                timed(args.stats, 'filter', args.filter.selected, fields):
+            results.append(tuple(map(str,fields)))
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description=
         "Extract Windows Account Logon Events to CSV",
-        usage='parse_evtx_logins.py Security.evtx -n -i -x -m')
+        usage='parse_evtx_logins.py Security.evtx -n -i -x -m -w')
     parser.add_argument("evtx", type=str,
         help='Path to the Windows Security EVTX event log file')
     parser.add_argument("-n", "--NoHeader", default=False, action="store_true",
@@ -75,76 +113,38 @@ def main():
     parser.add_argument('-x','--Exclude', type = lambda s: re.split('[ ,;]', s), 
         help="strings in a comma separated word list ( -x 4624,4634)")
     parser.add_argument('-i', '--Include', type = lambda s: re.split('[ ,;]', s),
-        help="only strings in a comma separated word list ( -i 4672,-500,04:55:07)")
+        help="only strings in a comma separated word list ( -i 4672,-500,04:55:07), Column=string only searches that column ( -i TargetUserName=admin)")
     parser.add_argument('-m', '--Matchall', 
         type = lambda s: re.split('[ ,;]', s),
         help="all strings in a comma separated word list ( -m admin,,cmd.exe)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of the file in this many processes ( -w 8)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the rows as csv, jsonl or parquet (default %(default)s)")
+    parser.add_argument('--output', type=str,
+        help="write the rows to this file instead of stdout, parquet needs one ( --output rows.parquet)")
+    add_run_options(parser, 'Security.evtx', 'logins.json')
         
     args = parser.parse_args()
+    args.filter = RowFilter(event_info_names + event_data_names,
+                            args.Include, args.Exclude, args.Matchall)
+    check_run_options(parser, args)
 
-    excludes = (args.Exclude)
-    includes = (args.Include)
-    matches = (args.Matchall)
-
-    header = (','.join(map(str,event_info_names + event_data_names)))
-    if not args.NoHeader:
-        print(header)
-        
-    with open(args.evtx, 'r') as f:
-        with contextlib.closing(mmap.mmap(f.fileno(), 0,
-                                          access=mmap.ACCESS_READ)) as buf:
-            fh = FileHeader(buf, 0x0)
-            for xml, record in evtx_file_xml_view(fh):
-                soup = BeautifulSoup(xml, "lxml")
-                Date = soup.event.system.timecreated['systemtime']
-                Date = Date[:-7]
-                EventID = int(soup.event.system.eventid.string)
-                Computer = soup.event.system.computer.string               
-                if EventID in evtxs:
-                    event_info = "%s,%s,%s,%s," % (Date,EventID,evtxs[EventID],Computer)
-
-                    try:
-                        event_data = {}
-                        for child in soup.eventdata.children:
-                            if type(child) is element.Tag:
-                                event_data[child['name']] = ' '.join(child.text.split())
-                        event_data_result = []
-                        for value in event_data_names:
-                            result = event_data.get(value)
-                            if result is None:
-                                result = ''
-                            event_data_result.append(result)
-                    except:
-                        pass
-                        
-                    output = ((event_info) + ','.join(map(str,event_data_result)))
-                    
-                    if len(sys.argv) == 2:
-                        print(output)
-
-                    if args.NoHeader:
-                        if len(sys.argv) == 3:
-                            print(output)                   
-
-                    if args.Matchall:
-                        if all(match in output.casefold() for match in matches):
-                            if args.Exclude:
-                                if not any(exclude in output.casefold() for exclude in excludes):
-                                    print(output)
-                            else:
-                                print(output)
-                    elif args.Include:
-                        if any(include in output.casefold() for include in includes):
-                            if args.Exclude:
-                                if not any(exclude in output.casefold() for exclude in excludes):
-                                    print(output)
-                            else:
-                                print(output)
-                    elif args.Exclude:
-                        if not args.Include:
-                            if not args.Matchall:
-                                if not any(exclude in output.casefold() for exclude in excludes):
-                                    print(output)
+    try:
+        output = open_output(args.format, args.output, event_info_names + event_data_names,
+                             not args.NoHeader)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        for results in map_chunks(args.evtx, parse_chunks, args, args.workers,
+                                  event_ids=evtxs, flush=output.flush):
+            write_rows(args.stats, output.write, results)
+    finally:
+        timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+#! /usr/bin/env python3
+# Run the logins, processes and account_changes reports over one
+# Security.evtx in a single pass
+#
+# Each record is decoded once and handed to every selected report, each
+# report is written to its own CSV in the output directory
+# (logins.csv, processes.csv, account_changes.csv), or .jsonl / .parquet
+# files with --format. The rows are the same as running
+# parse_evtx_logins.py, parse_evtx_processes.py and
+# parse_evtx_account_changes.py one after the other.
+#
+# Requires Python-evtx https://github.com/williballenthin/python-evtx
+# and evtx_decoder.py from this repository
+# Event IDs can be added or removed by editing the "evtxs" variable of
+# each report script
+
+import os
+import re
+
+import argparse
+
+import parse_evtx_logins
+import parse_evtx_processes
+import parse_evtx_account_changes
+from evtx_decoder import evtx_chunk_events, map_chunks
+from evtx_output import open_output, formats
+from evtx_filter import RowFilter
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
+
+reports = {'logins': parse_evtx_logins,
+'processes': parse_evtx_processes,
+'account_changes': parse_evtx_account_changes
+}
+
+# Reports whose script takes -i/-x/-m
+filtered_reports = ('logins', 'processes')
+
+def report_event_ids(names):
+    """
+    The Event IDs the reports in names have a use for.
+    """
+    event_ids = set()
+    for name in names:
+        event_ids.update(reports[name].evtxs)
+    return event_ids
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    selected = [(name, reports[name]) for name in args.Reports]
+    event_ids = report_event_ids(args.Reports)
+
+    results = dict((name, []) for name in args.Reports)
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   event_ids, args):
+        for name, report in selected:
+            try:
+                fields = timed(args.stats, 'fields', report.event_fields, event)
+            except Exception as e:
+                record_error(args, event, e)
+                continue
+            if fields is None:
+                continue
+            if name in args.filters and \
+                    not timed(args.stats, 'filter', args.filters[name].selected, fields):
+                continue
+            results[name].append(tuple(map(str,fields)))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Extract the logins, processes and account changes reports "
+        "from one Security.evtx to CSV files in a single pass",
+        usage='parse_evtx_security.py Security.evtx -o out -r logins,processes -n -i -x -m -w')
+    parser.add_argument("evtx", type=str,
+        help='Path to the Windows Security EVTX event log file')
+    parser.add_argument("-o", "--OutputDir", type=str, default='.',
+        help="Directory for the report CSV files (default current directory)")
+    parser.add_argument('-r', '--Reports', type = lambda s: re.split('[ ,;]', s),
+        default=list(reports),
+        help="reports to write ( -r logins,processes,account_changes)")
+    parser.add_argument("-n", "--NoHeader", default=False, action="store_true",
+        help="Do not write Headers")
+    parser.add_argument('-x','--Exclude', type = lambda s: re.split('[ ,;]', s),
+        help="strings in a comma separated word list ( -x 4624,4634)")
+    parser.add_argument('-i', '--Include', type = lambda s: re.split('[ ,;]', s),
+        help="only strings in a comma separated word list ( -i 4672,-500,04:55:07), Column=string only searches that column ( -i TargetUserName=admin)")
+    parser.add_argument('-m', '--Matchall',
+        type = lambda s: re.split('[ ,;]', s),
+        help="all strings in a comma separated word list ( -m admin,,cmd.exe)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of the file in this many processes ( -w 8)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the reports as csv, jsonl or parquet files (default %(default)s)")
+    add_run_options(parser, 'Security.evtx', 'security.json')
+
+    args = parser.parse_args()
+    check_run_options(parser, args)
+
+    for name in args.Reports:
+        if name not in reports:
+            parser.error("unknown report %s (choose from %s)" %
+                         (name, ','.join(reports)))
+    os.makedirs(args.OutputDir, exist_ok=True)
+
+    args.filters = {}
+    for name in filtered_reports:
+        report = reports[name]
+        args.filters[name] = RowFilter(report.event_info_names + report.event_data_names,
+                                       args.Include, args.Exclude, args.Matchall)
+
+    outputs = {}
+    try:
+        for name in args.Reports:
+            report = reports[name]
+            try:
+                outputs[name] = open_output(args.format,
+                    os.path.join(args.OutputDir, name + '.' + args.format),
+                    report.event_info_names + report.event_data_names,
+                    not args.NoHeader)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+
+        def flush():
+            for output in outputs.values():
+                output.flush()
+
+        for results in map_chunks(args.evtx, parse_chunks, args, args.workers,
+                                  event_ids=report_event_ids(args.Reports),
+                                  flush=flush):
+            for name, rows in results.items():
+                write_rows(args.stats, outputs[name].write, rows)
+    finally:
+        for output in outputs.values():
+            timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,14 @@
 # Extract Common Windows Scheduled Tasks Events from
 # Microsoft-Windows-TaskScheduler4Operational.evtx to CSV
 # Requires Python-evtx https://github.com/williballenthin/python-evtx
-# and BeautifulSoup
-
-import mmap
-import contextlib
+# and evtx_decoder.py from this repository
 
 import argparse
-from bs4 import BeautifulSoup, element
 
-from Evtx.Evtx import FileHeader
-from Evtx.Views import evtx_file_xml_view
+from evtx_decoder import evtx_chunk_events, map_chunks
+from evtx_output import open_output, formats
+from evtx_options import add_run_options, check_run_options
+from evtx_stats import timed, write_rows, record_error
 
 evtx_ids = {102,106,110,140,141,142,145,200,201,202,319}
 header = 'Date,EventID,EventDataName,ProcessID,ThreadID,ActionName,'\
@@ -31,49 +29,78 @@ event_data_names = ('ActionName',
 'CurrentQuota',
 'ErrorDescription')
 
+def event_row(event):
+    """
+    The CSV column values of one decoded event, None for EventID 0.
+    """
+    Date = event['SystemTime']
+    Date = Date[:-7]
+    EventID = int(event['EventID'])
+    ProcessID = event['ProcessID']
+    ThreadID = event['ThreadID']
+    EventDataName = event['EventDataName']
+    if EventID:
+        event_info = [Date,
+            EventID,
+            EventDataName,
+            ProcessID,
+            ThreadID]
+
+        event_data = {}
+        for name, text in event['EventData']:
+            event_data[name] = ' '.join(text.split())
+        event_data_result = []
+        for value in event_data_names:
+            result = event_data.get(value)
+            if result is None:
+                result = ''
+            event_data_result.append(result)
+
+        return tuple(map(str,event_info + event_data_result))
+    return None
+
+def parse_chunks(evtx_file, first_chunk, last_chunk, args):
+    results = []
+    for event in evtx_chunk_events(evtx_file, first_chunk, last_chunk,
+                                   args=args):
+        try:
+            row = timed(args.stats, 'fields', event_row, event)
+        except Exception as e:
+            record_error(args, event, e)
+            continue
+        if row is not None:
+            results.append(row)
+    return results
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extract Common Windows Scheduled Tasks Events to CSV")
     parser.add_argument("WinEventLog", type=str,
         help="Path to Microsoft-Windows-TaskScheduler4Operational.evtx")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="parse chunks of the file in this many processes ( -w 8)")
+    parser.add_argument('--format', choices=formats, default='csv',
+        help="write the rows as csv, jsonl or parquet (default %(default)s)")
+    parser.add_argument('--output', type=str,
+        help="write the rows to this file instead of stdout, parquet needs one ( --output rows.parquet)")
+    add_run_options(parser, 'Microsoft-Windows-TaskScheduler%4Operational.evtx', 'tasks.json',
+                    event_ids=False)
     args = parser.parse_args()
-    with open(args.WinEventLog, 'r') as f:
-        print(header)
-        with contextlib.closing(mmap.mmap(f.fileno(), 0,
-                access=mmap.ACCESS_READ)) as buf:
-            fh = FileHeader(buf, 0x0)
-            for xml, record in evtx_file_xml_view(fh):
-                soup = BeautifulSoup(xml, "lxml")
-                Date = soup.event.system.timecreated['systemtime']
-                Date = Date[:-7]
-                EventID = int(soup.event.system.eventid.string)
-                ProcessID = soup.event.system.execution['processid']
-                ThreadID = soup.event.system.execution['threadid']
-                EventDataName = soup.eventdata['name']
-                Keywords = soup.event.system.keywords.string
-                if EventID:
-                    event_info = "%s,%s,%s,%s,%s," % \
-                        (Date,
-                        EventID,
-                        EventDataName,
-                        ProcessID,
-                        ThreadID)
- 
-                    try:
-                        event_data = {}
-                        for child in soup.eventdata.children:
-                            if type(child) is element.Tag:
-                                event_data[child['name']] = ' '.join(child.text.split())
-                        event_data_result = []
-                        for value in event_data_names:
-                            result = event_data.get(value)
-                            if result is None:
-                                result = ''
-                            event_data_result.append(result)
-                    except:
-                        pass
-                        
-                    print((event_info) + ','.join(map(str,event_data_result)))
+    check_run_options(parser, args)
+    try:
+        output = open_output(args.format, args.output, header.split(','))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        for results in map_chunks(args.WinEventLog, parse_chunks, args, args.workers,
+                                  flush=output.flush):
+            write_rows(args.stats, output.write, results)
+    finally:
+        timed(args.stats, 'output', output.close)
+    if args.profile:
+        args.profile.save()
+    if args.stats:
+        args.stats.report()
 
 if __name__ == "__main__":
     main()
@@ -1,57 +1,118 @@
-import json
 import csv
 import sys
+import gzip
+import json
 from collections import Counter
 import argparse
 
-def process_event(event):
-    system = event.get('System', {})
-    event_data = event.get('EventData', {})
-    system_attributes = system.get('TimeCreated', {}).get('#attributes', {})
-    system_execution_attributes = system.get('Execution', {}).get('#attributes', {})
-    provider_attributes = system.get('Provider', {}).get('#attributes', {})
-    security_attributes = system.get('Security', {}).get('#attributes', {})
+from evtx_stats import RunStats, RunProfile, timed, write_rows
+from jsonl_reader import read_jsonl
+
+# Key paths of the CSV columns in each record
+task_paths = (
+    ('Event', 'System', 'TimeCreated', '#attributes', 'SystemTime'),
+    ('Event', 'EventData', '#attributes', 'Name'),
+    ('Event', 'EventData', 'Path'),
+    ('Event', 'EventData', 'Priority'),
+    ('Event', 'EventData', 'ProcessID'),
+    ('Event', 'EventData', 'TaskName'),
+    ('Event', 'System', 'Channel'),
+    ('Event', 'System', 'Computer'),
+    ('Event', 'System', 'Correlation'),
+    ('Event', 'System', 'EventID'),
+    ('Event', 'System', 'EventRecordID'),
+    ('Event', 'System', 'Execution', '#attributes', 'ProcessID'),
+    ('Event', 'System', 'Execution', '#attributes', 'ThreadID'),
+    ('Event', 'System', 'Keywords'),
+    ('Event', 'System', 'Level'),
+    ('Event', 'System', 'Opcode'),
+    ('Event', 'System', 'Provider', '#attributes', 'Guid'),
+    ('Event', 'System', 'Provider', '#attributes', 'Name'),
+    ('Event', 'System', 'Security', '#attributes', 'UserID'),
+    ('Event', 'System', 'Task'),
+    ('Event', 'System', 'Version'),
+)
+
+summary_paths = (
+    ('Event', 'EventData', '#attributes', 'Name'),
+    ('Event', 'EventData', 'TaskName'),
+    ('Event', 'EventData', 'Path'),
+    ('Event', 'System', 'Computer'),
+    ('Event', 'System', 'Level'),
+    ('Event', 'System', 'Provider', '#attributes', 'Name'),
+    ('Event', 'System', 'Security', '#attributes', 'UserID'),
+)
+
+summary_headers = [
+    'Event',
+    'TaskName',
+    'Path',
+    'Computer',
+    'Level',
+    'Provider_Name',
+    'Security_UserID',
+]
+
+# First line of a saved summary file
+summary_format = {'format': 'parse_jsonl_tasks summary', 'version': 1,
+                  'columns': summary_headers}
+
+def summary_key(result):
+    """
+    The counter key of a tuple of summary values, values that are JSON
+    objects or arrays are kept as the text the CSV shows for them.
+    """
+    if all(value is None or isinstance(value, (str, int, float)) for value in result):
+        return result
+    return tuple(value if value is None or isinstance(value, (str, int, float))
+                 else str(value) for value in result)
+
+def save_summary(counter, path):
+    """
+    Write counter to path as gzipped JSON lines of [count, value, ...].
+    """
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(summary_format) + '\n')
+        for key, count in counter.items():
+            f.write(json.dumps([count] + list(key)) + '\n')
+
+def load_summary(path, counter):
+    """
+    Add the counts of the summary file at path to counter.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != summary_format['format']:
+            raise ValueError('%s is not a summary saved by parse_jsonl_tasks.py' % path)
+        if header.get('columns') != summary_headers:
+            raise ValueError('%s has other columns %s' % (path, header.get('columns')))
+        for line in f:
+            row = json.loads(line)
+            counter[tuple(row[1:])] += row[0]
+    return counter
 
-    if not args.summarize:
-        return (
-            system_attributes.get('SystemTime'),
-            event_data.get('#attributes', {}).get('Name'),
-            event_data.get('Path'),
-            event_data.get('Priority'),
-            event_data.get('ProcessID'),
-            event_data.get('TaskName'),
-            system.get('Channel'),
-            system.get('Computer'),
-            system.get('Correlation'),
-            system.get('EventID'),
-            system.get('EventRecordID'),
-            system_execution_attributes.get('ProcessID'),
-            system_execution_attributes.get('ThreadID'),
-            system.get('Keywords'),
-            system.get('Level'),
-            system.get('Opcode'),
-            provider_attributes.get('Guid'),
-            provider_attributes.get('Name'),
-            security_attributes.get('UserID'),
-            system.get('Task'),
-            system.get('Version'),
-        )
-    else:
-        return (
-            event_data.get('#attributes', {}).get('Name'),
-            event_data.get('TaskName'),
-            event_data.get('Path'),
-            system.get('Computer'),
-            system.get('Level'),
-            provider_attributes.get('Name'),
-            security_attributes.get('UserID'),
-        )
-    
 # Set up command line arguments
 parser = argparse.ArgumentParser()
 parser.add_argument('-s', '--summarize', action='store_true', help='Stack and summarize similar tasks')
-parser.add_argument('filename', help='Convert JSONL to CSV Microsoft-Windows-TaskScheduler/Operational.evtx.jsonl')
+parser.add_argument('-o', '--save', help='Write the summary to this file for --merge instead of printing it (implies -s)')
+parser.add_argument('-m', '--merge', nargs='+', metavar='SUMMARY', help='Combine summaries saved with --save instead of reading a JSONL file')
+parser.add_argument('filename', nargs='?', help='Convert JSONL to CSV Microsoft-Windows-TaskScheduler/Operational.evtx.jsonl')
+parser.add_argument('--stats', default=False, action='store_true',
+    help='write the time of each stage and the records seen, matched, skipped and errored to stderr')
+parser.add_argument('--stats-file', type=str,
+    help='write the --stats report to this JSON file instead ( --stats-file run.json)')
+parser.add_argument('--profile', type=str,
+    help='dump a cProfile of the run to this file, see python -m pstats ( --profile run.prof)')
 args = parser.parse_args()
+if args.save or args.merge:
+    args.summarize = True
+if args.merge and args.filename:
+    parser.error('give either a JSONL file or --merge')
+if not args.merge and not args.filename:
+    parser.error('the JSONL file is required')
+stats = RunStats(args.stats_file) if args.stats or args.stats_file else None
+if args.profile:
+    args.profile = RunProfile(args.profile)
 
 # Initialize counter
 counter = Counter()
@@ -85,28 +146,32 @@ if not args.summarize:
     ]
     writer.writerow(headers)
 
-# Read JSONL data
-with open(args.filename) as jsonl_file:
-    for line in jsonl_file:
-        data = json.loads(line)
-        event = data.get('Event', {})
-        result = process_event(event)
-        if result is not None:
-            if args.summarize:
-                counter.update([str(result)])
-            else:
-                writer.writerow(result)
+if args.merge:
+    for path in args.merge:
+        try:
+            timed(stats, 'read', load_summary, path, counter)
+        except (OSError, ValueError) as e:
+            parser.error('%s: %s' % (path, e))
+else:
+    # Read JSONL data, only the fields of the CSV columns
+    paths = summary_paths if args.summarize else task_paths
+    for result in read_jsonl(args.filename, paths, stats=stats):
+        if args.summarize:
+            counter[summary_key(result)] += 1
+        elif stats is None:
+            writer.writerow(result)
+        else:
+            write_rows(stats, writer.writerow, (result,))
 
-if args.summarize:
-    headers = ['Count'] + [
-        'Event',
-        'TaskName',
-        'Path',
-        'Computer',
-        'Level',
-        'Provider_Name',
-        'Security_UserID',
-    ]
+if args.save:
+    timed(stats, 'output', save_summary, counter, args.save)
+elif args.summarize:
+    headers = ['Count'] + summary_headers
     writer.writerow(headers)
-    for entry, count in counter.most_common():
-        writer.writerow([count] + list(eval(entry)))
+    write_rows(stats, writer.writerow,
+               [[count] + list(entry) for entry, count in counter.most_common()])
+
+if args.profile:
+    args.profile.save()
+if stats:
+    stats.report()
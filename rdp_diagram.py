@@ -0,0 +1,244 @@
+#! /usr/bin/env python3
+# Graph the RDP connections in parse_evtx_RDP.py output
+#
+# Python version of RDP_Diagram.sh. The CSV is read once, a line at a
+# time, and each "User/Host -> Computer" edge is counted in a dictionary
+# with the first and last time it was seen, so combined CSVs of millions
+# of rows take no more memory than their distinct edges. The nodes are the
+# ones RDP_Diagram.sh draws: "User: <user>\nIP/Host: <address>" pointing
+# at "Logon or Reconnect/Disconnect\nComputer:\n<computer>".
+#
+# -s takes the comma separated search terms of RDP_Diagram.sh (a row is
+# kept when it holds any of them), --since/--until keep the rows of a
+# time window. The graph is written as DOT, GraphML or JSON, chosen by -t
+# or the output file extension; .png, .svg and .pdf files are rendered
+# from the DOT with graphviz like RDP_Diagram.sh does.
+#     rdp_diagram.py -f RDP-combined.csv -o rdp-logins.png
+#     rdp_diagram.py -f RDP-combined.csv -o rdp.graphml -s admin,192.168.23.14
+#     rdp_diagram.py -f RDP-combined.csv -o rdp.json --since "2023-01-12 23:" --until "2023-01-13 09"
+#
+# Requires graphviz (dot) for image output only
+# Event IDs drawn can be changed with -e or by editing "graph_IDs"
+
+import os
+import csv
+import sys
+import json
+import shutil
+import subprocess
+from xml.sax.saxutils import escape
+
+import argparse
+
+# The EventIDs RDP_Diagram.sh draws, LocalSessionManager logon, shell
+# start, disconnect and reconnect
+graph_IDs = ('21', '22', '24', '25')
+
+# Target node label of graph_IDs, the Description column for other IDs
+session_label = 'Logon or Reconnect/Disconnect'
+
+# Columns of parse_evtx_RDP.py rows
+DATE, CHANNEL, RECORD_ID, COMPUTER, EVENT_ID, DESCRIPTION, DOMAIN, USER, \
+    ADDRESS, SESSION, DIRECTION = range(11)
+
+# Output formats by file extension, image formats are rendered from DOT
+formats = {'.dot': 'dot', '.gv': 'dot', '.graphml': 'graphml', '.json': 'json'}
+image_formats = ('.png', '.svg', '.pdf')
+
+class Edge(object):
+    __slots__ = ('count', 'first', 'last', 'events')
+
+    def __init__(self, date):
+        self.count = 0
+        self.first = date
+        self.last = date
+        self.events = {}
+
+def read_edges(lines, event_ids=graph_IDs, search=None, since=None, until=None):
+    """
+    Count the edges of parse_evtx_RDP.py rows in lines.
+    Returns {(user, address, label, computer): Edge}.
+    search is a list of strings a row must hold one of, since and until
+    the first and last times (or time prefixes like "2023-01-13 09") of
+    the rows kept.
+    """
+    edges = {}
+    for line in lines:
+        line = line.rstrip('\r\n')
+        # Cut like awk -F',', rows with a quoted value go through csv
+        if '"' in line:
+            fields = next(csv.reader([line]))
+        else:
+            fields = line.split(',')
+        if len(fields) <= ADDRESS or fields[EVENT_ID] not in event_ids:
+            continue
+        # RDP_Diagram.sh matches ",21,R" for graph_IDs, other IDs drawn
+        # with -e are kept whatever their Description
+        if fields[EVENT_ID] in graph_IDs and \
+                not fields[DESCRIPTION].startswith('R'):
+            continue
+        if search and not any(term in line for term in search):
+            continue
+        date = fields[DATE]
+        if since is not None and date < since:
+            continue
+        if until is not None and date[:len(until)] > until:
+            continue
+        if fields[EVENT_ID] in graph_IDs:
+            label = session_label
+        else:
+            label = fields[DESCRIPTION]
+        key = (fields[USER], fields[ADDRESS], label, fields[COMPUTER])
+        edge = edges.get(key)
+        if edge is None:
+            edge = edges[key] = Edge(date)
+        edge.count += 1
+        if date < edge.first:
+            edge.first = date
+        if date > edge.last:
+            edge.last = date
+        edge.events[fields[EVENT_ID]] = edge.events.get(fields[EVENT_ID], 0) + 1
+    return edges
+
+def graph_nodes(edges):
+    """
+    Number the nodes of edges, returns ({(kind, key): id}, edge list) where
+    the edge list holds (source id, target id, key, Edge).
+    """
+    nodes = {}
+    edge_list = []
+    for key, edge in edges.items():
+        user, address, label, computer = key
+        source = nodes.setdefault(('source', (user, address)), len(nodes))
+        target = nodes.setdefault(('target', (label, computer)), len(nodes))
+        edge_list.append((source, target, key, edge))
+    return nodes, edge_list
+
+def node_label(kind, key):
+    if kind == 'source':
+        return 'User: %s\nIP/Host: %s' % key
+    return '%s\nComputer:\n%s' % key
+
+def edge_label(edge):
+    if edge.first == edge.last:
+        return '%d\n%s' % (edge.count, edge.first)
+    return '%d\n%s -\n%s' % (edge.count, edge.first, edge.last)
+
+def dot_string(text):
+    return '"%s"' % text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def write_dot(edges, out):
+    nodes, edge_list = graph_nodes(edges)
+    # Header of RDP_Diagram.sh
+    out.write('strict digraph rdp{\n'
+              'fontname="Helvetica,Arial,sans-serif"\n'
+              'node [fontname="Helvetica,Arial,sans-serif"]\n'
+              'edge [fontname="Helvetica,Arial,sans-serif"]\n'
+              'node [shape=box];\n'
+              'node [color = "blue"]\n'
+              'rankdir=LR\n')
+    for (kind, key), node in nodes.items():
+        out.write('n%d [label=%s]\n' % (node, dot_string(node_label(kind, key))))
+    for source, target, key, edge in edge_list:
+        out.write('n%d -> n%d [label=%s]\n' % (source, target, dot_string(edge_label(edge))))
+    out.write('}\n')
+
+def write_graphml(edges, out):
+    nodes, edge_list = graph_nodes(edges)
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+              '<key id="label" for="node" attr.name="label" attr.type="string"/>\n'
+              '<key id="kind" for="node" attr.name="kind" attr.type="string"/>\n'
+              '<key id="count" for="edge" attr.name="count" attr.type="int"/>\n'
+              '<key id="first" for="edge" attr.name="first" attr.type="string"/>\n'
+              '<key id="last" for="edge" attr.name="last" attr.type="string"/>\n'
+              '<key id="events" for="edge" attr.name="events" attr.type="string"/>\n'
+              '<graph id="rdp" edgedefault="directed">\n')
+    for (kind, key), node in nodes.items():
+        out.write('<node id="n%d"><data key="label">%s</data>'
+                  '<data key="kind">%s</data></node>\n'
+                  % (node, escape(node_label(kind, key)), kind))
+    for i, (source, target, key, edge) in enumerate(edge_list):
+        events = ';'.join('%s:%d' % item for item in sorted(edge.events.items()))
+        out.write('<edge id="e%d" source="n%d" target="n%d">'
+                  '<data key="count">%d</data><data key="first">%s</data>'
+                  '<data key="last">%s</data><data key="events">%s</data></edge>\n'
+                  % (i, source, target, edge.count, escape(edge.first),
+                     escape(edge.last), escape(events)))
+    out.write('</graph>\n</graphml>\n')
+
+def write_json(edges, out):
+    json.dump({'edges': [{'user': user, 'address': address, 'target': label,
+                          'computer': computer, 'count': edge.count,
+                          'first': edge.first, 'last': edge.last,
+                          'events': edge.events}
+                         for (user, address, label, computer), edge in edges.items()]},
+              out, indent=1)
+    out.write('\n')
+
+writers = {'dot': write_dot, 'graphml': write_graphml, 'json': write_json}
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        "Graph the RDP connections in parse_evtx_RDP.py output, "
+        "with the count and first and last time of each connection",
+        usage='rdp_diagram.py -f RDP-combined.csv -o rdp.png -s admin,192.168.23.14 --since "2023-01-12 23:"')
+    parser.add_argument('-f', '--file', required=True,
+        help="output file of parse_evtx_RDP.py, - for standard input")
+    parser.add_argument('-o', '--output', default='rdp.png',
+        help="graph file (default %(default)s), - for DOT on standard output")
+    parser.add_argument('-t', '--type', choices=sorted(writers),
+        help="graph format (default from the --output extension)")
+    parser.add_argument('-s', '--search',
+        help="comma separated list of search terms, rows holding any of them are drawn")
+    parser.add_argument('--since',
+        help='draw rows from this time on ("2023-01-12" or "2023-01-12 23:00")')
+    parser.add_argument('--until',
+        help='draw rows up to this time, a prefix takes in all of it ("2023-01-13 09")')
+    parser.add_argument('-e', '--events', default=','.join(graph_IDs),
+        help="comma separated EventIDs drawn (default %(default)s)")
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.output)[1].lower()
+    render = None
+    if args.type:
+        graph_type = args.type
+    elif args.output == '-':
+        graph_type = 'dot'
+    elif extension in image_formats:
+        graph_type = 'dot'
+        render = extension[1:]
+        if shutil.which('dot') is None:
+            parser.error("graphviz dot is needed for %s output, use a .dot, .graphml or .json file" % extension)
+    elif extension in formats:
+        graph_type = formats[extension]
+    else:
+        parser.error("give -t or an --output ending in %s"
+                     % ', '.join(list(formats) + list(image_formats)))
+
+    search = [term for term in args.search.split(',') if term] if args.search else None
+    event_ids = tuple(args.events.split(','))
+    if args.file == '-':
+        edges = read_edges(sys.stdin, event_ids, search, args.since, args.until)
+    else:
+        with open(args.file, encoding='utf-8', errors='replace') as f:
+            edges = read_edges(f, event_ids, search, args.since, args.until)
+    if not edges:
+        sys.exit("no RDP connections found in %s" % args.file)
+
+    if args.output == '-':
+        writers[graph_type](edges, sys.stdout)
+    elif render:
+        process = subprocess.Popen(['dot', '-T' + render, '-o', args.output],
+                                   stdin=subprocess.PIPE, text=True)
+        writers[graph_type](edges, process.stdin)
+        process.stdin.close()
+        if process.wait() == 0:
+            print(args.output + " created")
+    else:
+        with open(args.output, 'w') as out:
+            writers[graph_type](edges, out)
+        print(args.output + " created")
+
+if __name__ == "__main__":
+    main()
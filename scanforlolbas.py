@@ -1,31 +1,333 @@
 from pandas import *
 import argparse
+import collections
+import contextlib
+import mmap
+import multiprocessing
 import os
+import re
 import string
+import sys
 
-def parse_file(fp,lollist):
+# Length of the end of each pattern searched for before a text is scanned
+ANCHOR_LENGTH = 4
+
+# Bytes of a file searched at a time with --recursive
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Bytes looked at either side of a match for the line holding it
+CONTEXT = 4096
+
+# Line break and bytes per character of each encoding searched
+encodings = {'ascii': (b'\n', 1), 'utf-16le': (b'\n\x00', 2)}
+
+# Characters of the text kept around a match in binary data
+printable = frozenset(b'\t' + bytes(range(0x20, 0x7f)))
+
+class Automaton(object):
+    """
+    Aho-Corasick automaton of patterns (all str or all bytes), finds the
+    occurrences of every pattern in one pass over a text.
+    Texts without the last ANCHOR_LENGTH characters of any pattern (the
+    .exe of most lolbas names) are passed over by one regular expression
+    search, the scan starts just before the first one found.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.lengths = [len(pattern) for pattern in self.patterns]
+        self.longest = max(self.lengths, default=0)
+        # The same length for all, so one cannot start another
+        self.anchor_length = min([ANCHOR_LENGTH] + self.lengths)
+        anchors = set(pattern[-self.anchor_length:] for pattern in self.patterns)
+        bar = b'|' if anchors and isinstance(min(anchors), bytes) else '|'
+        self.anchor = re.compile(bar.join(map(re.escape, sorted(anchors))))
+        goto = [{}]
+        self.out = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for symbol in pattern:
+                if symbol not in goto[state]:
+                    goto[state][symbol] = len(goto)
+                    goto.append({})
+                    self.out.append([])
+                state = goto[state][symbol]
+            self.out[state].append(index)
+
+        # Breadth first, a state's failure state is done before it, its
+        # transitions are those of the failure state plus its own
+        fail = [0] * len(goto)
+        self.delta = [None] * len(goto)
+        self.delta[0] = goto[0]
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self.delta[state] = dict(self.delta[fail[state]])
+            self.delta[state].update(goto[state])
+            self.out[state] = self.out[state] + self.out[fail[state]]
+            for symbol, child in goto[state].items():
+                fail[child] = self.delta[fail[state]].get(symbol, 0)
+                queue.append(child)
+
+    def first_starts(self, text):
+        """
+        Returns {pattern index: start of its first occurrence in text}.
+        """
+        firsts = {}
+        if not self.patterns:
+            return firsts
+        anchor = self.anchor.search(text)
+        if anchor is None:
+            return firsts
+        # No occurrence starts further back than the longest pattern
+        offset = max(anchor.start() - self.longest, 0)
+        delta = self.delta
+        out = self.out
+        state = 0
+        for i, symbol in enumerate(text[offset:], offset):
+            state = delta[state].get(symbol, 0)
+            if out[state]:
+                for index in out[state]:
+                    if index not in firsts:
+                        firsts[index] = i + 1 - self.lengths[index]
+        return firsts
+
+    def ending_at(self, text, end):
+        """
+        The indexes of the patterns with an occurrence ending at end.
+        """
+        delta = self.delta
+        state = 0
+        for symbol in text[max(end - self.longest, 0):end]:
+            state = delta[state].get(symbol, 0)
+        return self.out[state]
+
+    def occurrences(self, text, after=0):
+        """
+        Generate (start, pattern index) of the occurrences in text ending
+        after position after, found at each anchor instead of walking
+        the whole text.
+        """
+        pos = max(after - self.anchor_length + 1, 0)
+        while True:
+            anchor = self.anchor.search(text, pos)
+            if anchor is None:
+                return
+            pos = anchor.start() + 1
+            for index in self.ending_at(text, anchor.end()):
+                yield anchor.end() - self.lengths[index], index
+
+class LolbasMatcher(object):
+    """
+    The lolbas filenames compiled into one automaton, matching lines the
+    way the per filename loop did.
+    """
+    def __init__(self, lollist):
+        self.lollist = [y.lower() for y in lollist]
+        unique = list(dict.fromkeys(self.lollist))
+        self.automaton = Automaton(unique)
+        # The lollist positions of each pattern, a filename listed twice
+        # (in a different case) is printed twice
+        self.positions = [[] for y in unique]
+        for position, y in enumerate(self.lollist):
+            self.positions[unique.index(y)].append(position)
+
+    def matches(self, x):
+        """
+        The filenames found in the lowercase line x, in lollist order.
+        Only the first occurrence of a filename counts and it is rejected
+        when a letter is right before it (unless it starts the line or
+        is one character in).
+        """
+        ALPHA = string.ascii_letters
+        found = []
+        for index, start in self.automaton.first_starts(x).items():
+            left = x[:start]
+            if not (left[1:]).endswith(tuple(ALPHA)):
+                found.extend(self.positions[index])
+        return [self.lollist[position] for position in sorted(found)]
+
+class RawMatcher(LolbasMatcher):
+    """
+    The lolbas filenames as lowercase ASCII and UTF-16LE bytes in one
+    automaton, for searching the raw contents of any file.
+    """
+    def __init__(self, lollist):
+        LolbasMatcher.__init__(self, lollist)
+        patterns = []
+        self.keys = []
+        for index, y in enumerate(self.automaton.patterns):
+            patterns.append(y.encode('utf-8'))
+            self.keys.append((index, 'ascii'))
+            patterns.append(y.encode('utf-16-le').lower())
+            self.keys.append((index, 'utf-16le'))
+        self.raw = Automaton(patterns)
+
+    def occurrences(self, buf):
+        """
+        Generate (start, filename index, encoding) of the occurrences in
+        buf (bytes or an mmap), lowercasing BLOCK_SIZE bytes at a time.
+        """
+        for block_start in range(0, len(buf), BLOCK_SIZE):
+            # Back far enough for a match that ends in this block
+            first = max(block_start - self.raw.longest, 0)
+            block = buf[first:block_start + BLOCK_SIZE].lower()
+            for start, index in self.raw.occurrences(block, block_start - first):
+                yield (first + start,) + self.keys[index]
+
+def line_of(buf, start, encoding):
+    """
+    Returns (begin, end, known) of the line of buf holding the match at
+    start, cut CONTEXT bytes either side of it, known is False when it
+    was cut before its real beginning.
+    """
+    newline, width = encodings[encoding]
+    begin = buf.rfind(newline, max(start - CONTEXT, 0), start)
+    if begin != -1:
+        begin += len(newline)
+        known = True
+    else:
+        begin = max(start - CONTEXT, 0)
+        known = begin == 0
+    end = buf.find(newline, start, start + CONTEXT)
+    if end == -1:
+        end = min(start + CONTEXT, len(buf))
+    # A misplaced UTF-16 line break, keep to the characters of the match
+    begin += (start - begin) % width
+    end -= (end - begin) % width
+    return begin, end, known
+
+def text_of(buf, begin, end, start, encoding):
+    """
+    The text of the line begin:end holding the match at start, only the
+    run of printable ASCII around the match (what strings would show)
+    when the line is not text.
+    """
+    width = encodings[encoding][1]
+    raw = buf[begin:end]
+    try:
+        x = raw.decode(encoding.replace('ascii', 'utf-8'))
+        if x.replace('\t', ' ').replace('\r', ' ').isprintable():
+            return x
+    except UnicodeDecodeError:
+        pass
+    units = raw[0::width]
+    high = raw[1::width] if width > 1 else bytes(len(units))
+    first = last = (start - begin) // width
+    while first > 0 and units[first - 1] in printable and not high[first - 1]:
+        first -= 1
+    while last < len(units) and units[last] in printable and not high[last]:
+        last += 1
+    return units[first:last].decode('ascii')
+
+def scan_buffer(buf, fn, matcher):
+    """
+    The output rows of the lolbas filenames found in buf, the same rule
+    as parse_file for each line of each encoding, in the order of the
+    lines.
+    """
+    firsts = {}
+    for start, index, encoding in sorted(matcher.occurrences(buf)):
+        begin, end, known = line_of(buf, start, encoding)
+        # Only the first occurrence in a line counts
+        if (index, encoding, begin) not in firsts:
+            firsts[(index, encoding, begin)] = (start, end, known)
+
+    ALPHA = string.ascii_letters.encode()
+    found = []
+    for (index, encoding, begin), (start, end, known) in firsts.items():
+        width = encodings[encoding][1]
+        if not known or start - begin > width:
+            before = buf[start - width:start]
+            if before[0] in ALPHA and not any(before[1:]):
+                continue
+        for position in matcher.positions[index]:
+            found.append((begin, position, encoding, start, end))
+
+    rows = []
+    for begin, position, encoding, start, end in sorted(found):
+        x = text_of(buf, begin, end, start, encoding).lower()
+        x = x.rstrip()
+        x = x.replace(',',';')
+        list = (','.join([matcher.lollist[position], fn, x, encoding, str(start)]))
+        rows.append(" ".join(list.split()))
+    return rows
+
+def scan_file(fp, fn, matcher):
+    """
+    The output rows of the file at fp (named fn in them) searched as raw
+    bytes through a memory map.
+    """
+    try:
+        with open(fp, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                                              access=mmap.ACCESS_READ)) as buf:
+                return scan_buffer(buf, fn, matcher)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('%s: %s\n' % (fp, e))
+        return []
+
+def walk_files(input_path):
+    """
+    Generate (path, name relative to input_path) of every file under
+    input_path, in sorted order.
+    """
+    if os.path.isfile(input_path):
+        yield input_path, os.path.basename(input_path)
+        return
+    for dirpath, dirnames, filenames in os.walk(input_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            fp = os.path.join(dirpath, filename)
+            if os.path.isfile(fp) and not os.path.islink(fp):
+                yield fp, os.path.relpath(fp, input_path)
+
+_matcher = None
+
+def _init_worker(matcher):
+    global _matcher
+    _matcher = matcher
+
+def _scan_task(paths):
+    return scan_file(paths[0], paths[1], _matcher)
+
+def scan_recursive(input_path, lollist, workers):
+    """
+    Print the rows of every file under input_path, files are shared out
+    to workers processes and printed in walk order as they finish.
+    """
+    matcher = RawMatcher(lollist)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (matcher,))
+        results = pool.imap(_scan_task, walk_files(input_path))
+    else:
+        pool = None
+        results = (scan_file(fp, fn, matcher) for fp, fn in walk_files(input_path))
+    try:
+        for rows in results:
+            for row in rows:
+                print(row)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def parse_file(fp,matcher):
     try:
         fn =os.path.basename(fp)
         with open(fp, "r") as f:
             file_data = f.readlines()
         for x in file_data:
             x = x.lower()
-            for y in lollist:
-                y = y.lower()
-                if y in x:
-                    left,sep,right = x.partition(y)
-                    ALPHA = string.ascii_letters
-                    x = x.rstrip()
-                    x = x.replace(',',';')
-                    list = []
-                    if not (left[1:]).endswith(tuple(ALPHA)):
-                        list.append(y)
-                        list.append(fn)
-                        list.append(x)
-                    if list:
-                        list = (','.join(list))
-                        list = (" ".join(list.split()))
-                        print(list)
+            found = matcher.matches(x)
+            if not found:
+                continue
+            x = x.rstrip()
+            x = x.replace(',',';')
+            for y in found:
+                list = (','.join([y, fn, x]))
+                list = (" ".join(list.split()))
+                print(list)
     except UnicodeDecodeError:
         pass # non-text data
 
@@ -34,6 +336,9 @@ def main():
     parser = argparse.ArgumentParser(description='Search text files for lolbas strings. https://lolbas-project.github.io/api/lolbas.csv')
     parser.add_argument("-p", "--path", help = "Path to input file or directory to scan", required=True)
     parser.add_argument("-l", "--lolbascsv", help = "Path to lolbas.csv", required=True)
+    parser.add_argument("-w", "--wdac", help = "Also search for the filenames in this list, one per line (wdac-bypass.txt)")
+    parser.add_argument("-r", "--recursive", action = "store_true", help = "Search every file under the path as raw ASCII and UTF-16LE bytes, binaries included, rows get the encoding and byte offset added")
+    parser.add_argument("--workers", type = int, default = os.cpu_count(), help = "Files searched at once with --recursive (default %(default)s)")
 
     args = parser.parse_args()
     input_path = args.path
@@ -44,21 +349,32 @@ def main():
     lolbas_file = read_csv(lolbas_path)
     lollist = []
     filenames = lolbas_file['Filename'].tolist()
+    if args.wdac:
+        with open(args.wdac) as f:
+            filenames += [line.strip() for line in f if line.strip()]
     for f in filenames:
         if f not in lollist:
             lollist.append(f)
 
+    if args.recursive:
+        if not os.path.exists(input_path):
+            print("invalid path!!")
+            return
+        scan_recursive(input_path, lollist, args.workers)
+        return
+    matcher = LolbasMatcher(lollist)
+
     #Enumerate and verify files in directory path, then send to parser
     if (os.path.isdir(input_path)):
         for dir_item in os.listdir(input_path):
             fp = os.path.join(input_path, dir_item)
             if os.path.isfile(fp):
-                parse_file(fp,lollist)
+                parse_file(fp,matcher)
 
     #Enumerate and verify file in input string, then send to parser
     elif os.path.isfile(input_path):
         fp = input_path
-        parse_file(fp,lollist)
+        parse_file(fp,matcher)
     else:
         print("invalid path!!")
 